@@ -0,0 +1,187 @@
+from scipy import sparse
+import pandas as pd
+import numpy as np
+
+
+class AccountGraph:
+    """Sparse (CSR) graph of the money flows between accounts of the cleaned PaySim data."""
+
+    def __init__(self, df: pd.DataFrame, account_ids: pd.Index = None):
+        """Build the adjacency matrices of the transactions
+
+        Args:
+            df (pd.DataFrame): The cleaned transaction data (string account IDs, or codes of a compact df)
+            account_ids (pd.Index, optional): The account ID lookup table of a compact df. Defaults to None (df holds string account IDs).
+        """
+
+        # encode initiators and targets into one code space
+        if account_ids is None:
+            codes, account_ids = pd.factorize(
+                np.concatenate(
+                    [df["initiator_id"].to_numpy(), df["target_id"].to_numpy()]
+                )
+            )
+            self.source = codes[: df.shape[0]].astype(np.int32)
+            self.target = codes[df.shape[0] :].astype(np.int32)
+        else:
+            self.source = df["initiator_id"].to_numpy(np.int32)
+            self.target = df["target_id"].to_numpy(np.int32)
+        self.account_ids = pd.Index(account_ids, name="account_id")
+
+        # per transaction arrays for the time based queries
+        self.hour = df["hour"].to_numpy(np.int32)
+        self.amount = df["amount"].to_numpy(np.float64)
+        self.type = df["type"].to_numpy()
+
+        # number of accounts
+        n = self.account_ids.shape[0]
+        # amount sent from row account to column account (duplicate edges are summed)
+        self.outgoing = sparse.csr_matrix(
+            (self.amount, (self.source, self.target)), shape=(n, n)
+        )
+        self.outgoing.sum_duplicates()
+        # amount received by row account from column account
+        self.incoming = self.outgoing.T.tocsr()
+
+        # number of transactions per edge
+        self.outgoing_count = sparse.csr_matrix(
+            (np.ones(self.source.shape[0], np.int32), (self.source, self.target)),
+            shape=(n, n),
+        )
+        self.outgoing_count.sum_duplicates()
+
+    def codes(self, accounts: list) -> np.ndarray:
+        """Look up the codes of account IDs
+
+        Args:
+            accounts (list): Account IDs
+
+        Returns:
+            np.ndarray: Their codes in the graph (-1 for unknown accounts)
+        """
+
+        return self.account_ids.get_indexer(accounts)
+
+    def fan_stats(self) -> pd.DataFrame:
+        """Fan-in and fan-out of every account
+
+        Returns:
+            pd.DataFrame: The number of distinct senders/receivers, transactions and amount in/out per account
+        """
+
+        return pd.DataFrame(
+            {
+                # distinct counterparties are the stored entries per CSR row
+                "fan_in": np.diff(self.incoming.indptr),
+                "fan_out": np.diff(self.outgoing.indptr),
+                "transactions_in": np.bincount(
+                    self.target, minlength=self.account_ids.shape[0]
+                ),
+                "transactions_out": np.bincount(
+                    self.source, minlength=self.account_ids.shape[0]
+                ),
+                "amount_in": np.asarray(self.incoming.sum(axis=1)).ravel(),
+                "amount_out": np.asarray(self.outgoing.sum(axis=1)).ravel(),
+            },
+            index=self.account_ids,
+        )
+
+    def reachable(
+        self, accounts: list, hops: int, direction: str = "out"
+    ) -> pd.DataFrame:
+        """Accounts reachable from (or reaching) the given accounts within a number of hops
+
+        Args:
+            accounts (list): The starting account IDs
+            hops (int): The maximum number of hops
+            direction (str, optional): "out" follows money sent, "in" follows money received. Defaults to "out".
+
+        Returns:
+            pd.DataFrame: The reachable account IDs and their distance in hops
+        """
+
+        # assert that the direction is supported
+        assert direction in ("out", "in")
+
+        # row t of the matrix holds the accounts one hop before t
+        adjacency = self.incoming if direction == "out" else self.outgoing
+
+        # hops from the starting accounts (-1 for unreached accounts)
+        distance = np.full(self.account_ids.shape[0], -1, np.int32)
+        codes = self.codes(accounts)
+        distance[codes[codes >= 0]] = 0
+
+        # expand the frontier one hop at a time with a sparse matrix-vector product
+        frontier = (distance == 0).astype(np.float64)
+        for hop in range(1, hops + 1):
+            reached = (adjacency @ frontier > 0) & (distance < 0)
+            if not reached.any():
+                break
+            distance[reached] = hop
+            frontier = reached.astype(np.float64)
+
+        # return the reached accounts
+        reached_codes = np.flatnonzero(distance > 0)
+        return pd.DataFrame(
+            {
+                "account_id": self.account_ids.take(reached_codes),
+                "hops": distance[reached_codes],
+            }
+        ).sort_values(["hops", "account_id"], ignore_index=True)
+
+    def receive_then_cash_out(
+        self,
+        within_hours: int,
+        receive_types: list = ["TRANSFER"],
+        cash_out_types: list = ["CASH_OUT"],
+    ) -> pd.DataFrame:
+        """Accounts that cash out within a number of hours of receiving money
+
+        Every receipt is paired with the first cash out of the receiving account in the
+        same hour or up to within_hours later.
+
+        Args:
+            within_hours (int): The maximum number of hours between receiving and cashing out
+            receive_types (list, optional): Transaction types that count as receiving. Defaults to ["TRANSFER"].
+            cash_out_types (list, optional): Transaction types that count as cashing out. Defaults to ["CASH_OUT"].
+
+        Returns:
+            pd.DataFrame: Account ID, hours and amounts of every receipt followed by a cash out
+        """
+
+        # receipts (by the target) and cash outs (by the initiator)
+        received = np.flatnonzero(np.isin(self.type, receive_types))
+        cashed_out = np.flatnonzero(np.isin(self.type, cash_out_types))
+
+        # composite (account, hour) keys that sort by account and then by hour
+        stride = np.int64(self.hour.max()) + within_hours + 1
+        receive_keys = (
+            self.target[received].astype(np.int64) * stride + self.hour[received]
+        )
+        cash_out_keys = (
+            self.source[cashed_out].astype(np.int64) * stride + self.hour[cashed_out]
+        )
+
+        # first cash out at or after every receipt
+        order = np.argsort(cash_out_keys, kind="stable")
+        position = np.searchsorted(cash_out_keys[order], receive_keys, side="left")
+        found = position < order.shape[0]
+        match = np.full(received.shape[0], -1, np.int64)
+        match[found] = order[position[found]]
+
+        # keep it when it is by the same account within the window
+        valid = found.copy()
+        valid[found] = cash_out_keys[match[found]] <= receive_keys[found] + within_hours
+        receipt = received[valid]
+        cash_out = cashed_out[match[valid]]
+
+        # return the receipt and cash out pairs
+        return pd.DataFrame(
+            {
+                "account_id": self.account_ids.take(self.target[receipt]),
+                "receive_hour": self.hour[receipt],
+                "received_amount": self.amount[receipt],
+                "cash_out_hour": self.hour[cash_out],
+                "cashed_out_amount": self.amount[cash_out],
+            }
+        )
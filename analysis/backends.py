@@ -0,0 +1,408 @@
+import pandas as pd
+
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator
+from functools import partial
+from pathlib import Path
+import sqlite3
+import operator
+
+from analysis.cube import build_cube, cube_from_cells, pivot_table_from_cube
+from analysis.filter_data import hourly_partials, hourly_stats_from_partials
+from data_prep.clean import COLUMN_ORDER, MONEY_COLUMNS
+from data_prep.compact import expand_account_ids
+
+# where the filtered transactions and tables are written (as by analysis.filter_data)
+OUTPUT_DIR = "./data/output"
+# the table holding the cleaned transactions (see load_data/setup_and_import.sql)
+TABLE = "transactions"
+# the number of rows fetched from the database at a time when streaming a selection
+FETCH_SIZE = 50000
+# the comparisons a filter may use (in SQL and pandas)
+OPERATORS = {
+    "=": operator.eq,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class Backend(ABC):
+    """The aggregations of analysis.filter_data and analysis.fraud_detection over some storage
+
+    A backend only groups and filters (hourly_partials, cube, count and select) where the
+    data lives; the small aggregates are reduced to the final tables by the shared pandas
+    reducers, so every backend returns the same results.
+    """
+
+    @abstractmethod
+    def hourly_partials(
+        self, start_hour: int, end_hour: int, bucket_size: int = 1
+    ) -> pd.DataFrame:
+        """Aggregate the transactions per (hour bucket, type) (see filter_data.hourly_partials)"""
+
+    @abstractmethod
+    def cube(self) -> pd.DataFrame:
+        """Aggregate the transactions into the amount cube (see analysis.cube)"""
+
+    @abstractmethod
+    def count(self, column: str, comparison: str, value: float) -> int:
+        """Count the transactions where `column comparison value`"""
+
+    @abstractmethod
+    def select(
+        self, column: str, comparison: str, value: float, chunksize: int = FETCH_SIZE
+    ) -> Iterator[pd.DataFrame]:
+        """Yield the transactions where `column comparison value` in chunks of rows"""
+
+    def transactional_data_per_hour(
+        self,
+        start_hour: int,
+        end_hour: int,
+        bucket_size: int = 1,
+        output_dir: Path = OUTPUT_DIR,
+    ) -> pd.DataFrame:
+        """Average the amount of money that is transacted per hour
+
+        Args:
+            start_hour (int): The first hour to account for
+            end_hour (int): The last hour to account for
+            bucket_size (int, optional): The number of hours per bucket (ex. 1, 6, 24). Defaults to 1.
+            output_dir (Path, optional): Where the table is written. Defaults to OUTPUT_DIR.
+
+        Returns:
+            pd.DataFrame: The hourly transactional volumne
+        """
+
+        # assert that the start and end hours are within the range provided in the dataset
+        assert start_hour >= 1 and start_hour <= end_hour
+        assert end_hour <= 743
+        # assert that the bucket size is a positive number of hours
+        assert bucket_size >= 1
+
+        # reduce the pushed down partials to the hourly statistics
+        transactional_data_df = hourly_stats_from_partials(
+            self.hourly_partials(start_hour, end_hour, bucket_size)
+        )
+        transactional_data_df.to_csv(
+            Path(output_dir) / "transactional_data_per_hour.csv", index=False
+        )
+
+        return transactional_data_df
+
+    def transactions_over_amount(
+        self, column: str, amount: float, output_dir: Path = OUTPUT_DIR
+    ) -> int:
+        """Write every transaction over a certain amount (streamed, never held in memory at once)
+
+        Args:
+            column (str): The target column
+            amount (float): The maximum amount in a single transfer
+            output_dir (Path, optional): Where the transactions are written. Defaults to OUTPUT_DIR.
+
+        Returns:
+            int: The number of transactions over the amount
+        """
+
+        return self._write_selection(
+            column, ">=", amount, Path(output_dir) / f"transactions_over_{amount}.csv"
+        )
+
+    def zero_amount_transactions(self, output_dir: Path = OUTPUT_DIR) -> int:
+        """Write the transactions where the amount is 0
+
+        Args:
+            output_dir (Path, optional): Where the transactions are written. Defaults to OUTPUT_DIR.
+
+        Returns:
+            int: The number of transactions where the amount is 0
+        """
+
+        return self._write_selection(
+            "amount", "=", 0, Path(output_dir) / "transactions_with_0_amount.csv"
+        )
+
+    def pivot_table(self, output_dir: Path = OUTPUT_DIR) -> pd.DataFrame:
+        """Create the pivot table of the sum and std of "amount" and "is_fraud" per type
+
+        Args:
+            output_dir (Path, optional): Where the pivot table is written. Defaults to OUTPUT_DIR.
+
+        Returns:
+            pd.DataFrame: The pivot table (with an "All" row)
+        """
+
+        # roll the pivot table up from the pushed down cube
+        pivot_table = pivot_table_from_cube(self.cube())
+        pivot_table.to_csv(Path(output_dir) / "pivot_table.csv", index="type")
+
+        return pivot_table
+
+    def _write_selection(
+        self, column: str, comparison: str, value: float, path: Path
+    ) -> int:
+        """Append the selected transactions to a CSV file chunk by chunk
+
+        Args:
+            column (str): The filtered column
+            comparison (str): One of OPERATORS
+            value (float): The value compared against
+            path (Path): The CSV file (overwritten)
+
+        Returns:
+            int: The number of rows written
+        """
+
+        rows = 0
+        # the header is written even when nothing is selected
+        pd.DataFrame(columns=COLUMN_ORDER).to_csv(path, index=False)
+        for chunk in self.select(column, comparison, value):
+            chunk.to_csv(path, mode="a", header=False, index=False)
+            rows += chunk.shape[0]
+
+        return rows
+
+
+class PandasBackend(Backend):
+    """Runs the aggregations on an in-memory (default or compact) DataFrame"""
+
+    def __init__(self, df: pd.DataFrame, account_ids: pd.Index = None) -> None:
+        """
+        Args:
+            df (pd.DataFrame): The cleaned transaction data
+            account_ids (pd.Index, optional): The account ID lookup table of a compact df. Defaults to None.
+        """
+
+        self.df = df
+        self.account_ids = account_ids
+
+    def hourly_partials(
+        self, start_hour: int, end_hour: int, bucket_size: int = 1
+    ) -> pd.DataFrame:
+        return hourly_partials(self.df, start_hour, end_hour, bucket_size)
+
+    def cube(self) -> pd.DataFrame:
+        return build_cube(self.df)
+
+    def count(self, column: str, comparison: str, value: float) -> int:
+        return int(self._mask(column, comparison, value).sum())
+
+    def select(
+        self, column: str, comparison: str, value: float, chunksize: int = FETCH_SIZE
+    ) -> Iterator[pd.DataFrame]:
+        selected = self.df[self._mask(column, comparison, value)]
+        for start in range(0, selected.shape[0], chunksize):
+            chunk = selected.iloc[start : start + chunksize]
+            # the original account IDs of a compact df
+            yield (
+                chunk
+                if self.account_ids is None
+                else expand_account_ids(chunk, self.account_ids)
+            )
+
+    def _mask(self, column: str, comparison: str, value: float) -> pd.Series:
+        """The rows where `column comparison value`"""
+
+        _check_filter(column, comparison)
+        return OPERATORS[comparison](self.df[column], value)
+
+
+class SqlBackend(Backend):
+    """Pushes the aggregations down to MySQL (or a SQLite stand-in) as GROUP BY / WHERE queries
+
+    Only the aggregates are fetched. Selections are streamed with fetchmany, so the rows
+    stay on the server until they are read (MySQL cursors are unbuffered by default).
+    """
+
+    def __init__(
+        self, connect: Callable, table: str = TABLE, fetch_size: int = FETCH_SIZE
+    ) -> None:
+        """
+        Args:
+            connect (Callable): Opens a new connection (ex. mysql_connect or lambda: sqlite_connect(path))
+            table (str, optional): The table holding the cleaned transactions. Defaults to TABLE.
+            fetch_size (int, optional): The number of rows fetched at a time. Defaults to FETCH_SIZE.
+        """
+
+        self.connect = connect
+        self.table = table
+        self.fetch_size = fetch_size
+
+    def hourly_partials(
+        self, start_hour: int, end_hour: int, bucket_size: int = 1
+    ) -> pd.DataFrame:
+        # the first hour of the bucket of every row (MOD of a non-negative offset, the same in
+        # MySQL and SQLite)
+        partials = self._query(
+            f"""
+            SELECT hour - MOD(hour - {{p}}, {{p}}) AS bucket, type,
+                   COUNT(*), SUM(amount), SUM(is_fraud)
+            FROM {self.table}
+            WHERE hour >= {{p}} AND hour <= {{p}}
+            GROUP BY bucket, type
+            ORDER BY bucket, type
+            """,
+            (start_hour, bucket_size, start_hour, end_hour),
+            [
+                "hour",
+                "type",
+                "number_of_transactions",
+                "volume",
+                "number_of_fradulent_transactions",
+            ],
+        )
+        return partials.astype(
+            {
+                "hour": "int64",
+                "type": str,
+                "number_of_transactions": "int64",
+                "volume": "float64",
+                "number_of_fradulent_transactions": "int64",
+            }
+        )
+
+    def cube(self) -> pd.DataFrame:
+        # the day dimension and dtypes are added client side
+        return cube_from_cells(
+            self._query(
+                f"""
+                SELECT hour, type, is_fraud,
+                       COUNT(*), SUM(amount), SUM(amount * amount)
+                FROM {self.table}
+                GROUP BY hour, type, is_fraud
+                ORDER BY hour, type, is_fraud
+                """,
+                (),
+                ["hour", "type", "is_fraud", "count", "amount_sum", "amount_sumsq"],
+            )
+        )
+
+    def count(self, column: str, comparison: str, value: float) -> int:
+        _check_filter(column, comparison)
+        return int(
+            self._query(
+                f"SELECT COUNT(*) FROM {self.table} WHERE {column} {comparison} {{p}}",
+                (value,),
+                ["count"],
+            )["count"].iloc[0]
+        )
+
+    def select(
+        self, column: str, comparison: str, value: float, chunksize: int = None
+    ) -> Iterator[pd.DataFrame]:
+        _check_filter(column, comparison)
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                self._format(
+                    f"SELECT {', '.join(COLUMN_ORDER)} FROM {self.table} "
+                    f"WHERE {column} {comparison} {{p}} ORDER BY hour, id",
+                    conn,
+                ),
+                (value,),
+            )
+            # fetch the rows a chunk at a time (the cursor is exhausted before closing)
+            while rows := cursor.fetchmany(chunksize or self.fetch_size):
+                yield _money_as_float(pd.DataFrame(rows, columns=COLUMN_ORDER))
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _query(self, sql: str, params: tuple, columns: list) -> pd.DataFrame:
+        """Run a query on a new connection and fetch its (small) result
+
+        Args:
+            sql (str): The query, with {p} for every placeholder
+            params (tuple): The parameters of the placeholders
+            columns (list): The names of the result columns
+
+        Returns:
+            pd.DataFrame: The result
+        """
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self._format(sql, conn), params)
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return pd.DataFrame(rows, columns=columns)
+
+    @staticmethod
+    def _format(sql: str, conn) -> str:
+        """Fill in the placeholder style of the connection
+
+        Args:
+            sql (str): The query, with {p} for every placeholder
+            conn: The MySQL or SQLite connection
+
+        Returns:
+            str: The query with "?" (SQLite) or "%s" (MySQL) placeholders
+        """
+
+        return sql.format(p="?" if isinstance(conn, sqlite3.Connection) else "%s")
+
+
+def select_backend(data) -> Backend:
+    """Pick the backend of the data for one call
+
+    In-memory frames are aggregated by pandas; data in a database is aggregated where it
+    lives and only the result is fetched.
+
+    Args:
+        data: A Backend, a DataFrame, a compact (DataFrame, account IDs) pair, a function opening a database connection or the path of a SQLite database
+
+    Returns:
+        Backend: The backend of the data
+    """
+
+    if isinstance(data, Backend):
+        return data
+    if isinstance(data, pd.DataFrame):
+        return PandasBackend(data)
+    if isinstance(data, tuple):
+        return PandasBackend(*data)
+    if callable(data):
+        return SqlBackend(data)
+    if isinstance(data, (str, Path)) and Path(data).suffix in (".db", ".sqlite"):
+        # the loader module pulls in the MySQL driver
+        from load_data.to_mysql_table import sqlite_connect
+
+        return SqlBackend(partial(sqlite_connect, data))
+
+    raise TypeError(f"No backend for {type(data).__name__}")
+
+
+def _check_filter(column: str, comparison: str) -> None:
+    """Only known columns and comparisons reach a query (they cannot be parameters)
+
+    Args:
+        column (str): The filtered column
+        comparison (str): The comparison
+
+    Raises:
+        ValueError: If the column or the comparison is unknown
+    """
+
+    if column not in COLUMN_ORDER:
+        raise ValueError(f"Unknown column {column!r}")
+    if comparison not in OPERATORS:
+        raise ValueError(f"Unknown comparison {comparison!r}")
+
+
+def _money_as_float(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the DECIMAL money columns fetched from MySQL to floats
+
+    Args:
+        df (pd.DataFrame): Rows fetched from the transactions table
+
+    Returns:
+        pd.DataFrame: The rows with float money columns
+    """
+
+    return df.astype({column: "float64" for column in MONEY_COLUMNS})
@@ -0,0 +1,219 @@
+from pyarrow import feather
+import pandas as pd
+
+from pathlib import Path
+import os
+
+# where the materialized cube is stored
+CUBE_PATH = "./data/cube/amount_cube.feather"
+# where the cube is exported for Tableau
+TABLEAU_PATH = "./data/output/tableau/amount_cube.csv"
+# the dimensions of the cube (day is derived from hour)
+DIMENSIONS = ["hour", "day", "type", "is_fraud"]
+# the additive measures of every cell
+MEASURES = ["count", "amount_sum", "amount_sumsq"]
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate the transactions into a type x hour x day x is_fraud cube in one grouped pass
+
+    Every cell stores the count, sum and sum of squares of "amount". These are additive,
+    so any roll-up or slice (and the mean and std derived from it) comes from the cube
+    without rescanning the transactions.
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data (default or compact dtypes)
+
+    Returns:
+        pd.DataFrame: One row per non-empty cell with its dimensions and measures
+    """
+
+    # aggregate every (hour, type, is_fraud) cell
+    cells = (
+        df.assign(amount_sq=df["amount"] ** 2)
+        .groupby(["hour", "type", "is_fraud"], observed=True, sort=True)
+        .agg(
+            count=("amount", "size"),
+            amount_sum=("amount", "sum"),
+            amount_sumsq=("amount_sq", "sum"),
+        )
+        .reset_index()
+    )
+
+    return cube_from_cells(cells)
+
+
+def cube_from_cells(cells: pd.DataFrame) -> pd.DataFrame:
+    """Complete aggregated (hour, type, is_fraud) cells into a cube (ex. cells aggregated in SQL)
+
+    Args:
+        cells (pd.DataFrame): The hour, type, is_fraud and MEASURES of every non-empty cell
+
+    Returns:
+        pd.DataFrame: The cube with the day dimension and plain dtypes
+    """
+
+    # the day of every hour (hours 1-24 are day 1)
+    cube = cells.copy()
+    cube.insert(1, "day", (cube["hour"].astype("int64") - 1) // 24 + 1)
+
+    # plain dtypes so cubes of default and compact frames (and SQL) merge and export alike
+    return cube.astype(
+        {
+            "hour": "int64",
+            "type": str,
+            "is_fraud": "int64",
+            "count": "int64",
+            "amount_sum": "float64",
+            "amount_sumsq": "float64",
+        }
+    )
+
+
+def merge_cubes(cubes: list) -> pd.DataFrame:
+    """Combine cubes of different transactions (ex. a stored cube and the cube of new hours)
+
+    Args:
+        cubes (list): The cubes to merge
+
+    Returns:
+        pd.DataFrame: One row per cell with the summed measures
+    """
+
+    return (
+        pd.concat(cubes, ignore_index=True)
+        .groupby(DIMENSIONS, sort=True)[MEASURES]
+        .sum()
+        .reset_index()
+    )
+
+
+def rollup(cube: pd.DataFrame, by: list = (), where: dict = None) -> pd.DataFrame:
+    """Roll the cube up to some of its dimensions, optionally on a slice of it
+
+    ex. rollup(cube, ["day", "type"], where={"is_fraud": 1})
+
+    Args:
+        cube (pd.DataFrame): The output of build_cube (or merge_cubes)
+        by (list, optional): The dimensions to keep. Defaults to () (one grand total).
+        where (dict, optional): The values to keep per dimension (a value or a list of values). Defaults to None.
+
+    Returns:
+        pd.DataFrame: The count, sum, mean and std of "amount" and the fraud count and rate per group
+    """
+
+    # slice the cube
+    cells = cube
+    for dimension, values in (where or {}).items():
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        cells = cells[cells[dimension].isin(values)]
+
+    # fraudulent transactions are counted in the cells where is_fraud == 1
+    cells = cells.assign(fraud_count=cells["count"] * cells["is_fraud"])
+    measures = MEASURES + ["fraud_count"]
+
+    # add up the measures per group
+    if by:
+        totals = cells.groupby(list(by), sort=True)[measures].sum()
+    else:
+        totals = cells[measures].sum().to_frame("All").T.astype(cells[measures].dtypes)
+
+    # derive the mean, std and fraud rate from the additive measures
+    count = totals["count"]
+    variance = (totals["amount_sumsq"] - totals["amount_sum"] ** 2 / count) / (
+        count - 1
+    )
+    return pd.DataFrame(
+        {
+            "count": count,
+            "amount_sum": totals["amount_sum"],
+            "amount_mean": totals["amount_sum"] / count,
+            # clip the rounding error of the sums of squares around 0
+            "amount_std": variance.clip(lower=0) ** 0.5,
+            "fraud_count": totals["fraud_count"],
+            "fraud_rate": totals["fraud_count"] / count,
+        }
+    ).reset_index(drop=not by)
+
+
+def pivot_table_from_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """Roll the cube up to the pivot table of create_pivot_table
+
+    Args:
+        cube (pd.DataFrame): The output of build_cube (or merge_cubes)
+
+    Returns:
+        pd.DataFrame: The sum and standard deviation of "amount" and "is_fraud" per type and in total
+    """
+
+    # per type and in total
+    merged = pd.concat(
+        [
+            rollup(cube, ["type"]).set_index("type"),
+            rollup(cube).set_index(pd.Index(["All"])),
+        ]
+    )
+
+    # number of transactions and frauds (sum of "is_fraud" equals the sum of its squares)
+    count = merged["count"]
+    frauds = merged["fraud_count"]
+
+    # build the pivot table in the layout of DataFrame.pivot_table
+    pivot_table = pd.DataFrame(
+        {
+            ("sum", "amount"): merged["amount_sum"],
+            ("sum", "is_fraud"): frauds.astype("int64"),
+            ("std", "amount"): merged["amount_std"],
+            ("std", "is_fraud"): ((frauds - frauds**2 / count) / (count - 1)) ** 0.5,
+        }
+    )
+    pivot_table.index.name = "type"
+
+    # return the pivot table
+    return pivot_table
+
+
+def save_cube(cube: pd.DataFrame, cube_path: Path = CUBE_PATH) -> None:
+    """Atomically store the cube
+
+    Args:
+        cube (pd.DataFrame): The cube
+        cube_path (Path, optional): Where the cube is stored. Defaults to CUBE_PATH.
+    """
+
+    # write to a temporary file and move it into place
+    Path(cube_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(cube_path).with_suffix(".tmp")
+    feather.write_feather(cube, tmp_path)
+    os.replace(tmp_path, cube_path)
+
+
+def load_cube(cube_path: Path = CUBE_PATH) -> pd.DataFrame:
+    """Load the stored cube
+
+    Args:
+        cube_path (Path, optional): Where the cube is stored. Defaults to CUBE_PATH.
+
+    Returns:
+        pd.DataFrame: The cube
+    """
+
+    return feather.read_feather(cube_path)
+
+
+def export_cube_for_tableau(
+    cube: pd.DataFrame, output_path: Path = TABLEAU_PATH
+) -> None:
+    """Write the cube as a flat CSV data source for Tableau
+
+    The additive measures are exported so Tableau can roll them up to any level:
+    mean = SUM([amount_sum]) / SUM([count]) and
+    std = SQRT((SUM([amount_sumsq]) - SUM([amount_sum])^2 / SUM([count])) / (SUM([count]) - 1)).
+
+    Args:
+        cube (pd.DataFrame): The cube
+        output_path (Path, optional): Where the CSV file is written. Defaults to TABLEAU_PATH.
+    """
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    cube.to_csv(output_path, index=False)
@@ -0,0 +1,252 @@
+from sklearn.metrics import average_precision_score
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import ParameterGrid
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tempfile
+import shutil
+import time
+import os
+
+from analysis.features import account_feature_columns, add_account_features
+from data_prep.compact import TRANSACTION_TYPES
+
+# where the shared feature matrix of an evaluation is written (removed afterwards)
+FEATURE_DIR = "./data/cache/features"
+# where the per-fold results are written
+EVALUATION_PATH = "./data/output/fraud_model_folds.csv"
+# the hyperparameters swept by default
+PARAM_GRID = {"n_estimators": [15, 50], "max_depth": [None, 12]}
+# the number of test folds (the first block of hours is only ever trained on)
+N_FOLDS = 5
+# the columns that are not model features
+NON_FEATURE_COLUMNS = ["initiator_id", "target_id", "is_fraud", "type"]
+
+
+def feature_columns(df: pd.DataFrame) -> list:
+    """The model features of cleaned transactions (the columns of model_features)
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data
+
+    Returns:
+        list: The numeric columns followed by the one-hot "type" columns
+    """
+
+    numeric = [column for column in df.columns if column not in NON_FEATURE_COLUMNS]
+    return numeric + [
+        f"type_{transaction_type}" for transaction_type in TRANSACTION_TYPES
+    ]
+
+
+def write_feature_matrix(df: pd.DataFrame, directory: Path) -> dict:
+    """Write the features, labels and hours as .npy files that workers memory map
+
+    The float32 feature matrix is filled one column at a time (the one-hot "type"
+    columns straight from the category codes), so no dense copy of the frame is made.
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data (default or compact dtypes)
+        directory (Path): Where the arrays are written
+
+    Returns:
+        dict: The paths of the "features", "labels" and "hours" arrays and the feature "columns"
+    """
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    columns = feature_columns(df)
+    paths = {
+        "features": str(directory / "features.npy"),
+        "labels": str(directory / "labels.npy"),
+        "hours": str(directory / "hours.npy"),
+    }
+
+    # fill the feature matrix column by column
+    features = np.lib.format.open_memmap(
+        paths["features"],
+        mode="w+",
+        dtype=np.float32,
+        shape=(df.shape[0], len(columns)),
+    )
+    type_codes = pd.Categorical(df["type"], categories=TRANSACTION_TYPES).codes
+    for position, column in enumerate(columns):
+        if column.startswith("type_"):
+            features[:, position] = type_codes == TRANSACTION_TYPES.index(column[5:])
+        else:
+            features[:, position] = df[column].to_numpy()
+    features.flush()
+    del features
+
+    # the labels and the hour of every row (to select the rows of a fold)
+    np.save(paths["labels"], df["is_fraud"].to_numpy().astype(np.int8))
+    np.save(paths["hours"], df["hour"].to_numpy().astype(np.int32))
+
+    return {**paths, "columns": columns}
+
+
+def time_folds(hours: np.ndarray, n_folds: int = N_FOLDS, window: int = None) -> list:
+    """Split the hours into time-ordered folds that never train on the future
+
+    The distinct hours are cut into n_folds + 1 consecutive blocks. Fold k tests on
+    block k and trains on the blocks before it (all of them, or the last window).
+
+    Args:
+        hours (np.ndarray): The hour of every transaction
+        n_folds (int, optional): The number of folds. Defaults to N_FOLDS.
+        window (int, optional): The number of blocks trained on (rolling window). Defaults to None (every earlier block).
+
+    Returns:
+        list: The first and last train and test hour of every fold
+    """
+
+    # assert that every fold trains and tests on at least one hour
+    blocks = np.array_split(np.unique(hours), n_folds + 1)
+    assert all(block.shape[0] > 0 for block in blocks), "Fewer hours than folds"
+
+    folds = []
+    for k in range(1, n_folds + 1):
+        train_blocks = blocks[max(0, k - window) if window else 0 : k]
+        folds.append(
+            {
+                "fold": k,
+                "train_start": int(train_blocks[0][0]),
+                "train_end": int(train_blocks[-1][-1]),
+                "test_start": int(blocks[k][0]),
+                "test_end": int(blocks[k][-1]),
+            }
+        )
+
+    return folds
+
+
+def cross_validate_fraud_model(
+    df: pd.DataFrame,
+    param_grid: dict = PARAM_GRID,
+    n_folds: int = N_FOLDS,
+    window: int = None,
+    workers: int = None,
+    feature_dir: Path = FEATURE_DIR,
+    output_path: Path = EVALUATION_PATH,
+    account_features: bool = True,
+) -> pd.DataFrame:
+    """Evaluate the Random Forest (RF) fraud model on time-ordered folds for every hyperparameter set
+
+    The feature matrix is written once as a float32 .npy file and memory mapped by the
+    workers (instead of pickling the data to every process). Every (fold, parameters)
+    pair trains in its own process.
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data
+        param_grid (dict, optional): The values of every RandomForestClassifier parameter to sweep. Defaults to PARAM_GRID.
+        n_folds (int, optional): The number of folds. Defaults to N_FOLDS.
+        window (int, optional): The number of blocks of hours trained on (see time_folds). Defaults to None (expanding window).
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        feature_dir (Path, optional): Where the shared feature matrix is written. Defaults to FEATURE_DIR.
+        output_path (Path, optional): Where the per-fold results are written. Defaults to EVALUATION_PATH.
+        account_features (bool, optional): Include the per-account velocity and balance error features (added when missing). Defaults to True.
+
+    Returns:
+        pd.DataFrame: The hours, rows, average precision and training time of every fold and parameter set
+    """
+
+    # add the per-account features (or drop them)
+    if account_features and not set(account_feature_columns()) <= set(df.columns):
+        df = add_account_features(df)
+    elif not account_features:
+        df = df.drop(account_feature_columns(), axis=1, errors="ignore")
+
+    # write the shared arrays to a private directory
+    Path(feature_dir).mkdir(parents=True, exist_ok=True)
+    directory = Path(tempfile.mkdtemp(prefix="evaluation-", dir=feature_dir))
+    try:
+        arrays = write_feature_matrix(df, directory)
+        folds = time_folds(df["hour"].to_numpy(), n_folds, window)
+        tasks = [
+            (fold, params) for params in ParameterGrid(param_grid) for fold in folds
+        ]
+
+        # train every fold and parameter set in its own process
+        with ProcessPoolExecutor(
+            max_workers=min(workers or os.cpu_count(), len(tasks))
+        ) as pool:
+            futures = [
+                pool.submit(_evaluate_fold, arrays, fold, params)
+                for fold, params in tasks
+            ]
+            results = pd.DataFrame([future.result() for future in futures])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # write the per-fold results
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(output_path, index=False)
+
+    # print the per-fold results and the summary of every parameter set
+    print(results.to_string(index=False))
+    print(
+        results.groupby("params", sort=False)
+        .agg(
+            mean_average_precision=("average_precision", "mean"),
+            std_average_precision=("average_precision", "std"),
+            mean_train_seconds=("train_seconds", "mean"),
+        )
+        .sort_values("mean_average_precision", ascending=False)
+        .to_string()
+    )
+
+    return results
+
+
+def _evaluate_fold(arrays: dict, fold: dict, params: dict) -> dict:
+    """Train and score one fold with one parameter set (runs in a worker)
+
+    Args:
+        arrays (dict): The output of write_feature_matrix
+        fold (dict): The hours of the fold (see time_folds)
+        params (dict): The RandomForestClassifier parameters
+
+    Returns:
+        dict: The fold, parameters, rows, average precision and training time
+    """
+
+    # memory map the shared arrays
+    features = np.load(arrays["features"], mmap_mode="r")
+    labels = np.load(arrays["labels"], mmap_mode="r")
+    hours = np.load(arrays["hours"], mmap_mode="r")
+
+    # the rows of the train and test hours
+    train = np.flatnonzero(
+        (hours >= fold["train_start"]) & (hours <= fold["train_end"])
+    )
+    test = np.flatnonzero((hours >= fold["test_start"]) & (hours <= fold["test_end"]))
+
+    # train on the earlier hours (the processes are the parallelism, not the trees)
+    clf = RandomForestClassifier(**params, n_jobs=1, random_state=121)
+    start = time.perf_counter()
+    clf.fit(features[train], labels[train])
+    train_seconds = time.perf_counter() - start
+
+    # score the later hours (a fold without frauds on either side has no average precision)
+    y_test = labels[test]
+    classes = list(clf.classes_)
+    if 1 in classes and y_test.any():
+        probabilities = clf.predict_proba(features[test])[:, classes.index(1)]
+        average_precision = round(
+            average_precision_score(y_test, probabilities) * 100, 2
+        )
+    else:
+        average_precision = np.nan
+
+    return {
+        **fold,
+        "params": str(params),
+        "train_rows": train.shape[0],
+        "test_rows": test.shape[0],
+        "test_frauds": int(y_test.sum()),
+        "average_precision": average_precision,
+        "train_seconds": round(train_seconds, 3),
+    }
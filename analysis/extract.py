@@ -0,0 +1,216 @@
+from pyarrow import parquet
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from pathlib import Path
+
+from data_prep.compact import expand_account_ids
+
+# where the extracted subsets are written
+OUTPUT_DIR = "./data/output"
+
+
+def amount_at_least(amount: float, column: str = "amount") -> Callable:
+    """Predicate: the column is at least amount (ex. transactions of 200,000 or more)"""
+    return lambda df: df[column].to_numpy() >= amount
+
+
+def amount_equals(amount: float, column: str = "amount") -> Callable:
+    """Predicate: the column equals amount (ex. zero amount transactions)"""
+    return lambda df: df[column].to_numpy() == amount
+
+
+def hour_in(hours: list) -> Callable:
+    """Predicate: the transaction happened in one of the hours"""
+    return lambda df: np.isin(df["hour"].to_numpy(), list(hours))
+
+
+def type_in(types: list) -> Callable:
+    """Predicate: the transaction is of one of the types"""
+    return lambda df: df["type"].isin(list(types)).to_numpy()
+
+
+class Extractor:
+    """Evaluates many named predicates in a single pass and writes every subset to its own file."""
+
+    def __init__(
+        self,
+        output_dir: Path = OUTPUT_DIR,
+        file_format: str = "csv",
+        compression: str = None,
+        workers: int = None,
+    ):
+        """Configure the outputs
+
+        Args:
+            output_dir (Path, optional): Where the subsets are written. Defaults to OUTPUT_DIR.
+            file_format (str, optional): "csv" or "parquet" (columnar). Defaults to "csv".
+            compression (str, optional): ex. "gzip" for CSV or "zstd"/"snappy" for parquet. Defaults to None (parquet's default).
+            workers (int, optional): The number of threads writing subsets at once. Defaults to one per predicate.
+        """
+
+        # assert that the file format is supported
+        assert file_format in ("csv", "parquet")
+
+        self.output_dir = Path(output_dir)
+        self.file_format = file_format
+        self.compression = compression
+        self.workers = workers
+        # the predicate and output file of every registered name
+        self.predicates = {}
+
+    def register(self, name: str, predicate: Callable, file_name: str = None):
+        """Register a named predicate
+
+        ex. extractor.register("transactions_with_0_amount", amount_equals(0))
+
+        Args:
+            name (str): The name of the subset
+            predicate (Callable): Takes a DataFrame and returns a boolean mask of its rows
+            file_name (str, optional): The output file. Defaults to the name with the extension of the format.
+
+        Returns:
+            Extractor: self, so registrations can be chained
+        """
+
+        # the output file of the subset
+        if file_name is None:
+            extension = "csv" if self.file_format == "csv" else "parquet"
+            if self.file_format == "csv" and self.compression == "gzip":
+                extension += ".gz"
+            file_name = f"{name}.{extension}"
+
+        self.predicates[name] = (predicate, self.output_dir / file_name)
+        return self
+
+    def run(
+        self,
+        data: pd.DataFrame | Iterable[pd.DataFrame] | Path,
+        account_ids: pd.Index = None,
+        chunksize: int = 1000000,
+    ) -> dict:
+        """Evaluate every predicate in one pass over the data and write the subsets
+
+        The data is scanned once (chunk by chunk when it is an iterable of chunks or a CSV
+        file). Every subset is written by a worker thread while the next chunk is scanned.
+
+        Args:
+            data (pd.DataFrame | Iterable[pd.DataFrame] | Path): The cleaned data, its chunks or the cleaned CSV file
+            account_ids (pd.Index, optional): The account ID lookup table of compact data, used to write the original account IDs. Defaults to None.
+            chunksize (int, optional): The number of rows read at a time from a CSV file. Defaults to 1000000.
+
+        Returns:
+            dict: The number of rows written per name
+        """
+
+        # one chunk, or a lazy reader of chunks
+        if isinstance(data, pd.DataFrame):
+            chunks = [data]
+        elif isinstance(data, (str, Path)):
+            chunks = pd.read_csv(data, encoding="utf-8", chunksize=chunksize)
+        else:
+            chunks = data
+
+        # one writer per subset
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        writers = {
+            name: _SubsetWriter(path, self.file_format, self.compression)
+            for name, (_, path) in self.predicates.items()
+        }
+        rows = {name: 0 for name in self.predicates}
+        # the last write of every subset (writes of a subset stay in chunk order)
+        pending = {}
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers or max(len(self.predicates), 1)
+        ) as pool:
+            for chunk in chunks:
+                for name, (predicate, _) in self.predicates.items():
+                    # evaluate the predicate on the chunk
+                    subset = chunk[predicate(chunk)]
+                    rows[name] += subset.shape[0]
+                    if account_ids is not None:
+                        subset = expand_account_ids(subset, account_ids)
+
+                    # write the subset once its previous write finished
+                    if name in pending:
+                        pending[name].result()
+                    pending[name] = pool.submit(writers[name].write, subset)
+
+            # wait for the last writes and close the files
+            for future in pending.values():
+                future.result()
+        for writer in writers.values():
+            writer.close()
+
+        # close the CSV reader
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+        return rows
+
+
+class _SubsetWriter:
+    """Appends the chunks of one subset to a CSV or parquet file."""
+
+    def __init__(self, path: Path, file_format: str, compression: str):
+        """Prepare the output file
+
+        Args:
+            path (Path): The output file
+            file_format (str): "csv" or "parquet"
+            compression (str): The compression of the file (None for the default)
+        """
+
+        self.path = path
+        self.file_format = file_format
+        self.compression = compression
+        # the parquet writer (opened with the schema of the first chunk)
+        self.parquet_writer = None
+        # the first chunk truncates the file and writes the header
+        self.first_chunk = True
+        # an empty first chunk of a parquet subset
+        self.empty_subset = None
+
+    def write(self, subset: pd.DataFrame) -> None:
+        """Append a chunk of the subset
+
+        Args:
+            subset (pd.DataFrame): The rows of the chunk that match the predicate
+        """
+
+        if self.file_format == "csv":
+            subset.to_csv(
+                self.path,
+                mode="w" if self.first_chunk else "a",
+                header=self.first_chunk,
+                index=False,
+                compression=self.compression,
+            )
+        else:
+            # empty string columns have no type yet -> wait for rows to fix the schema
+            if self.parquet_writer is None and subset.empty:
+                self.empty_subset = subset
+                return
+            table = pa.Table.from_pandas(subset, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = parquet.ParquetWriter(
+                    self.path, table.schema, compression=self.compression or "snappy"
+                )
+            self.parquet_writer.write_table(table.cast(self.parquet_writer.schema))
+        self.first_chunk = False
+
+    def close(self) -> None:
+        """Finish the file (an empty subset still gets a file)"""
+
+        if self.parquet_writer is None and self.empty_subset is not None:
+            parquet.write_table(
+                pa.Table.from_pandas(self.empty_subset, preserve_index=False),
+                self.path,
+                compression=self.compression or "snappy",
+            )
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
@@ -0,0 +1,228 @@
+import pandas as pd
+import numpy as np
+
+# the rolling windows (in hours) of the per-account velocity features
+WINDOWS = [1, 24]
+# the account ID column of every role
+ROLE_COLUMNS = {"initiator": "initiator_id", "target": "target_id"}
+# hours since the previous transaction of an account that has none
+NO_PREVIOUS = -1
+# the number of accounts whose last transaction is kept past the windows of a stream
+MAX_ACCOUNTS = 1000000
+
+
+def account_feature_columns(windows: list = WINDOWS) -> list:
+    """The names of the columns added by add_account_features
+
+    Args:
+        windows (list, optional): The rolling windows in hours. Defaults to WINDOWS.
+
+    Returns:
+        list: The velocity columns of every role followed by the balance error columns
+    """
+
+    columns = []
+    for role in ROLE_COLUMNS:
+        for window in windows:
+            columns += [f"{role}_count_{window}h", f"{role}_amount_{window}h"]
+        columns.append(f"{role}_hours_since_last")
+
+    return columns + ["initiator_balance_error", "target_balance_error"]
+
+
+class AccountHistory:
+    """The recent transactions of every account, carried across the batches of a stream
+
+    Every role keeps the transactions within the widest window of the latest hour seen
+    and the last transaction of the max_accounts most recently active accounts (for the
+    hours since last), so the features of a batch count the earlier batches too. The
+    batches are expected in hour order.
+
+    The memory is bounded by the transactions of the widest window plus max_accounts
+    transactions. The hours since last of an account that was inactive for longer than
+    the widest window while max_accounts other accounts were active is NO_PREVIOUS.
+
+    Args:
+        windows (list, optional): The rolling windows in hours. Defaults to WINDOWS.
+        max_accounts (int, optional): The number of accounts whose last transaction is kept past the widest window. Defaults to MAX_ACCOUNTS.
+    """
+
+    def __init__(
+        self, windows: list = WINDOWS, max_accounts: int = MAX_ACCOUNTS
+    ) -> None:
+        self.windows = windows
+        self.max_accounts = max_accounts
+        # the account, hour and amount of the kept transactions of every role
+        self.transactions = {role: None for role in ROLE_COLUMNS}
+
+    def extend(
+        self, role: str, accounts: pd.Series, hours: np.ndarray, amounts: np.ndarray
+    ) -> tuple:
+        """Prepend the kept transactions of a role to a batch and keep the combined ones
+
+        Args:
+            role (str): "initiator" or "target"
+            accounts (pd.Series): The account ID of every transaction of the batch
+            hours (np.ndarray): The hour of every transaction of the batch
+            amounts (np.ndarray): The amount of every transaction of the batch
+
+        Returns:
+            tuple: The accounts, hours and amounts of the history followed by the batch,
+            and the number of history transactions in front
+        """
+
+        batch = pd.DataFrame(
+            {"account": accounts.to_numpy(), "hour": hours, "amount": amounts}
+        )
+        history = self.transactions[role]
+        combined = (
+            batch if history is None else pd.concat([history, batch], ignore_index=True)
+        )
+
+        # keep the transactions within the widest window and the last one of every account
+        latest = combined["hour"].max()
+        recent = combined["hour"].to_numpy() > latest - max(self.windows)
+        last = ~combined["account"].duplicated(keep="last").to_numpy()
+        # older last transactions of the least recently active accounts are dropped (the
+        # rows are in hour order)
+        older = np.flatnonzero(last & ~recent)
+        last[older[: max(older.shape[0] - self.max_accounts, 0)]] = False
+        self.transactions[role] = combined[recent | last].reset_index(drop=True)
+
+        return (
+            combined["account"],
+            combined["hour"].to_numpy(),
+            combined["amount"].to_numpy(),
+            0 if history is None else history.shape[0],
+        )
+
+
+def add_account_features(
+    df: pd.DataFrame, windows: list = WINDOWS, history: AccountHistory = None
+) -> pd.DataFrame:
+    """Add per-account velocity and balance-delta error features to the transactions
+
+    For the initiator and the target of every transaction: the number and total amount
+    of the account's earlier transactions within each rolling window of hours, and the
+    hours since its previous transaction. Only earlier transactions (by hour, then row
+    order) are counted, so no feature looks into the future.
+
+    The balance errors are what the balances fail to explain:
+    initiator_old_balance - amount - initiator_new_balance and
+    target_old_balance + amount - target_new_balance.
+
+    Without a history, df is all the history there is: every account's first transaction
+    in df is its first transaction. Batches of a stream pass the same history every time.
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data (default or compact dtypes)
+        windows (list, optional): The rolling windows in hours. Defaults to WINDOWS.
+        history (AccountHistory, optional): The transactions of the earlier batches (updated with df). Defaults to None.
+
+    Returns:
+        pd.DataFrame: A copy of df with the columns of account_feature_columns appended
+    """
+
+    hours = df["hour"].to_numpy().astype(np.int64)
+    amounts = df["amount"].to_numpy().astype(np.float64)
+
+    features = {}
+    for role, column in ROLE_COLUMNS.items():
+        if history is None:
+            features.update(
+                _velocity_features(df[column], hours, amounts, role, windows)
+            )
+            continue
+
+        # count the earlier batches too and keep only the features of df
+        accounts, all_hours, all_amounts, earlier = history.extend(
+            role, df[column], hours, amounts
+        )
+        role_features = _velocity_features(
+            accounts, all_hours, all_amounts, role, windows
+        )
+        features.update(
+            {name: values[earlier:] for name, values in role_features.items()}
+        )
+
+    # what the balances fail to explain
+    features["initiator_balance_error"] = (
+        df["initiator_old_balance"].to_numpy()
+        - amounts
+        - df["initiator_new_balance"].to_numpy()
+    )
+    features["target_balance_error"] = (
+        df["target_old_balance"].to_numpy()
+        + amounts
+        - df["target_new_balance"].to_numpy()
+    )
+
+    return df.assign(**features)
+
+
+def _velocity_features(
+    accounts: pd.Series,
+    hours: np.ndarray,
+    amounts: np.ndarray,
+    role: str,
+    windows: list,
+) -> dict:
+    """Rolling counts, amounts and hours since last of the accounts of one role
+
+    The transactions are sorted by (account, hour) once. In that order every account is
+    a contiguous run, so the start of the window of every transaction is found with one
+    binary search over a combined account/hour key, and the rolling sums are differences
+    of one cumulative sum.
+
+    Args:
+        accounts (pd.Series): The account ID of every transaction (strings or compact codes)
+        hours (np.ndarray): The hour of every transaction
+        amounts (np.ndarray): The amount of every transaction
+        role (str): "initiator" or "target" (prefixes the columns)
+        windows (list): The rolling windows in hours
+
+    Returns:
+        dict: The feature columns, in the order of the transactions
+    """
+
+    # integer account codes (compact account IDs already are)
+    if pd.api.types.is_integer_dtype(accounts.dtype):
+        codes = accounts.to_numpy().astype(np.int64)
+    else:
+        codes = pd.factorize(accounts)[0].astype(np.int64)
+
+    # a key that increases with (account, hour), leaving room for the widest window
+    stride = int(hours.max()) + max(windows) + 1 if hours.shape[0] else 1
+    keys = codes * stride + hours
+
+    # sort by account, then hour, then row: a unique key sorts with the (faster) quicksort
+    rows = keys.shape[0]
+    if rows and int(keys.max()) < np.iinfo(np.int64).max // rows:
+        order = np.argsort(keys * rows + np.arange(rows))
+    else:
+        order = np.argsort(keys, kind="stable")
+    sorted_codes, sorted_hours, keys = codes[order], hours[order], keys[order]
+    # cumulative amounts (with a leading 0) -> the sum of any run is one subtraction
+    cumulative = np.concatenate([[0.0], np.cumsum(amounts[order])])
+    positions = np.arange(keys.shape[0])
+
+    features = {}
+    for window in windows:
+        # the first earlier transaction of the account within the window
+        start = np.searchsorted(keys, keys - window, side="right")
+        features[f"{role}_count_{window}h"] = positions - start
+        features[f"{role}_amount_{window}h"] = cumulative[positions] - cumulative[start]
+
+    # hours since the previous transaction of the same account
+    since_last = np.full(keys.shape[0], NO_PREVIOUS, dtype=np.int64)
+    same_account = sorted_codes[1:] == sorted_codes[:-1]
+    since_last[1:][same_account] = np.diff(sorted_hours)[same_account]
+    features[f"{role}_hours_since_last"] = since_last
+
+    # scatter the features back to the order of the transactions
+    for name, values in features.items():
+        unsorted = np.empty_like(values)
+        unsorted[order] = values
+        features[name] = unsorted
+
+    return features
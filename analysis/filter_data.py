@@ -1,71 +1,152 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
 
+from analysis.cube import build_cube, pivot_table_from_cube
+from data_prep.compact import expand_account_ids
 
-def transactional_data_per_hour(
-    df: pd.DataFrame, start_hour: int, end_hour: int
+
+def hourly_partials(
+    df: pd.DataFrame, start_hour: int, end_hour: int, bucket_size: int = 1
 ) -> pd.DataFrame:
-    """Average the amount of money that is transacted per hour
+    """Aggregate the transaction data per (hour bucket, type) in a single grouped pass
 
     Args:
         df (pd.DataFrame): Contains the transaction data
         start_hour (int): The first hour to account for
         end_hour (int): The last hour to account for
+        bucket_size (int, optional): The number of hours per bucket. Defaults to 1.
 
     Returns:
-        pd.DataFrame: The hourly transactional volumne
+        pd.DataFrame: The count, volume and fraud count per bucket and type
     """
 
-    # assert that the start and end hours are within the range provided in the dataset
+    # assert that the hours are a valid range (any number of months)
     assert start_hour >= 1 and start_hour <= end_hour
-    assert end_hour <= 743
+    # assert that the bucket size is a positive number of hours
+    assert bucket_size >= 1
 
-    # initialize dict
-    consolidated_data = {}
-
-    # loop through each hour in a 24 hour day
-    for hour in range(start_hour, end_hour + 1):
-        # get all transactions from that hour in a df
-        hour_df = df[df["hour"] == hour]
-        # get the sum of the "amount" column
-        volume = round(sum(hour_df["amount"].to_list()), 2)
-
-        # most frequent transaction type
-        most_frequent_type = hour_df["type"].value_counts().idxmax()
-        # occurances of the most frequent transaction type
-        df_most_frequent_type = hour_df[hour_df["type"] == most_frequent_type]
-        # number of most frequent type transactions
-        most_frequent_type_occurances = df_most_frequent_type.shape[0]
-        #
-        most_frequent_type_volume = round(
-            sum(df_most_frequent_type["amount"].to_list()), 2
-        )
+    # keep only the transactions within the requested hours
+    hours = df["hour"]
+    in_range = df[(hours >= start_hour) & (hours <= end_hour)]
+
+    # label every transaction with the first hour of its bucket
+    bucket = (in_range["hour"] - start_hour) // bucket_size * bucket_size + start_hour
+
+    # count, volume and fraud count for every (bucket, type) pair in one pass
+    partials = in_range.groupby([bucket.rename("hour"), "type"], observed=True).agg(
+        number_of_transactions=("amount", "size"),
+        volume=("amount", "sum"),
+        number_of_fradulent_transactions=("is_fraud", "sum"),
+    )
+
+    # return the partial aggregates
+    return partials.reset_index()
+
+
+def merge_partials(
+    partials: pd.DataFrame, keys: tuple = ("hour", "type")
+) -> pd.DataFrame:
+    """Combine partial aggregates that share the same keys (ex. computed over different rows)
+
+    Args:
+        partials (pd.DataFrame): Concatenated outputs of hourly_partials
+        keys (tuple, optional): The columns identifying a group. Defaults to ("hour", "type").
+
+    Returns:
+        pd.DataFrame: One row of partial aggregates per group
+    """
+
+    # add up the counts and volumes of every group
+    merged = partials.groupby(list(keys), observed=True)[
+        ["number_of_transactions", "volume", "number_of_fradulent_transactions"]
+    ].sum()
+
+    # return the merged partial aggregates
+    return merged.reset_index()
+
+
+def hourly_stats_from_partials(partials: pd.DataFrame) -> pd.DataFrame:
+    """Reduce (hour bucket, type) partial aggregates to the hourly transactional statistics
+
+    Args:
+        partials (pd.DataFrame): The output of hourly_partials (or a sum of several of them)
+
+    Returns:
+        pd.DataFrame: The hourly transactional volumne
+    """
+
+    # totals per bucket across all transaction types
+    totals = partials.groupby("hour").agg(
+        volume=("volume", "sum"),
+        number_of_transactions=("number_of_transactions", "sum"),
+        number_of_fradulent_transactions=("number_of_fradulent_transactions", "sum"),
+    )
 
-        # get the number of transactions by indexing the number of rows from hour_df.shape
-        number_of_transactions = hour_df.shape[0]
-        # calculate the percentage of fradulent transactions
-        number_of_fradulent_transactions = hour_df[hour_df["is_fraud"] == 1].shape[0]
-        # percentage of fraudulent transactions from total number of transactions per hour
-        percentage_of_fraudulent_transactions = round(
-            ((number_of_fradulent_transactions / number_of_transactions) * 100), 2
+    # most frequent type per bucket (ties are broken alphabetically by type)
+    most_frequent = (
+        partials.sort_values(
+            ["hour", "number_of_transactions", "type"],
+            ascending=[True, False, True],
         )
+        .drop_duplicates("hour")
+        .set_index("hour")
+    )
 
-        # construct dict
-        data = {
-            "hour": hour,
-            "volume": volume,
-            "number_of_transactions": number_of_transactions,
-            "percentage_of_fradulent_transactions": percentage_of_fraudulent_transactions,
-            "most_frequent_type": most_frequent_type,
-            "most_frequent_type_volume": most_frequent_type_volume,
-            "number_of_most_frequent_type_transactions": most_frequent_type_occurances,
+    # construct the output in the established column order
+    transactional_data_df = pd.DataFrame(
+        {
+            "hour": totals.index,
+            "volume": totals["volume"].round(2).to_numpy(),
+            "number_of_transactions": totals["number_of_transactions"].to_numpy(),
+            "percentage_of_fradulent_transactions": (
+                totals["number_of_fradulent_transactions"]
+                / totals["number_of_transactions"]
+                * 100
+            )
+            .round(2)
+            .to_numpy(),
+            "most_frequent_type": most_frequent["type"]
+            .astype(str)
+            .reindex(totals.index)
+            .to_numpy(),
+            "most_frequent_type_volume": most_frequent["volume"]
+            .round(2)
+            .reindex(totals.index)
+            .to_numpy(),
+            "number_of_most_frequent_type_transactions": most_frequent[
+                "number_of_transactions"
+            ]
+            .reindex(totals.index)
+            .to_numpy(),
         }
-        # update consolidated_data with data
-        consolidated_data[hour] = data
+    )
+
+    # return the hourly statistics
+    return transactional_data_df
+
+
+def transactional_data_per_hour(
+    df: pd.DataFrame, start_hour: int, end_hour: int, bucket_size: int = 1
+) -> pd.DataFrame:
+    """Average the amount of money that is transacted per hour
+
+    Args:
+        df (pd.DataFrame): Contains the transaction data
+        start_hour (int): The first hour to account for
+        end_hour (int): The last hour to account for
+        bucket_size (int, optional): The number of hours per bucket (ex. 1, 6, 24). Defaults to 1.
 
-    # convert json object to dataframe and transpose the df
-    transactional_data_df = pd.DataFrame(consolidated_data).T
+    Returns:
+        pd.DataFrame: The hourly transactional volumne
+    """
+
+    # assert that the start and end hours are within the range provided in the dataset
+    assert start_hour >= 1 and start_hour <= end_hour
+    assert end_hour <= 743
+
+    # aggregate every bucket in a single grouped pass and reduce to the hourly statistics
+    transactional_data_df = hourly_stats_from_partials(
+        hourly_partials(df, start_hour, end_hour, bucket_size)
+    )
     # convert dataframe to CSV file
     transactional_data_df.to_csv(
         "./data/output/transactional_data_per_hour.csv", index=False
@@ -76,7 +157,7 @@ def transactional_data_per_hour(
 
 
 def get_transactions_over_amount(
-    df: pd.DataFrame, column: str, amount: float
+    df: pd.DataFrame, column: str, amount: float, account_ids: pd.Index = None
 ) -> pd.DataFrame:
     """Return a Pandas DataFrame of all transactions over a certain amount.
 
@@ -84,6 +165,7 @@ def get_transactions_over_amount(
         df (pd.DataFrame): Contains the raw data
         column (str): The target column in the DataFrame
         amount (float): The maximum amount in a single transfer
+        account_ids (pd.Index, optional): The account ID lookup table of a compact df, used to write the original account IDs. Defaults to None.
 
     Returns:
         pd.DataFrame: The filtered DataFrame
@@ -91,25 +173,31 @@ def get_transactions_over_amount(
 
     # filter df if column value is over amount
     filtered_df = df[df[column] >= amount]
-    # save filtered_df to file
-    filtered_df.to_csv(f"./data/output/transactions_over_{amount}.csv", index=False)
+    # save filtered_df to file (with the original account IDs)
+    (
+        filtered_df
+        if account_ids is None
+        else expand_account_ids(filtered_df, account_ids)
+    ).to_csv(f"./data/output/transactions_over_{amount}.csv", index=False)
 
     return filtered_df
 
 
-def create_pivot_table(df: pd.DataFrame) -> pd.pivot_table:
-    # create the pivot table from df
-    pivot_table = df.pivot_table(
-        index=["type"],
-        values=["amount", "is_fraud"],
-        aggfunc=["sum", "std"],
-        margins=True,
-    )
+def create_pivot_table(df: pd.DataFrame, cube: pd.DataFrame = None) -> pd.DataFrame:
+    """Create the pivot table of the sum and std of "amount" and "is_fraud" per type
+
+    The pivot table is rolled up from the amount cube (see analysis.cube).
+
+    Args:
+        df (pd.DataFrame): Contains the transaction data
+        cube (pd.DataFrame, optional): The cube of df, to roll up instead of scanning df. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The pivot table (with an "All" row)
+    """
 
-    # set color palette for pivot table
-    cm = sns.light_palette("purple", as_cmap=True)
-    # set the color gradient
-    pivot_table.style.background_gradient(cmap=cm)
+    # roll the pivot table up from the cube
+    pivot_table = pivot_table_from_cube(build_cube(df) if cube is None else cube)
 
     # convert pivot table to CSV and save to file
     pivot_table.to_csv("./data/output/pivot_table.csv", index="type")
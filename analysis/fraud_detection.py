@@ -1,14 +1,33 @@
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import average_precision_score
 from sklearn.ensemble import RandomForestClassifier
 import pandas as pd
+import numpy as np
+import joblib
 
+from typing import Iterable, Iterator
+from pathlib import Path
+
+from analysis.features import (
+    AccountHistory,
+    account_feature_columns,
+    add_account_features,
+)
 from analysis.helpers import encode_and_bind
+from analysis.streaks import find_runs
+from data_prep.compact import TRANSACTION_TYPES, expand_account_ids
+
+# where the fitted fraud model is stored
+MODEL_PATH = "./data/models/fraud_model.joblib"
 
 
 def fraud_detection(df: pd.DataFrame) -> float:
     """Detect if there is a pattern of fraud by using the Random Forest (RF) Alogorithm.
 
+    The RF is trained on the first 80% of the transactions in time and scored on the
+    later hours, so no future hours leak into training (see analysis.evaluation for
+    time-ordered cross-validation). The per-account features are computed over all
+    transactions first, so the test hours see the history of their accounts.
+
     Args:
         df (pd.DataFrame): The cleaned transaction data
 
@@ -16,36 +35,198 @@ def fraud_detection(df: pd.DataFrame) -> float:
         float: The precision score from the RF
     """
 
-    # drop columns that will not be used in the model
-    df.drop(["initiator_id", "target_id"], axis=1, inplace=True)
-    # tokenize the "type" column to not be included in the model
-    encoded_df = encode_and_bind(df, "type")
-
-    # create trains
-    X = encoded_df.drop(["is_fraud", "type"], axis=1)
-    y = encoded_df[["is_fraud"]]
-    # train and test model
-    train_X, test_X, train_y, test_y = train_test_split(
-        X, y, test_size=0.2, random_state=121
-    )
+    # add the per-account velocity and balance error features
+    if not _has_account_features(df):
+        df = add_account_features(df)
+    # split the transactions into earlier (train) and later (test) hours
+    cutoff = df["hour"].quantile(0.8, interpolation="lower")
+    train_df, test_df = df[df["hour"] <= cutoff], df[df["hour"] > cutoff]
 
-    # create RF object
-    clf = RandomForestClassifier(n_estimators=15)
-    # make predictions
-    probabilities = clf.fit(train_X, train_y.values.ravel()).predict(test_X)
+    # train the model on the train set
+    model = train_fraud_model(train_df)
+    # fraud probabilities of the test set
+    probabilities = score_transactions(model, test_df)
 
     # return the average precision score from the model
     avg_precision_score = round(
-        (average_precision_score(test_y, probabilities) * 100), 2
+        (average_precision_score(test_df["is_fraud"], probabilities) * 100), 2
     )
     return avg_precision_score
 
 
-def consecutive_fraudulent_hours(numbers: list) -> None:
+def train_fraud_model(
+    df: pd.DataFrame,
+    n_estimators: int = 15,
+    n_jobs: int = -1,
+    account_features: bool = True,
+) -> dict:
+    """Train the Random Forest (RF) fraud model
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data (optionally with the columns of add_account_features)
+        n_estimators (int, optional): The number of trees. Defaults to 15.
+        n_jobs (int, optional): The number of cores used to train and score. Defaults to -1 (all cores).
+        account_features (bool, optional): Train on the per-account velocity and balance error features too (added when missing). Defaults to True.
+
+    Returns:
+        dict: The fitted RF together with the one-hot "type" categories and feature columns it was trained on
+    """
+
+    # add the per-account features (or drop them)
+    if account_features and not _has_account_features(df):
+        df = add_account_features(df)
+    elif not account_features:
+        df = df.drop(account_feature_columns(), axis=1, errors="ignore")
+
+    # encode the features with a fixed set of "type" categories
+    X = model_features(df, TRANSACTION_TYPES)
+    # create RF object and fit it
+    clf = RandomForestClassifier(n_estimators=n_estimators, n_jobs=n_jobs)
+    clf.fit(X, df["is_fraud"].to_numpy())
+
+    # return the model with its encoding
+    return {
+        "classifier": clf,
+        "categories": TRANSACTION_TYPES,
+        "columns": list(X.columns),
+    }
+
+
+def model_features(df: pd.DataFrame, categories: list) -> pd.DataFrame:
+    """Build the model features of transactions
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data
+        categories (list): The one-hot encoded "type" categories
+
+    Returns:
+        pd.DataFrame: The feature matrix
+    """
+
+    # drop columns that will not be used in the model (without mutating the caller's df)
+    df = df.drop(["initiator_id", "target_id", "is_fraud"], axis=1, errors="ignore")
+    # tokenize the "type" column to not be included in the model
+    encoded_df = encode_and_bind(df, "type", categories)
+
+    # return the features
+    return encoded_df.drop(["type"], axis=1)
+
+
+def save_fraud_model(model: dict, path: Path = MODEL_PATH) -> None:
+    """Store a fitted fraud model with its encoding
+
+    Args:
+        model (dict): The output of train_fraud_model
+        path (Path, optional): Where the model is stored. Defaults to MODEL_PATH.
+    """
+
+    # create the model directory and dump the model
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, path)
+
+
+def load_fraud_model(path: Path = MODEL_PATH, n_jobs: int = -1) -> dict:
+    """Load a fitted fraud model with its encoding
+
+    Args:
+        path (Path, optional): Where the model is stored. Defaults to MODEL_PATH.
+        n_jobs (int, optional): The number of cores used to score. Defaults to -1 (all cores).
+
+    Returns:
+        dict: The fitted RF together with its one-hot "type" categories and feature columns
+    """
+
+    # load the model and set the cores used to score
+    model = joblib.load(path)
+    model["classifier"].set_params(n_jobs=n_jobs)
+
+    return model
+
+
+def score_transactions(
+    model: dict,
+    data: pd.DataFrame | Iterable[pd.DataFrame],
+    history: AccountHistory = None,
+) -> np.ndarray | Iterator[np.ndarray]:
+    """Score transactions with the probability that they are fraudulent
+
+    Models trained on the per-account features need the history of every account: a
+    single frame without a history is taken to be the full history, the chunks of an
+    iterator share one history, and the batches of a stream pass the same history to
+    every call.
+
+    Args:
+        model (dict): The output of train_fraud_model or load_fraud_model
+        data (pd.DataFrame | Iterable[pd.DataFrame]): Transactions, or an iterator of chunks of transactions
+        history (AccountHistory, optional): The transactions of the earlier batches (updated with data). Defaults to None.
+
+    Returns:
+        np.ndarray | Iterator[np.ndarray]: The fraud probabilities (one array per chunk for an iterator)
+    """
+
+    # score a single frame
+    if isinstance(data, pd.DataFrame):
+        return _score_frame(model, data, history)
+
+    # lazily score every chunk (the later chunks see the accounts of the earlier ones)
+    history = AccountHistory() if history is None else history
+    return (_score_frame(model, chunk, history) for chunk in data)
+
+
+def _score_frame(
+    model: dict, df: pd.DataFrame, history: AccountHistory = None
+) -> np.ndarray:
+    """Score one frame of transactions
+
+    Args:
+        model (dict): The output of train_fraud_model or load_fraud_model
+        df (pd.DataFrame): Transactions
+        history (AccountHistory, optional): The transactions of the earlier batches (updated with df). Defaults to None.
+
+    Returns:
+        np.ndarray: The fraud probabilities
+    """
+
+    # nothing to score
+    if df.shape[0] == 0:
+        return np.empty(0)
+
+    # the per-account features see the earlier batches through the history
+    if set(account_feature_columns()) <= set(model["columns"]) and not (
+        _has_account_features(df)
+    ):
+        df = add_account_features(df, history=history)
+
+    # encode the features the way the model was trained
+    X = model_features(df, model["categories"])[model["columns"]]
+    # index of the fraudulent class
+    fraud_class = list(model["classifier"].classes_).index(1)
+
+    # return the probability of the fraudulent class
+    return model["classifier"].predict_proba(X)[:, fraud_class]
+
+
+def _has_account_features(df: pd.DataFrame) -> bool:
+    """Whether the transactions already have the columns of add_account_features
+
+    Args:
+        df (pd.DataFrame): Transactions
+
+    Returns:
+        bool: True when every per-account feature column is present
+    """
+
+    return set(account_feature_columns()) <= set(df.columns)
+
+
+def consecutive_fraudulent_hours(numbers: list) -> pd.DataFrame:
     """Determine the number of instances consecutive hours comprised of only fraudulent transactions.
 
     Args:
         numbers (list): Hours from when transactions occured
+
+    Returns:
+        pd.DataFrame: The first hour, last hour and length of every run of at least 2 consecutive hours
     """
 
     try:
@@ -55,51 +236,26 @@ def consecutive_fraudulent_hours(numbers: list) -> None:
         # raise IndexError if the list is
         raise IndexError(f"The list parameter supplied does not contain any elements.")
 
-    # initialize list to store consecutive_numbers
-    fraudulent_hours = []
-    # index the first number in list and set it to train ("train" of chronological numbers)
-    train = [numbers[0]]
-
-    # loop through the length of numbers
-    for i in range(1, len(numbers)):
-        # if the next number in the list equals the previous number
-        if numbers[i] == numbers[i - 1] + 1:
-            # append next number to current_group
-            train.append(numbers[i])
-        # if the next number is not the next chronological number
-        else:
-            # create a new group (list) in gropued
-            fraudulent_hours.append(train)
-            # set first number in list to current number
-            train = [numbers[i]]
-
-    # append the current group to grouped
-    fraudulent_hours.append(train)
-
-    # keep list of consecutive numbers is len() is >= 2
-    validated_consec_hours = [
-        consec_hours for consec_hours in fraudulent_hours if len(consec_hours) >= 2
-    ]
-
-    # initialize list to store averages of length for each group of consecutive numbers
-    avg_consect_hours = []
-    # loop through consecutive groups
-    for numbers in validated_consec_hours:
-        # append length of grouped list to avg_consect_nums
-        avg_consect_hours.append(len(numbers))
+    # runs of at least 2 consecutive hours
+    validated_consec_hours = find_runs(np.asarray(numbers), min_length=2)
 
     # print to log
-    print(f"Instances of Consecutive Fraudulent Hours: {len(validated_consec_hours)}")
     print(
-        f"Average number of Consecutive Fraudulent Hours: {round(sum(avg_consect_hours) / len(avg_consect_hours), 2)}"
+        f"Instances of Consecutive Fraudulent Hours: {validated_consec_hours.shape[0]}"
+    )
+    print(
+        f"Average number of Consecutive Fraudulent Hours: {round(validated_consec_hours['length'].mean(), 2) if validated_consec_hours.shape[0] else 0}"
     )
 
+    return validated_consec_hours
+
 
-def zero_amount_transactions(df: pd.DataFrame) -> int:
+def zero_amount_transactions(df: pd.DataFrame, account_ids: pd.Index = None) -> int:
     """Gets the number of transactions where the amount is 0.
 
     Args:
         df (pd.DataFrame): Contains the transaction data
+        account_ids (pd.Index, optional): The account ID lookup table of a compact df, used to write the original account IDs. Defaults to None.
 
     Returns:
         int: The number of transactions where the amount is 0.
@@ -107,7 +263,11 @@ def zero_amount_transactions(df: pd.DataFrame) -> int:
 
     # df subset where the amount is 0
     transactions = df[df["amount"] == 0]
-    # convert transactions to CSV file
-    transactions.to_csv("./data/output/transactions_with_0_amount.csv", index=False)
+    # convert transactions to CSV file (with the original account IDs)
+    (
+        transactions
+        if account_ids is None
+        else expand_account_ids(transactions, account_ids)
+    ).to_csv("./data/output/transactions_with_0_amount.csv", index=False)
     # index the shape (rows) of the df
     return transactions.shape[0]
@@ -2,21 +2,30 @@ from sklearn.preprocessing import OneHotEncoder
 import pandas as pd
 
 
-def encode_and_bind(df: pd.DataFrame, feature: str) -> pd.DataFrame:
+def encode_and_bind(
+    df: pd.DataFrame, feature: str, categories: list = None
+) -> pd.DataFrame:
     """Encode columns with 'dummy' values and bind to original Pandas DataFrame.
 
     Args:
         df (pd.DataFrame): Containing raw transaction data
         feature (str): The column to encode
+        categories (list, optional): Fixed categories to encode (unknown values encode as all zeros). Defaults to None (the categories found in df).
 
     Returns:
         pd.DataFrame: Newly created Pandas DataFrame with encoded columns
     """
 
     # create encoder object
-    encoder = OneHotEncoder(sparse_output=False)
+    encoder = (
+        OneHotEncoder(sparse_output=False)
+        if categories is None
+        else OneHotEncoder(
+            categories=[categories], handle_unknown="ignore", sparse_output=False
+        )
+    )
     # reshape column to 2D-array
-    column = df[feature].values.reshape(-1, 1)
+    column = df[feature].to_numpy().reshape(-1, 1)
     # encoded columns
     encoded_columns = encoder.fit_transform(column)
 
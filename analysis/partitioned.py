@@ -0,0 +1,488 @@
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable
+from pathlib import Path
+import shutil
+import os
+
+from analysis.filter_data import (
+    hourly_partials,
+    hourly_stats_from_partials,
+    merge_partials,
+)
+from analysis.cube import build_cube, merge_cubes, pivot_table_from_cube
+from analysis.sketches import TransactionSketches, print_approximate_insights
+from data_prep.partition import (
+    PARTITION_DIR,
+    list_partitions,
+    read_manifest,
+    read_partition,
+)
+
+# the numeric columns summarized by partitioned_dataframe_insights
+NUMERIC_COLUMNS = [
+    "hour",
+    "amount",
+    "initiator_old_balance",
+    "initiator_new_balance",
+    "target_old_balance",
+    "target_new_balance",
+    "is_fraud",
+]
+
+
+def map_partitions(
+    func: Callable,
+    partitions: list,
+    *args,
+    workers: int = None,
+    reduce: Callable = None,
+) -> list:
+    """Run a function on every partition in a process pool (the map step)
+
+    Args:
+        func (Callable): Called with a partition directory and args (must be importable by the workers)
+        partitions (list): The partition directories (see list_partitions)
+        *args: Passed on to func after the partition
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        reduce (Callable, optional): Folds two results into one (in any order). The results are folded as they arrive and at most one per worker is held at a time. Defaults to None (keep every result).
+
+    Returns:
+        list: The result of every partition, in partition order (the folded result with reduce)
+    """
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if reduce is None:
+            futures = [pool.submit(func, partition, *args) for partition in partitions]
+            return [future.result() for future in futures]
+
+        # keep one partition per worker in flight and fold the results as they arrive
+        folded = None
+        running = set()
+        partitions = list(partitions)
+        while partitions or running:
+            while partitions and len(running) < workers:
+                running.add(pool.submit(func, partitions.pop(0), *args))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                folded = result if folded is None else reduce(folded, result)
+
+        return folded
+
+
+def partitioned_transactional_data_per_hour(
+    start_hour: int,
+    end_hour: int,
+    bucket_size: int = 1,
+    partition_dir: Path = PARTITION_DIR,
+    workers: int = None,
+) -> pd.DataFrame:
+    """transactional_data_per_hour over the partitions (any number of months)
+
+    Only the partitions overlapping the hour range are read. Buckets spanning two
+    partitions are combined by merge_partials.
+
+    Args:
+        start_hour (int): The first hour to account for
+        end_hour (int): The last hour to account for
+        bucket_size (int, optional): The number of hours per bucket (ex. 1, 6, 24). Defaults to 1.
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: The hourly transactional volumne
+    """
+
+    # aggregate every partition overlapping the hours and merge the partial aggregates
+    partials = map_partitions(
+        _hourly_partials,
+        list_partitions(partition_dir, start_hour, end_hour),
+        start_hour,
+        end_hour,
+        bucket_size,
+        workers=workers,
+    )
+    transactional_data_df = hourly_stats_from_partials(
+        merge_partials(pd.concat(partials, ignore_index=True))
+    )
+
+    # convert dataframe to CSV file
+    transactional_data_df.to_csv(
+        "./data/output/transactional_data_per_hour.csv", index=False
+    )
+
+    # return the transactional data
+    return transactional_data_df
+
+
+def partitioned_transactions_over_amount(
+    column: str,
+    amount: float,
+    partition_dir: Path = PARTITION_DIR,
+    workers: int = None,
+) -> int:
+    """get_transactions_over_amount over the partitions
+
+    Every worker writes the matching rows of its partition, then the files are concatenated
+    in hour order, so the matches never have to fit in memory.
+
+    Args:
+        column (str): The target column in the DataFrame
+        amount (float): The maximum amount in a single transfer
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        int: The number of transactions written
+    """
+
+    return _write_rows_between(
+        column,
+        amount,
+        np.inf,
+        Path(f"./data/output/transactions_over_{amount}.csv"),
+        partition_dir,
+        workers,
+    )
+
+
+def partitioned_zero_amount_transactions(
+    partition_dir: Path = PARTITION_DIR, workers: int = None
+) -> int:
+    """zero_amount_transactions over the partitions
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        int: The number of transactions where the amount is 0.
+    """
+
+    return _write_rows_between(
+        "amount",
+        0,
+        0,
+        Path("./data/output/transactions_with_0_amount.csv"),
+        partition_dir,
+        workers,
+    )
+
+
+def partitioned_pivot_table(
+    partition_dir: Path = PARTITION_DIR, workers: int = None
+) -> pd.DataFrame:
+    """create_pivot_table over the partitions
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: The sum and standard deviation of "amount" and "is_fraud" per type and in total
+    """
+
+    # build the cube of every partition and roll the merged cube up to the pivot table
+    cubes = map_partitions(_cube, list_partitions(partition_dir), workers=workers)
+    pivot_table = pivot_table_from_cube(merge_cubes(cubes))
+
+    # convert pivot table to CSV and save to file
+    pivot_table.to_csv("./data/output/pivot_table.csv", index="type")
+
+    # return the pivot table
+    return pivot_table
+
+
+def partitioned_dataframe_insights(
+    partition_dir: Path = PARTITION_DIR, workers: int = None
+) -> None:
+    """dataframe_insights over the partitions
+
+    The partitions hold the deduplicated rows, so the number of duplicates is the one
+    recorded while cleaning (see write_partitions). describe() is limited to the mergeable
+    statistics (count, mean, std, min, max).
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+    """
+
+    # summarize every partition
+    partials = map_partitions(
+        _insights_partials, list_partitions(partition_dir), workers=workers
+    )
+
+    # add up the counts
+    counts = sum(partial["counts"] for partial in partials)
+    types = sum(partial["types"] for partial in partials)
+    amount_by_fraud = sum(partial["amount_by_fraud"] for partial in partials)
+
+    # number of dupes (dropped while cleaning)
+    duplicates = read_manifest(partition_dir).get("duplicates")
+    print("Number of duplicates: ", "unknown" if duplicates is None else duplicates)
+    print("\n")
+
+    # number of transactions
+    print(f"Number of Transactions: {counts['rows']}")
+    # number of features
+    print(f"Number of Features: {len(partials[0]['dtypes'])}")
+    # number of transactions where the transaction amount is zero
+    print(f"Number of Transactions of Zero Amount: {counts['zero_amount']}")
+    # number of fraudulent transactions
+    print(f"Number of Fraudulent Transactions: {counts['fraudulent']}")
+    print("\n")
+
+    # info on the dataframe
+    print("INFO ON DATAFRAME:")
+    print(
+        pd.DataFrame(
+            {
+                "Non-Null Count": sum(partial["non_null"] for partial in partials),
+                "Dtype": partials[0]["dtypes"],
+            }
+        )
+    )
+    print("\n")
+    print(_merge_describe([partial["stats"] for partial in partials]))
+    print("\n")
+
+    # average amount of non-fraudulent transaction
+    print(
+        f"Average amount of non-fraudulent transaction: {amount_by_fraud.loc[0, 'sum'] / amount_by_fraud.loc[0, 'count']}"
+    )
+    # average amount of fraudulent transfer
+    print(
+        f"Average amount of fraudulent transaction: {amount_by_fraud.loc[1, 'sum'] / amount_by_fraud.loc[1, 'count']}"
+    )
+    print("\n")
+
+    # number of transactions by type
+    print("NUMBER OF TRANSACTIONS BY TYPE")
+    print(types.sort_values(ascending=False))
+
+
+def partitioned_approximate_insights(
+    partition_dir: Path = PARTITION_DIR, workers: int = None
+) -> dict:
+    """Approximate insights over the partitions from mergeable sketches (see analysis.sketches)
+
+    Every partition is sketched in a worker and the sketches are merged as they arrive,
+    so memory stays fixed however many months are partitioned.
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        dict: The approximate figures with their error bounds (see TransactionSketches.report)
+    """
+
+    sketches = map_partitions(
+        _sketch_partition,
+        list_partitions(partition_dir),
+        workers=workers,
+        reduce=lambda merged, sketch: merged.merge(sketch),
+    )
+    return print_approximate_insights(sketches)
+
+
+def _hourly_partials(
+    partition: Path, start_hour: int, end_hour: int, bucket_size: int
+) -> pd.DataFrame:
+    """hourly_partials of one partition (runs in a worker)
+
+    Args:
+        partition (Path): The partition directory
+        start_hour (int): The first hour to account for
+        end_hour (int): The last hour to account for
+        bucket_size (int): The number of hours per bucket
+
+    Returns:
+        pd.DataFrame: The partial aggregates of the partition
+    """
+
+    df = read_partition(partition, ["hour", "type", "amount", "is_fraud"])
+    return hourly_partials(df, start_hour, end_hour, bucket_size)
+
+
+def _cube(partition: Path) -> pd.DataFrame:
+    """build_cube of one partition (runs in a worker)
+
+    Args:
+        partition (Path): The partition directory
+
+    Returns:
+        pd.DataFrame: The cube of the partition
+    """
+
+    return build_cube(read_partition(partition, ["hour", "type", "amount", "is_fraud"]))
+
+
+def _write_rows_between(
+    column: str,
+    low: float,
+    high: float,
+    output_path: Path,
+    partition_dir: Path,
+    workers: int,
+) -> int:
+    """Write the rows whose column is within [low, high] from every partition to one CSV file
+
+    Args:
+        column (str): The filtered column
+        low (float): The lowest value kept
+        high (float): The highest value kept
+        output_path (Path): The CSV file written
+        partition_dir (Path): Where the partitions are stored
+        workers (int): The number of processes
+
+    Returns:
+        int: The number of rows written
+    """
+
+    # every partition writes its rows to a part file next to the output
+    partitions = list_partitions(partition_dir)
+    part_paths = [
+        output_path.with_name(f".{output_path.stem}.part-{i:05d}.csv")
+        for i in range(len(partitions))
+    ]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        rows = list(
+            pool.map(
+                _filter_partition,
+                partitions,
+                [column] * len(partitions),
+                [low] * len(partitions),
+                [high] * len(partitions),
+                part_paths,
+            )
+        )
+
+    # concatenate the part files in hour order (the first one holds the header)
+    with open(output_path, "wb") as output:
+        for part_path in part_paths:
+            with open(part_path, "rb") as part:
+                shutil.copyfileobj(part, output)
+            part_path.unlink()
+
+    return sum(rows)
+
+
+def _filter_partition(
+    partition: Path, column: str, low: float, high: float, part_path: Path
+) -> int:
+    """Write the rows of one partition whose column is within [low, high] (runs in a worker)
+
+    Args:
+        partition (Path): The partition directory
+        column (str): The filtered column
+        low (float): The lowest value kept
+        high (float): The highest value kept
+        part_path (Path): The part file written (with a header line for the first partition)
+
+    Returns:
+        int: The number of rows written
+    """
+
+    df = read_partition(partition)
+    filtered_df = df[df[column].between(low, high)]
+    filtered_df.to_csv(
+        part_path, index=False, header=part_path.name.endswith("-00000.csv")
+    )
+    return filtered_df.shape[0]
+
+
+def _sketch_partition(partition: Path) -> TransactionSketches:
+    """Sketch the transactions of one partition (runs in a worker)
+
+    Args:
+        partition (Path): The partition directory
+
+    Returns:
+        TransactionSketches: The sketches of the partition
+    """
+
+    sketches = TransactionSketches()
+    sketches.add(read_partition(partition))
+    return sketches
+
+
+def _insights_partials(partition: Path) -> dict:
+    """Mergeable summary of one partition for partitioned_dataframe_insights (runs in a worker)
+
+    Args:
+        partition (Path): The partition directory
+
+    Returns:
+        dict: Counts, value counts and per column statistics of the partition
+    """
+
+    df = read_partition(partition)
+    numeric = df[NUMERIC_COLUMNS].astype(np.float64)
+
+    return {
+        "counts": pd.Series(
+            {
+                "rows": df.shape[0],
+                "zero_amount": (df["amount"] == 0).sum(),
+                "fraudulent": (df["is_fraud"] == 1).sum(),
+            }
+        ),
+        "non_null": df.notnull().sum(),
+        "dtypes": df.dtypes.astype(str),
+        "types": df["type"].value_counts(),
+        "amount_by_fraud": df.groupby("is_fraud")["amount"]
+        .agg(["sum", "count"])
+        .reindex([0, 1], fill_value=0),
+        # count, mean and sum of squared deviations merge exactly (Chan et al.)
+        "stats": pd.DataFrame(
+            {
+                "count": numeric.count(),
+                "mean": numeric.mean(),
+                "m2": numeric.var().fillna(0) * (numeric.count() - 1),
+                "min": numeric.min(),
+                "max": numeric.max(),
+            }
+        ),
+    }
+
+
+def _merge_describe(stats: list) -> pd.DataFrame:
+    """Merge per partition column statistics into the mergeable rows of describe()
+
+    Args:
+        stats (list): The "stats" of every partition
+
+    Returns:
+        pd.DataFrame: count, mean, std, min and max per numeric column
+    """
+
+    # stack the statistics of every partition
+    stacked = pd.concat(stats, keys=range(len(stats)))
+    groups = stacked.groupby(level=1, sort=False)
+
+    # combine the counts, means and squared deviations
+    count = groups["count"].sum()
+    mean = (stacked["count"] * stacked["mean"]).groupby(
+        level=1, sort=False
+    ).sum() / count
+    deviation = stacked["mean"] - mean.reindex(stacked.index, level=1)
+    m2 = (
+        (stacked["m2"] + stacked["count"] * deviation**2)
+        .groupby(level=1, sort=False)
+        .sum()
+    )
+
+    return pd.DataFrame(
+        {
+            "count": count,
+            "mean": mean,
+            "std": (m2 / (count - 1)) ** 0.5,
+            "min": groups["min"].min(),
+            "max": groups["max"].max(),
+        }
+    ).T
@@ -0,0 +1,667 @@
+import pandas as pd
+import numpy as np
+
+from typing import Iterable
+from pathlib import Path
+import math
+
+# HyperLogLog precision of the distinct accounts per hour and type (2^10 registers, ~3.3% error)
+CELL_PRECISION = 10
+# HyperLogLog precision of the distinct accounts overall (2^14 registers, ~0.8% error)
+TOTAL_PRECISION = 14
+# relative accuracy of the amount quantiles
+QUANTILE_ACCURACY = 0.01
+# count-min error as a share of all transactions, and the probability of exceeding it
+COUNT_MIN_EPSILON = 0.00001
+COUNT_MIN_DELTA = 0.01
+# the number of heavy hitter candidates tracked per role
+HEAVY_HITTER_CAPACITY = 100
+# the quantiles reported for "amount"
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+# the account ID column of every role
+ROLE_COLUMNS = {"initiator": "initiator_id", "target": "target_id"}
+
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    """Hash values (ex. account IDs) to 64-bit integers for the sketches
+
+    Sketches merged together must hash the same representation of a value (ex. string
+    account IDs, not the codes of different lookup tables).
+
+    Args:
+        values (np.ndarray): The values to hash
+
+    Returns:
+        np.ndarray: One uint64 hash per value
+    """
+
+    return pd.util.hash_array(np.asarray(values))
+
+
+class HyperLogLog:
+    """Mergeable estimate of the number of distinct values in fixed memory (2^precision bytes)."""
+
+    def __init__(self, precision: int = TOTAL_PRECISION):
+        """Create an empty sketch
+
+        Args:
+            precision (int, optional): The number of index bits (4 to 18). Defaults to TOTAL_PRECISION.
+        """
+
+        # assert that the precision is supported
+        assert 4 <= precision <= 18
+
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def standard_error(self) -> float:
+        """The relative standard error of the estimate"""
+        return 1.04 / math.sqrt(self.registers.shape[0])
+
+    def add(self, hashes: np.ndarray) -> None:
+        """Add hashed values
+
+        Args:
+            hashes (np.ndarray): uint64 hashes (see hash_values)
+        """
+
+        index, rank = hll_positions(hashes, self.precision)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        """Add the values of another sketch (of the same precision)
+
+        Args:
+            other (HyperLogLog): The sketch to merge
+
+        Returns:
+            HyperLogLog: self
+        """
+
+        # assert that the registers line up
+        assert self.precision == other.precision
+
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        """Estimate the number of distinct values
+
+        Returns:
+            float: The estimate (within standard_error of the truth about 68% of the time)
+        """
+
+        m = self.registers.shape[0]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+
+        # small cardinalities -> linear counting of the empty registers
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros > 0:
+            return m * math.log(m / zeros)
+        # no large range correction is needed with 64-bit hashes
+        return raw
+
+
+def hll_positions(hashes: np.ndarray, precision: int) -> tuple:
+    """The register and rank of every hash of a HyperLogLog sketch
+
+    Args:
+        hashes (np.ndarray): uint64 hashes
+        precision (int): The number of index bits
+
+    Returns:
+        tuple: The register index and rank (position of the first 1 bit after the index bits)
+    """
+
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    # the first precision bits pick the register
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    # the rank is the number of leading zeros of the remaining bits + 1
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (64 - precision) - _bit_length(rest) + 1
+
+    return index, rank.astype(np.uint8)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length of uint64 values
+
+    Args:
+        values (np.ndarray): uint64 values
+
+    Returns:
+        np.ndarray: The number of bits needed to represent every value (0 for 0)
+    """
+
+    # 32-bit halves convert to float64 exactly, so log2 never rounds across a power of 2
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+
+    def length(half: np.ndarray) -> np.ndarray:
+        return np.where(
+            half > 0, np.floor(np.log2(np.maximum(half, 1))).astype(np.int64) + 1, 0
+        )
+
+    return np.where(high > 0, 32 + length(high), length(low))
+
+
+class QuantileSketch:
+    """Mergeable quantiles of non-negative values with a relative error guarantee.
+
+    Values are counted in logarithmic buckets (DDSketch): every quantile is within
+    relative_accuracy of the true value and the number of buckets only grows with the
+    log of the value range (ex. ~1,200 buckets for 0.01 to 100M at 1%).
+    """
+
+    def __init__(self, relative_accuracy: float = QUANTILE_ACCURACY):
+        """Create an empty sketch
+
+        Args:
+            relative_accuracy (float, optional): The relative error of every quantile. Defaults to QUANTILE_ACCURACY.
+        """
+
+        # assert that the accuracy is usable
+        assert 0 < relative_accuracy < 1
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # bucket i counts the values in (gamma^(i - 1), gamma^i], starting at offset
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        # values of zero (or less) have no bucket
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray) -> None:
+        """Add values
+
+        Args:
+            values (np.ndarray): Non-negative values (ex. transaction amounts)
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zero_count += values.shape[0] - positive.shape[0]
+        self.count += values.shape[0]
+
+        if positive.shape[0] > 0:
+            keys = np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64)
+            first = int(keys.min())
+            self._add_counts(first, np.bincount(keys - first))
+
+    def merge(self, other: "QuantileSketch"):
+        """Add the values of another sketch (of the same accuracy)
+
+        Args:
+            other (QuantileSketch): The sketch to merge
+
+        Returns:
+            QuantileSketch: self
+        """
+
+        # assert that the buckets line up
+        assert self.relative_accuracy == other.relative_accuracy
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.counts.shape[0] > 0:
+            self._add_counts(other.offset, other.counts)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile
+
+        Args:
+            q (float): The quantile (0 to 1)
+
+        Returns:
+            float: The estimate (NaN for an empty sketch)
+        """
+
+        if self.count == 0:
+            return np.nan
+
+        # the (0-based) rank of the quantile
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        # the bucket holding the rank, represented by the value with the smallest relative error
+        bucket = np.searchsorted(
+            np.cumsum(self.counts), rank - self.zero_count, side="right"
+        )
+        return 2 * self.gamma ** (self.offset + int(bucket)) / (self.gamma + 1)
+
+    def _add_counts(self, offset: int, counts: np.ndarray) -> None:
+        """Add bucket counts starting at bucket offset, growing the buckets as needed
+
+        Args:
+            offset (int): The bucket of counts[0]
+            counts (np.ndarray): Consecutive bucket counts
+        """
+
+        # the first time -> take the buckets as they are
+        if self.counts.shape[0] == 0:
+            self.offset, self.counts = offset, counts.astype(np.int64)
+            return
+
+        # widen the buckets to cover both ranges
+        start = min(self.offset, offset)
+        end = max(self.offset + self.counts.shape[0], offset + counts.shape[0])
+        merged = np.zeros(end - start, dtype=np.int64)
+        merged[
+            self.offset - start : self.offset - start + self.counts.shape[0]
+        ] += self.counts
+        merged[offset - start : offset - start + counts.shape[0]] += counts
+        self.offset, self.counts = start, merged
+
+
+class CountMinSketch:
+    """Mergeable frequency estimates with a bounded set of heavy hitter candidates.
+
+    Every estimate is at least the true count and, with probability 1 - delta, at most
+    epsilon * total above it. The candidates with the highest estimates are kept (up to
+    capacity), so heavy hitters are found without storing every key.
+    """
+
+    def __init__(
+        self,
+        epsilon: float = COUNT_MIN_EPSILON,
+        delta: float = COUNT_MIN_DELTA,
+        capacity: int = HEAVY_HITTER_CAPACITY,
+    ):
+        """Create an empty sketch
+
+        Args:
+            epsilon (float, optional): The error as a share of the total count. Defaults to COUNT_MIN_EPSILON.
+            delta (float, optional): The probability of exceeding the error. Defaults to COUNT_MIN_DELTA.
+            capacity (int, optional): The number of heavy hitter candidates kept. Defaults to HEAVY_HITTER_CAPACITY.
+        """
+
+        self.epsilon = epsilon
+        self.delta = delta
+        self.capacity = capacity
+        # width e / epsilon and depth ln(1 / delta) give the error bound
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int32)
+        self.total = 0
+        # the heavy hitter candidates and their hashes
+        self.candidates = np.empty(0, dtype=object)
+        self.candidate_hashes = np.empty(0, dtype=np.uint64)
+
+    @property
+    def error_bound(self) -> float:
+        """The maximum overcount of any estimate (with probability 1 - delta)"""
+        return self.epsilon * self.total
+
+    def add(self, keys: np.ndarray, hashes: np.ndarray = None) -> None:
+        """Count keys
+
+        Args:
+            keys (np.ndarray): The keys (ex. account IDs)
+            hashes (np.ndarray, optional): Their hashes (see hash_values). Defaults to None (hash the keys).
+        """
+
+        keys = np.asarray(keys)
+        hashes = hash_values(keys) if hashes is None else hashes
+
+        # one counter per row
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns, minlength=self.width).astype(
+                np.int32
+            )
+        self.total += keys.shape[0]
+
+        # the distinct keys of the batch compete with the current candidates
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        self._keep_top(keys[first], unique_hashes)
+
+    def merge(self, other: "CountMinSketch"):
+        """Add the counts of another sketch (of the same dimensions)
+
+        Args:
+            other (CountMinSketch): The sketch to merge
+
+        Returns:
+            CountMinSketch: self
+        """
+
+        # assert that the counters line up
+        assert self.table.shape == other.table.shape
+
+        self.table += other.table
+        self.total += other.total
+        self._keep_top(other.candidates, other.candidate_hashes)
+        return self
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimate the counts of hashed keys
+
+        Args:
+            hashes (np.ndarray): uint64 hashes (see hash_values)
+
+        Returns:
+            np.ndarray: The estimated count of every key (never below the true count)
+        """
+
+        return np.min(
+            [
+                self.table[row, columns]
+                for row, columns in enumerate(self._columns(hashes))
+            ],
+            axis=0,
+        ).astype(np.int64)
+
+    def heavy_hitters(self, top: int = 10) -> pd.DataFrame:
+        """The candidates with the highest estimated counts
+
+        Args:
+            top (int, optional): The number of heavy hitters. Defaults to 10.
+
+        Returns:
+            pd.DataFrame: The key, estimated count and lower bound of the true count
+        """
+
+        estimates = self.estimate(self.candidate_hashes)
+        # ties are broken by key so the order does not depend on the merge order
+        order = np.lexsort((self.candidates.astype(str), -estimates))[:top]
+        return pd.DataFrame(
+            {
+                "key": self.candidates[order],
+                "estimated_count": estimates[order],
+                "min_count": np.maximum(
+                    estimates[order] - math.floor(self.error_bound), 0
+                ),
+            }
+        )
+
+    def _columns(self, hashes: np.ndarray) -> list:
+        """The counter of every hash in every row (double hashing of the two 32-bit halves)
+
+        Args:
+            hashes (np.ndarray): uint64 hashes
+
+        Returns:
+            list: One array of counter positions per row
+        """
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        high = (hashes >> np.uint64(32)).astype(np.int64)
+        return [(low + row * high) % self.width for row in range(self.depth)]
+
+    def _keep_top(self, keys: np.ndarray, hashes: np.ndarray) -> None:
+        """Merge keys into the candidates and keep the ones with the highest estimates
+
+        Args:
+            keys (np.ndarray): New candidate keys
+            hashes (np.ndarray): Their hashes
+        """
+
+        # the union of the candidates (keys are told apart by their 64-bit hash)
+        keys = np.concatenate([self.candidates, np.asarray(keys, dtype=object)])
+        hashes = np.concatenate([self.candidate_hashes, hashes])
+        hashes, first = np.unique(hashes, return_index=True)
+        keys = keys[first]
+
+        # keep the highest estimates
+        if keys.shape[0] > self.capacity:
+            top = np.argpartition(-self.estimate(hashes), self.capacity - 1)
+            keys, hashes = keys[top[: self.capacity]], hashes[top[: self.capacity]]
+        self.candidates, self.candidate_hashes = keys, hashes
+
+
+class TransactionSketches:
+    """Mergeable sketches of cleaned PaySim transactions for approximate insights.
+
+    Holds the distinct initiator and target accounts per hour and type and overall
+    (HyperLogLog), the amount quantiles (QuantileSketch) and the heavy hitter accounts
+    per role (CountMinSketch). Memory does not grow with the number of transactions.
+    """
+
+    def __init__(
+        self,
+        cell_precision: int = CELL_PRECISION,
+        total_precision: int = TOTAL_PRECISION,
+        quantile_accuracy: float = QUANTILE_ACCURACY,
+        epsilon: float = COUNT_MIN_EPSILON,
+        delta: float = COUNT_MIN_DELTA,
+    ):
+        """Create empty sketches
+
+        Args:
+            cell_precision (int, optional): HyperLogLog precision per hour and type. Defaults to CELL_PRECISION.
+            total_precision (int, optional): HyperLogLog precision overall. Defaults to TOTAL_PRECISION.
+            quantile_accuracy (float, optional): Relative accuracy of the amount quantiles. Defaults to QUANTILE_ACCURACY.
+            epsilon (float, optional): Count-min error as a share of all transactions. Defaults to COUNT_MIN_EPSILON.
+            delta (float, optional): Probability of exceeding the count-min error. Defaults to COUNT_MIN_DELTA.
+        """
+
+        self.cell_precision = cell_precision
+        self.rows = 0
+        # the number of transactions and the distinct accounts of every (hour, type) cell
+        self.cell_rows = {}
+        self.cells = {}
+        self.distinct = {role: HyperLogLog(total_precision) for role in ROLE_COLUMNS}
+        self.amount = QuantileSketch(quantile_accuracy)
+        self.heavy_hitters = {
+            role: CountMinSketch(epsilon, delta) for role in ROLE_COLUMNS
+        }
+
+    def add(self, df: pd.DataFrame) -> None:
+        """Add a chunk of cleaned transactions (string account IDs)
+
+        Args:
+            df (pd.DataFrame): The chunk
+        """
+
+        self.rows += df.shape[0]
+        self.amount.add(df["amount"].to_numpy())
+
+        # the (hour, type) cell of every transaction
+        type_codes, types = pd.factorize(df["type"])
+        codes, cells = pd.factorize(
+            df["hour"].to_numpy().astype(np.int64) * len(types) + type_codes
+        )
+        uniques = [
+            (int(cell // len(types)), str(types[cell % len(types)])) for cell in cells
+        ]
+        for key, rows in zip(uniques, np.bincount(codes)):
+            self.cell_rows[key] = self.cell_rows.get(key, 0) + int(rows)
+
+        for role, column in ROLE_COLUMNS.items():
+            keys = df[column].to_numpy()
+            hashes = hash_values(keys)
+            self.distinct[role].add(hashes)
+            self.heavy_hitters[role].add(keys, hashes)
+
+            # the registers of every cell of the chunk at once
+            index, rank = hll_positions(hashes, self.cell_precision)
+            registers = np.zeros(
+                (len(uniques), 1 << self.cell_precision), dtype=np.uint8
+            )
+            np.maximum.at(registers, (codes, index), rank)
+            for key, cell_registers in zip(uniques, registers):
+                cell = self.cells.setdefault(
+                    key,
+                    {role: HyperLogLog(self.cell_precision) for role in ROLE_COLUMNS},
+                )
+                np.maximum(
+                    cell[role].registers, cell_registers, out=cell[role].registers
+                )
+
+    def merge(self, other: "TransactionSketches"):
+        """Add the sketches of other transactions (ex. another partition)
+
+        Args:
+            other (TransactionSketches): The sketches to merge
+
+        Returns:
+            TransactionSketches: self
+        """
+
+        self.rows += other.rows
+        for key, rows in other.cell_rows.items():
+            self.cell_rows[key] = self.cell_rows.get(key, 0) + rows
+        for key, cell in other.cells.items():
+            if key in self.cells:
+                for role in ROLE_COLUMNS:
+                    self.cells[key][role].merge(cell[role])
+            else:
+                self.cells[key] = cell
+        for role in ROLE_COLUMNS:
+            self.distinct[role].merge(other.distinct[role])
+            self.heavy_hitters[role].merge(other.heavy_hitters[role])
+        self.amount.merge(other.amount)
+        return self
+
+    def report(self, quantiles: list = QUANTILES, top: int = 10) -> dict:
+        """The approximate figures with their error bounds
+
+        Args:
+            quantiles (list, optional): The amount quantiles. Defaults to QUANTILES.
+            top (int, optional): The number of heavy hitters per role. Defaults to 10.
+
+        Returns:
+            dict: "distinct", "distinct_by_hour_and_type", "amount_quantiles" and "heavy_hitters" tables
+        """
+
+        # distinct accounts overall
+        distinct = pd.DataFrame(
+            {
+                "role": list(ROLE_COLUMNS),
+                "distinct_accounts": [
+                    round(self.distinct[role].estimate()) for role in ROLE_COLUMNS
+                ],
+                "relative_std_error": [
+                    self.distinct[role].standard_error for role in ROLE_COLUMNS
+                ],
+            }
+        )
+
+        # distinct accounts per hour and type (exact transaction counts)
+        keys = sorted(self.cells)
+        by_cell = pd.DataFrame(
+            {
+                "hour": [hour for hour, _ in keys],
+                "type": [transaction_type for _, transaction_type in keys],
+                "transactions": [self.cell_rows[key] for key in keys],
+                **{
+                    f"distinct_{role}s": [
+                        round(self.cells[key][role].estimate()) for key in keys
+                    ]
+                    for role in ROLE_COLUMNS
+                },
+            }
+        )
+        by_cell["relative_std_error"] = HyperLogLog(self.cell_precision).standard_error
+
+        # amount quantiles, each within the relative accuracy of the true quantile
+        accuracy = self.amount.relative_accuracy
+        estimates = np.array([self.amount.quantile(q) for q in quantiles])
+        amount_quantiles = pd.DataFrame(
+            {
+                "quantile": quantiles,
+                "amount": estimates,
+                "lower_bound": estimates / (1 + accuracy),
+                "upper_bound": estimates / (1 - accuracy),
+            }
+        )
+
+        # heavy hitter accounts per role
+        heavy_hitters = pd.concat(
+            [
+                self.heavy_hitters[role]
+                .heavy_hitters(top)
+                .rename(columns={"key": "account_id"})
+                .assign(role=role)
+                for role in ROLE_COLUMNS
+            ],
+            ignore_index=True,
+        )
+
+        return {
+            "distinct": distinct,
+            "distinct_by_hour_and_type": by_cell,
+            "amount_quantiles": amount_quantiles,
+            "heavy_hitters": heavy_hitters,
+        }
+
+
+def sketch_transactions(
+    data: pd.DataFrame | Iterable[pd.DataFrame] | Path, chunksize: int = 1000000
+) -> TransactionSketches:
+    """Sketch cleaned transactions in one streaming pass
+
+    Args:
+        data (pd.DataFrame | Iterable[pd.DataFrame] | Path): The cleaned data, its chunks or the cleaned CSV file
+        chunksize (int, optional): The number of rows read at a time from a CSV file. Defaults to 1000000.
+
+    Returns:
+        TransactionSketches: The sketches of every transaction
+    """
+
+    # one chunk, or a lazy reader of chunks
+    if isinstance(data, pd.DataFrame):
+        chunks = [data]
+    elif isinstance(data, (str, Path)):
+        chunks = pd.read_csv(data, encoding="utf-8", chunksize=chunksize)
+    else:
+        chunks = data
+
+    sketches = TransactionSketches()
+    for chunk in chunks:
+        sketches.add(chunk)
+
+    # close the CSV reader
+    if hasattr(chunks, "close"):
+        chunks.close()
+
+    return sketches
+
+
+def print_approximate_insights(sketches: TransactionSketches) -> dict:
+    """Print the approximate insights of the sketches with their error bounds
+
+    Args:
+        sketches (TransactionSketches): The sketches of the transactions
+
+    Returns:
+        dict: The report of the sketches (see TransactionSketches.report)
+    """
+
+    report = sketches.report()
+    cms = sketches.heavy_hitters["initiator"]
+
+    # number of transactions (exact)
+    print(f"Number of Transactions: {sketches.rows}")
+    print("\n")
+
+    # distinct accounts
+    print("DISTINCT ACCOUNTS (HyperLogLog, ~68% of estimates within 1 std error):")
+    print(report["distinct"].to_string(index=False))
+    print("\n")
+    print("DISTINCT ACCOUNTS BY HOUR AND TYPE:")
+    print(report["distinct_by_hour_and_type"])
+    print("\n")
+
+    # amount quantiles
+    print(
+        f"AMOUNT QUANTILES (true quantile between the bounds, "
+        f"{sketches.amount.relative_accuracy:.0%} relative error):"
+    )
+    print(report["amount_quantiles"].to_string(index=False))
+    print("\n")
+
+    # heavy hitters
+    print(
+        f"HEAVY HITTER ACCOUNTS (count-min, true count between min_count and "
+        f"estimated_count with {1 - cms.delta:.0%} probability):"
+    )
+    print(report["heavy_hitters"].to_string(index=False))
+    print("\n")
+
+    return report
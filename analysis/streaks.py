@@ -0,0 +1,132 @@
+import pandas as pd
+import numpy as np
+
+
+def find_runs(hours: np.ndarray, min_length: int = 1) -> pd.DataFrame:
+    """Find the runs of consecutive hours with run-length encoding
+
+    Args:
+        hours (np.ndarray): Hours (any order, duplicates allowed)
+        min_length (int, optional): The minimum number of hours in a run. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: The first hour, last hour and length of every run
+    """
+
+    # sorted unique hours
+    hours = np.unique(np.asarray(hours, dtype=np.int64))
+
+    # a run starts wherever the gap to the previous hour is not exactly one
+    new_run = np.ones(hours.shape[0], dtype=bool)
+    new_run[1:] = np.diff(hours) != 1
+    starts = np.flatnonzero(new_run)
+    # a run ends just before the next run starts
+    ends = np.append(starts[1:], hours.shape[0])[: starts.shape[0]] - 1
+
+    # build the runs
+    runs = pd.DataFrame(
+        {
+            "start_hour": hours[starts],
+            "end_hour": hours[ends],
+            "length": ends - starts + 1,
+        }
+    )
+
+    # keep the runs of at least min_length hours
+    return runs[runs["length"] >= min_length].reset_index(drop=True)
+
+
+def hourly_streaks(
+    transactions_by_hour: pd.DataFrame, predicate: pd.Series, min_length: int = 2
+) -> pd.DataFrame:
+    """Find streaks of consecutive hours for which a predicate holds
+
+    ex. hourly_streaks(df, df["percentage_of_fradulent_transactions"] > 50)
+    or hourly_streaks(df, df["volume"] > df["volume"].mean() + 3 * df["volume"].std())
+
+    Args:
+        transactions_by_hour (pd.DataFrame): The output of transactional_data_per_hour
+        predicate (pd.Series): Boolean per row of transactions_by_hour
+        min_length (int, optional): The minimum number of hours in a streak. Defaults to 2.
+
+    Returns:
+        pd.DataFrame: The first hour, last hour and length of every streak
+    """
+
+    # hours for which the predicate holds
+    hours = transactions_by_hour["hour"].to_numpy()[predicate.to_numpy(dtype=bool)]
+
+    # return the runs of consecutive hours
+    return find_runs(hours, min_length)
+
+
+def account_streaks(
+    df: pd.DataFrame,
+    role: str = "initiator",
+    min_length: int = 2,
+    account_ids: pd.Index = None,
+) -> pd.DataFrame:
+    """Find, for every account, the runs of consecutive hours in which it transacted
+
+    Args:
+        df (pd.DataFrame): The cleaned transaction data (default or compact dtypes)
+        role (str, optional): "initiator", "target" or "both". Defaults to "initiator".
+        min_length (int, optional): The minimum number of hours in a streak. Defaults to 2.
+        account_ids (pd.Index, optional): The account ID lookup table of a compact df, used to return the original account IDs. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The account, first hour, last hour and length of every streak (longest first)
+    """
+
+    # assert that the role is supported
+    assert role in ("initiator", "target", "both")
+
+    # no transactions -> no streaks
+    if df.shape[0] == 0:
+        return pd.DataFrame(
+            {
+                "account_id": pd.Series(dtype=object),
+                "start_hour": pd.Series(dtype=np.int64),
+                "end_hour": pd.Series(dtype=np.int64),
+                "length": pd.Series(dtype=np.int64),
+            }
+        )
+
+    # the (account, hour) pairs of the requested role(s)
+    columns = ["initiator_id", "target_id"] if role == "both" else [f"{role}_id"]
+    accounts = np.concatenate([df[column].to_numpy() for column in columns])
+    hours = np.tile(df["hour"].to_numpy(np.int64), len(columns))
+
+    # encode the accounts and sort the unique (account, hour) pairs
+    codes, uniques = pd.factorize(accounts)
+    stride = hours.max() + 2
+    keys = np.unique(codes.astype(np.int64) * stride + hours)
+    codes, hours = keys // stride, keys % stride
+
+    # a run starts at a new account or after a gap of more than one hour
+    new_run = np.ones(keys.shape[0], dtype=bool)
+    new_run[1:] = (np.diff(codes) != 0) | (np.diff(hours) != 1)
+    starts = np.flatnonzero(new_run)
+    ends = np.append(starts[1:], keys.shape[0])[: starts.shape[0]] - 1
+
+    # the account of every streak (the original account IDs of a compact df)
+    accounts = np.asarray(uniques).take(codes[starts])
+    if account_ids is not None:
+        accounts = account_ids.take(accounts).to_numpy()
+
+    # build the streaks
+    streaks = pd.DataFrame(
+        {
+            "account_id": accounts,
+            "start_hour": hours[starts],
+            "end_hour": hours[ends],
+            "length": ends - starts + 1,
+        }
+    )
+
+    # keep the streaks of at least min_length hours, longest first
+    return (
+        streaks[streaks["length"] >= min_length]
+        .sort_values(["length", "start_hour"], ascending=[False, True], kind="stable")
+        .reset_index(drop=True)
+    )
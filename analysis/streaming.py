@@ -0,0 +1,217 @@
+import pandas as pd
+import numpy as np
+
+from typing import Callable, Iterator
+from pathlib import Path
+import threading
+import queue
+import time
+import io
+
+from analysis.features import AccountHistory
+from analysis.fraud_detection import score_transactions
+
+# marks the end of a stream of transactions
+END_OF_STREAM = None
+
+
+def replay_producer(
+    df: pd.DataFrame, source: queue.Queue, rate: float = None
+) -> threading.Thread:
+    """Local stand-in producer that replays transactions into a queue
+
+    Args:
+        df (pd.DataFrame): The transactions to replay
+        source (queue.Queue): The queue the transactions are put on
+        rate (float, optional): Transactions per second. Defaults to None (as fast as possible).
+
+    Returns:
+        threading.Thread: The started producer thread
+    """
+
+    def produce() -> None:
+        # start of the replay
+        start = time.perf_counter()
+        for i, transaction in enumerate(df.to_dict("records")):
+            # throttle to the requested rate
+            if rate is not None:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            # stamp every transaction with its arrival time
+            source.put((time.perf_counter(), transaction))
+        # signal the end of the stream
+        source.put(END_OF_STREAM)
+
+    # run the producer in the background
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    return producer
+
+
+def tail_producer(
+    path: Path,
+    source: queue.Queue,
+    stop: threading.Event,
+    poll_interval: float = 0.1,
+) -> threading.Thread:
+    """Producer that follows a cleaned CSV file and puts every appended transaction on a queue
+
+    Args:
+        path (Path): The CSV file (with a header line) that transactions are appended to
+        source (queue.Queue): The queue the transactions are put on
+        stop (threading.Event): Ends the stream when set
+        poll_interval (float, optional): Seconds between checks for new lines. Defaults to 0.1.
+
+    Returns:
+        threading.Thread: The started producer thread
+    """
+
+    def produce() -> None:
+        with open(path, "rb") as fd:
+            # the column names of the file
+            columns = fd.readline().decode("utf-8").strip().split(",")
+            # bytes of an incomplete last line
+            pending = b""
+            while not stop.is_set():
+                data = pending + fd.read()
+                # only parse complete lines (the writer may be mid-line)
+                complete = data.rfind(b"\n") + 1
+                pending = data[complete:]
+                if complete == 0:
+                    time.sleep(poll_interval)
+                    continue
+
+                # arrival time of the new lines
+                arrived = time.perf_counter()
+                # parse the new lines in one go
+                rows = pd.read_csv(
+                    io.BytesIO(data[:complete]), header=None, names=columns
+                )
+                for transaction in rows.to_dict("records"):
+                    source.put((arrived, transaction))
+        # signal the end of the stream
+        source.put(END_OF_STREAM)
+
+    # run the producer in the background
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    return producer
+
+
+def micro_batches(
+    source: queue.Queue, max_batch_size: int = 1000, max_wait: float = 0.05
+) -> Iterator[list]:
+    """Group the transactions of a queue into micro-batches bounded by size and time
+
+    A batch is emitted when it holds max_batch_size transactions or when max_wait seconds
+    have passed since its first transaction arrived, whichever comes first.
+
+    Args:
+        source (queue.Queue): Holds (arrival time, transaction) tuples and END_OF_STREAM at the end
+        max_batch_size (int, optional): The maximum number of transactions per batch. Defaults to 1000.
+        max_wait (float, optional): The maximum seconds a transaction waits for its batch to fill. Defaults to 0.05.
+
+    Yields:
+        Iterator[list]: Batches of (arrival time, transaction) tuples
+    """
+
+    while True:
+        # block until the first transaction of the batch arrives
+        item = source.get()
+        if item is END_OF_STREAM:
+            return
+        batch = [item]
+        # the batch is emitted at the latest max_wait seconds after its first transaction
+        deadline = time.perf_counter() + max_wait
+
+        # fill the batch until it is full or its time is up
+        while len(batch) < max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = source.get(timeout=remaining)
+            except queue.Empty:
+                break
+            # emit the last batch at the end of the stream
+            if item is END_OF_STREAM:
+                yield batch
+                return
+            batch.append(item)
+
+        yield batch
+
+
+def stream_scores(
+    model: dict,
+    source: queue.Queue,
+    sink: Callable = None,
+    max_batch_size: int = 1000,
+    max_wait: float = 0.05,
+) -> dict:
+    """Score transactions from a queue in micro-batches and report latency and throughput
+
+    The per-account features of every batch count the transactions of the earlier
+    batches, the way they were computed over the full history for training.
+
+    Args:
+        model (dict): The output of train_fraud_model or load_fraud_model
+        source (queue.Queue): Holds (arrival time, transaction) tuples and END_OF_STREAM at the end
+        sink (Callable, optional): Called with every scored batch (transactions with a "fraud_probability" column). Defaults to None.
+        max_batch_size (int, optional): The maximum number of transactions per batch. Defaults to 1000.
+        max_wait (float, optional): The maximum seconds a transaction waits for its batch to fill. Defaults to 0.05.
+
+    Returns:
+        dict: The number of transactions and batches, p50/p99 latency (ms) and throughput (rows/s)
+    """
+
+    # latency of every transaction (seconds from arrival to score)
+    latencies = []
+    # initialize counter
+    batches = 0
+    # the recent transactions of every account, across batches
+    history = AccountHistory()
+    # start the timer
+    start = time.perf_counter()
+
+    for batch in micro_batches(source, max_batch_size, max_wait):
+        # score the batch in one call
+        arrivals = np.fromiter((arrival for arrival, _ in batch), float, len(batch))
+        transactions = pd.DataFrame([transaction for _, transaction in batch])
+        transactions["fraud_probability"] = score_transactions(
+            model, transactions, history
+        )
+
+        # record the latency of every transaction of the batch
+        latencies.append(time.perf_counter() - arrivals)
+        batches += 1
+
+        # emit the scores
+        if sink is not None:
+            sink(transactions)
+
+    # elapsed time of the stream
+    seconds = time.perf_counter() - start
+    latencies = np.concatenate(latencies) if latencies else np.empty(0)
+
+    # latency and throughput of the stream
+    metrics = {
+        "transactions": latencies.shape[0],
+        "batches": batches,
+        "p50_latency_ms": round(float(np.percentile(latencies, 50)) * 1000, 2)
+        if latencies.shape[0]
+        else None,
+        "p99_latency_ms": round(float(np.percentile(latencies, 99)) * 1000, 2)
+        if latencies.shape[0]
+        else None,
+        "rows_per_second": round(latencies.shape[0] / seconds) if seconds else None,
+    }
+    # report the metrics
+    print(
+        f"Scored {metrics['transactions']} transactions in {metrics['batches']} batches: "
+        f"p50 {metrics['p50_latency_ms']} ms, p99 {metrics['p99_latency_ms']} ms, "
+        f"{metrics['rows_per_second']} rows/s"
+    )
+
+    return metrics
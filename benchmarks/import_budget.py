@@ -0,0 +1,94 @@
+from pathlib import Path
+import subprocess
+import argparse
+import json
+import sys
+
+# the root of the repository
+REPO_DIR = Path(__file__).resolve().parent.parent
+# the modules imported before any subcommand runs, with their import-time budget (seconds)
+BUDGETS = {
+    # argument parsing only -> `python main.py --help`
+    "main": 0.1,
+    # the stage DAG (pandas and pyarrow) used by every pipeline subcommand
+    "pipeline.stages": 1.0,
+}
+# heavy dependencies that only the stages using them may import
+HEAVY_MODULES = ["pandera", "sklearn", "mysql", "dotenv", "seaborn", "matplotlib"]
+# the number of fresh interpreters per module (the fastest run is kept)
+REPEATS = 5
+
+# run in a fresh interpreter: import the module and report its time and heavy imports
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def measure_import(module: str, repeats: int = REPEATS) -> dict:
+    """Measure the import time of a module in fresh interpreters
+
+    Args:
+        module (str): The module to import (ex. "pipeline.stages")
+        repeats (int, optional): The number of fresh interpreters. Defaults to REPEATS.
+
+    Returns:
+        dict: The fastest import time in seconds and the heavy modules it pulled in
+    """
+
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output))
+
+    # the fastest run is the least disturbed by the rest of the machine
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def check_budgets(budgets: dict = BUDGETS, repeats: int = REPEATS) -> bool:
+    """Check every module against its import-time budget and the heavy module list
+
+    Args:
+        budgets (dict, optional): The budget in seconds per module. Defaults to BUDGETS.
+        repeats (int, optional): The number of fresh interpreters per module. Defaults to REPEATS.
+
+    Returns:
+        bool: True when every module is within budget and imports no heavy module
+    """
+
+    within_budget = True
+    for module, budget in budgets.items():
+        run = measure_import(module, repeats)
+        ok = run["seconds"] <= budget and not run["heavy"]
+        within_budget &= ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {module}: {run['seconds']:.3f}s "
+            f"(budget {budget:.3f}s)"
+            + (f", imports {', '.join(run['heavy'])}" if run["heavy"] else "")
+        )
+
+    return within_budget
+
+
+if __name__ == "__main__":
+    # parse the number of repeats from the command line
+    parser = argparse.ArgumentParser(
+        description="Check the import time of the CLI against its budget"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=REPEATS, help="Fresh interpreters per module"
+    )
+    args = parser.parse_args()
+
+    # a non-zero exit status fails CI
+    sys.exit(0 if check_budgets(repeats=args.repeats) else 1)
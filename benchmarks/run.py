@@ -0,0 +1,296 @@
+import pandas as pd
+
+from pathlib import Path
+import multiprocessing
+import subprocess
+import argparse
+import resource
+import datetime
+import json
+import time
+import os
+
+from benchmarks.synthetic import generate_paysim
+
+# where the generated data and the results are stored
+BENCH_DIR = "./data/bench"
+# the root of the repository
+REPO_DIR = Path(__file__).resolve().parent.parent
+# the stages of main.py in pipeline order
+STAGES = [
+    "clean_df",
+    "validate_df",
+    "transactional_data_per_hour",
+    "create_pivot_table",
+    "fraud_detection",
+    "load_csv_into_mysql",
+]
+
+
+def run_benchmarks(
+    sizes: list, stages: list = STAGES, bench_dir: Path = BENCH_DIR
+) -> list:
+    """Benchmark pipeline stages on synthetic PaySim data of several sizes
+
+    Every stage runs in a fresh process so its peak RSS is not inflated by earlier stages.
+    The results are appended to results.jsonl in bench_dir, tagged with the git commit.
+
+    Args:
+        sizes (list): The numbers of rows to benchmark (ex. [1000000, 6000000, 60000000])
+        stages (list, optional): The stages to benchmark. Defaults to STAGES.
+        bench_dir (Path, optional): Where the generated data and results are stored. Defaults to BENCH_DIR.
+
+    Returns:
+        list: One result record per size and stage
+    """
+
+    # work inside the benchmark directory (the stages write to ./data/output)
+    bench_dir = Path(bench_dir).resolve()
+    (bench_dir / "data" / "output").mkdir(parents=True, exist_ok=True)
+    commit = _git_commit()
+
+    # initialize list of results
+    results = []
+    for rows in sizes:
+        # generate the raw and cleaned data once per size
+        raw_path = bench_dir / f"paysim_{rows}.csv"
+        cleaned_path = bench_dir / f"cleaned_paysim_{rows}.csv"
+        if not raw_path.exists():
+            generate_paysim(raw_path, rows)
+        if not cleaned_path.exists() and stages != ["clean_df"]:
+            _run_in_process("clean_df", raw_path, cleaned_path, bench_dir)
+
+        for stage in stages:
+            # measure the stage in its own process
+            measurement = _run_in_process(stage, raw_path, cleaned_path, bench_dir)
+            record = {
+                "commit": commit,
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "rows": rows,
+                "stage": stage,
+                **measurement,
+                "rows_per_second": round(rows / measurement["seconds"]),
+            }
+            results.append(record)
+            # print to log
+            print(json.dumps(record))
+
+    # append the results to the results file
+    with open(bench_dir / "results.jsonl", "a") as fd:
+        for record in results:
+            fd.write(json.dumps(record) + "\n")
+
+    return results
+
+
+def compare_results(base: str, head: str, bench_dir: Path = BENCH_DIR) -> pd.DataFrame:
+    """Compare the benchmark results of two commits
+
+    Args:
+        base (str): The (prefix of the) baseline commit
+        head (str): The (prefix of the) commit to compare with the baseline
+        bench_dir (Path, optional): Where the results are stored. Defaults to BENCH_DIR.
+
+    Returns:
+        pd.DataFrame: Wall time, peak RSS and their ratios per size and stage
+    """
+
+    # read every result
+    results = pd.read_json(Path(bench_dir) / "results.jsonl", lines=True)
+
+    def latest(commit: str) -> pd.DataFrame:
+        # the latest result per size and stage of a commit
+        runs = results[results["commit"].str.startswith(commit)]
+        return runs.groupby(["rows", "stage"])[["seconds", "peak_rss_mb"]].last()
+
+    # join the two commits and compute the ratios
+    comparison = latest(base).join(latest(head), lsuffix="_base", rsuffix="_head")
+    comparison["speedup"] = (
+        comparison["seconds_base"] / comparison["seconds_head"]
+    ).round(2)
+    comparison["memory_ratio"] = (
+        comparison["peak_rss_mb_head"] / comparison["peak_rss_mb_base"]
+    ).round(2)
+
+    return comparison
+
+
+def _run_in_process(
+    stage: str, raw_path: Path, cleaned_path: Path, bench_dir: Path
+) -> dict:
+    """Run one stage in a fresh process and return its measurements
+
+    Args:
+        stage (str): The name of the stage
+        raw_path (Path): The raw synthetic data
+        cleaned_path (Path): The cleaned synthetic data
+        bench_dir (Path): The working directory of the stage
+
+    Returns:
+        dict: Wall time, peak RSS and RSS growth during the stage
+    """
+
+    # run the stage in a child process and receive its measurements
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_measure_stage, args=(stage, raw_path, cleaned_path, bench_dir, sender)
+    )
+    process.start()
+    measurement = receiver.recv()
+    process.join()
+
+    # re-raise the error of the stage
+    if "error" in measurement:
+        raise RuntimeError(f"{stage} failed: {measurement['error']}")
+
+    return measurement
+
+
+def _measure_stage(
+    stage: str, raw_path: Path, cleaned_path: Path, bench_dir: Path, sender
+) -> None:
+    """Load the inputs of a stage, then time it and measure its peak RSS (runs in the child)
+
+    Args:
+        stage (str): The name of the stage
+        raw_path (Path): The raw synthetic data
+        cleaned_path (Path): The cleaned synthetic data
+        bench_dir (Path): The working directory of the stage
+        sender: The pipe the measurements are sent through
+    """
+
+    try:
+        # the stages write their outputs to ./data/output
+        os.chdir(bench_dir)
+        # load the inputs (not measured)
+        run = _prepare_stage(stage, raw_path, cleaned_path, bench_dir)
+
+        # peak RSS before the stage (KB on Linux)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # time the stage
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        # peak RSS after the stage
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        sender.send(
+            {
+                "seconds": round(seconds, 3),
+                "peak_rss_mb": round(rss_after / 1024, 1),
+                "rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+            }
+        )
+    except Exception as err:
+        sender.send({"error": repr(err)})
+
+
+def _prepare_stage(stage: str, raw_path: Path, cleaned_path: Path, bench_dir: Path):
+    """Load the inputs of a stage and return a callable that runs it
+
+    Args:
+        stage (str): The name of the stage
+        raw_path (Path): The raw synthetic data
+        cleaned_path (Path): The cleaned synthetic data
+        bench_dir (Path): The working directory of the stage
+
+    Returns:
+        Callable: Runs the stage
+    """
+
+    # every stage imports only its own module so the RSS of the process reflects that stage
+    if stage == "clean_df":
+        from data_prep.clean import clean_df
+
+        return lambda: clean_df(raw_path, output_path=cleaned_path)
+
+    if stage == "validate_df":
+        from data_prep.validate import validate_df
+
+        return lambda: validate_df(cleaned_path)
+
+    if stage == "load_csv_into_mysql":
+        from load_data.to_mysql_table import bulk_load, sqlite_connect
+
+        # load into a fresh SQLite stand-in
+        db_path = bench_dir / "bench.db"
+        db_path.unlink(missing_ok=True)
+        return lambda: bulk_load(cleaned_path, lambda: sqlite_connect(db_path))
+
+    # the analyses take the cleaned frame
+    df = pd.read_csv(cleaned_path, encoding="utf-8")
+
+    if stage == "transactional_data_per_hour":
+        from analysis.filter_data import transactional_data_per_hour
+
+        return lambda: transactional_data_per_hour(df, 1, 743)
+
+    if stage == "create_pivot_table":
+        from analysis.filter_data import create_pivot_table
+
+        return lambda: create_pivot_table(df)
+
+    if stage == "fraud_detection":
+        from analysis.fraud_detection import fraud_detection
+
+        return lambda: fraud_detection(df)
+
+    raise ValueError(f"Unknown stage -> {stage}")
+
+
+def _git_commit() -> str:
+    """The commit the benchmarks run on
+
+    Returns:
+        str: The hash of HEAD (with "-dirty" for uncommitted changes, "unknown" outside git)
+    """
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    # parse the sizes and stages from the command line
+    parser = argparse.ArgumentParser(description="Benchmark the PaySim pipeline")
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[1000000],
+        help="Dataset sizes, ex. --rows 1000000 6000000 60000000",
+    )
+    parser.add_argument(
+        "--stage", action="append", choices=STAGES, help="Benchmark only this stage"
+    )
+    parser.add_argument("--bench-dir", default=BENCH_DIR, help="Data/results directory")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASE", "HEAD"),
+        help="Compare the stored results of two commits instead of running",
+    )
+    args = parser.parse_args()
+
+    # compare two commits
+    if args.compare:
+        print(compare_results(*args.compare, bench_dir=args.bench_dir).to_string())
+    # run the benchmarks
+    else:
+        run_benchmarks(args.rows, args.stage or STAGES, args.bench_dir)
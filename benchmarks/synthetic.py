@@ -0,0 +1,164 @@
+import pandas as pd
+import numpy as np
+
+from pathlib import Path
+import argparse
+
+# the transaction types and how often they occur in PaySim
+TYPE_SHARES = {
+    "CASH_OUT": 0.352,
+    "PAYMENT": 0.338,
+    "CASH_IN": 0.220,
+    "TRANSFER": 0.084,
+    "DEBIT": 0.006,
+}
+# the share of TRANSFER and CASH_OUT transactions that are fraudulent
+FRAUD_RATE = 0.004
+# the share of money values written with the dirty prefixes clean_df has to strip
+DIRTY_RATE = 0.02
+# the number of hours (steps) in a month of PaySim data
+HOURS = 743
+
+
+def generate_paysim(
+    path: Path, rows: int, seed: int = 121, chunksize: int = 1000000
+) -> None:
+    """Write a deterministic synthetic dataset with the raw PaySim schema
+
+    The same rows, seed and chunksize always produce the same file. Rows are written in
+    chunks so any size can be generated in bounded memory.
+
+    Args:
+        path (Path): Where the CSV file is written
+        rows (int): The number of transactions (ex. 1M, 6M or 60M)
+        seed (int, optional): The random seed. Defaults to 121.
+        chunksize (int, optional): The number of rows generated at a time. Defaults to 1000000.
+    """
+
+    # create the output directory
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    for chunk_number, start in enumerate(range(0, rows, chunksize)):
+        # every chunk has its own deterministic random stream
+        rng = np.random.default_rng([seed, chunk_number])
+        chunk = _generate_chunk(rng, start, min(chunksize, rows - start), rows)
+
+        # append the chunk to the CSV file
+        chunk.to_csv(
+            path,
+            mode="w" if chunk_number == 0 else "a",
+            header=chunk_number == 0,
+            index=False,
+            encoding="utf-8",
+        )
+
+
+def _generate_chunk(
+    rng: np.random.Generator, start: int, size: int, rows: int
+) -> pd.DataFrame:
+    """Generate one chunk of raw PaySim rows
+
+    Args:
+        rng (np.random.Generator): The random stream of the chunk
+        start (int): The position of the first row of the chunk in the dataset
+        size (int): The number of rows in the chunk
+        rows (int): The number of rows in the dataset
+
+    Returns:
+        pd.DataFrame: Raw PaySim rows
+    """
+
+    # hours increase with the position in the file, like PaySim's steps
+    step = 1 + (np.arange(start, start + size, dtype=np.int64) * HOURS) // rows
+
+    # transaction types
+    types = rng.choice(list(TYPE_SHARES), size=size, p=list(TYPE_SHARES.values()))
+    # log-normal amounts (median around 75k)
+    amount = np.round(rng.lognormal(11.2, 1.3, size), 2)
+
+    # fraud only happens in TRANSFER and CASH_OUT transactions
+    is_fraud = (np.isin(types, ["TRANSFER", "CASH_OUT"])) & (
+        rng.random(size) < FRAUD_RATE
+    )
+    # PaySim flags fraudulent transfers over 200k
+    is_flagged = is_fraud & (types == "TRANSFER") & (amount > 200000)
+
+    # balances of the initiator (fraud empties the account)
+    initiator_old = np.round(rng.exponential(150000, size), 2)
+    initiator_old[is_fraud] = amount[is_fraud]
+    initiator_new = np.round(np.clip(initiator_old - amount, 0, None), 2)
+    # balances of the target (merchants have no balances)
+    merchant = types == "PAYMENT"
+    target_old = np.round(rng.exponential(800000, size), 2)
+    target_old[merchant] = 0
+    target_new = np.round(target_old + amount, 2)
+    target_new[merchant] = 0
+
+    # customer accounts (C...) and merchant accounts (M...)
+    accounts = max(rows // 3, 1)
+    initiator_id = _account_ids("C", rng.integers(0, accounts, size))
+    target_id = _account_ids("C", rng.integers(0, accounts, size))
+    target_id[merchant] = _account_ids("M", rng.integers(0, accounts, merchant.sum()))
+
+    # build the chunk with the raw PaySim column names
+    return pd.DataFrame(
+        {
+            "step": step,
+            "type": types,
+            "amount": _dirty(rng, amount),
+            "nameOrig": initiator_id,
+            "oldbalanceOrg": _dirty(rng, initiator_old),
+            "newbalanceOrig": _dirty(rng, initiator_new),
+            "nameDest": target_id,
+            "oldbalanceDest": _dirty(rng, target_old),
+            "newbalanceDest": _dirty(rng, target_new),
+            "isFraud": is_fraud.astype(np.int8),
+            "isFlaggedFraud": is_flagged.astype(np.int8),
+        }
+    )
+
+
+def _account_ids(prefix: str, numbers: np.ndarray) -> np.ndarray:
+    """Format account numbers as PaySim account IDs
+
+    Args:
+        prefix (str): "C" for customers or "M" for merchants
+        numbers (np.ndarray): Account numbers
+
+    Returns:
+        np.ndarray: Account IDs like C1231006815
+    """
+
+    return np.char.add(prefix, (numbers + 1000000000).astype(str)).astype(object)
+
+
+def _dirty(rng: np.random.Generator, values: np.ndarray) -> np.ndarray:
+    """Format money values, prefixing some of them the way the raw extract does
+
+    Args:
+        rng (np.random.Generator): The random stream of the chunk
+        values (np.ndarray): Money values
+
+    Returns:
+        np.ndarray: The formatted values ("$", " $" or "USD " prefixes on DIRTY_RATE of them)
+    """
+
+    # format with two decimals
+    formatted = np.char.mod("%.2f", values).astype(object)
+    # prefix a share of the values
+    dirty = rng.random(values.shape[0]) < DIRTY_RATE
+    prefixes = rng.choice(["$", " $", "USD "], size=dirty.sum())
+    formatted[dirty] = np.char.add(prefixes, formatted[dirty].astype(str))
+
+    return formatted
+
+
+if __name__ == "__main__":
+    # parse the size and destination from the command line
+    parser = argparse.ArgumentParser(description="Generate synthetic PaySim data")
+    parser.add_argument("rows", type=int, help="Number of transactions, ex. 6000000")
+    parser.add_argument("path", help="Where the CSV file is written")
+    parser.add_argument("--seed", type=int, default=121, help="Random seed")
+    args = parser.parse_args()
+
+    generate_paysim(args.path, args.rows, args.seed)
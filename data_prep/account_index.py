@@ -0,0 +1,202 @@
+from pyarrow import feather
+import pandas as pd
+import numpy as np
+
+from pathlib import Path
+import shutil
+import os
+
+# where the account index of the cleaned data is stored
+INDEX_DIR = "./data/index/accounts"
+# the account ID columns the data is clustered by, by role
+ROLE_COLUMNS = {"initiator": "initiator_id", "target": "target_id"}
+# the file in the index directory holding the key of the data the index was built from
+KEY_NAME = "_key"
+
+
+def build_account_index(
+    df: pd.DataFrame, index_dir: Path = INDEX_DIR, first_row: int = 0
+) -> Path:
+    """Add the cleaned rows to the account index as a new segment
+
+    A segment holds the rows twice, clustered (sorted) by initiator_id and by target_id,
+    as uncompressed feather files that are memory mapped on lookup. Next to each copy,
+    the sorted account IDs and the offset of their first row are stored as .npy files,
+    so a lookup is a binary search over a memory-mapped array and a slice of the file.
+
+    Segments are named after the position of their first row in the cleaned data.
+    Segments at or after first_row are replaced, so appending the same rows twice (ex.
+    after a crash) is safe and first_row=0 rebuilds the index.
+
+    Args:
+        df (pd.DataFrame): Cleaned PaySim rows (string account IDs)
+        index_dir (Path, optional): Where the index is stored. Defaults to INDEX_DIR.
+        first_row (int, optional): The position of the first row of df in the cleaned data. Defaults to 0.
+
+    Returns:
+        Path: The segment directory
+    """
+
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    # the index no longer matches its key until it is written again (see write_index_key)
+    (index_dir / KEY_NAME).unlink(missing_ok=True)
+
+    # drop the segments this one replaces
+    for segment in index_segments(index_dir):
+        if int(segment.name.split("-")[1]) >= first_row:
+            shutil.rmtree(segment)
+
+    # write the segment under a temporary name so lookups never see a partial segment
+    segment = index_dir / f"segment-{first_row:012d}"
+    tmp_segment = index_dir / f".tmp-segment-{first_row:012d}"
+    shutil.rmtree(tmp_segment, ignore_errors=True)
+    tmp_segment.mkdir()
+
+    # number every row by its position in the cleaned data
+    rows = df.reset_index(drop=True)
+    rows.insert(
+        0, "row", np.arange(first_row, first_row + rows.shape[0], dtype=np.int64)
+    )
+
+    for role, column in ROLE_COLUMNS.items():
+        # cluster the rows by the account ID of the role
+        keys = rows[column].to_numpy().astype(np.bytes_)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+
+        # the first row of every account
+        accounts, starts = np.unique(keys, return_index=True)
+        offsets = np.append(starts, keys.shape[0]).astype(np.int64)
+
+        # store the clustered rows and the offset index
+        feather.write_feather(
+            rows.take(order).reset_index(drop=True),
+            tmp_segment / f"by_{role}.feather",
+            compression="uncompressed",
+        )
+        np.save(tmp_segment / f"{role}_accounts.npy", accounts)
+        np.save(tmp_segment / f"{role}_offsets.npy", offsets)
+
+    # publish the segment
+    os.replace(tmp_segment, segment)
+
+    return segment
+
+
+class AccountIndex:
+    """Point lookups of the transactions of an account in the disk-backed account index."""
+
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        """Memory map the segments of the index
+
+        Args:
+            index_dir (Path, optional): Where the index is stored. Defaults to INDEX_DIR.
+        """
+
+        # the memory-mapped offset indexes and clustered rows of every segment and role
+        self.segments = []
+        for segment in index_segments(Path(index_dir)):
+            self.segments.append(
+                {
+                    role: (
+                        np.load(segment / f"{role}_accounts.npy", mmap_mode="r"),
+                        np.load(segment / f"{role}_offsets.npy", mmap_mode="r"),
+                        feather.read_table(
+                            segment / f"by_{role}.feather", memory_map=True
+                        ),
+                    )
+                    for role in ROLE_COLUMNS
+                }
+            )
+
+    def lookup(self, account_id: str, role: str = "both") -> pd.DataFrame:
+        """All transactions of an account
+
+        Args:
+            account_id (str): The account ID (ex. C1231006815)
+            role (str, optional): "initiator" (sender), "target" (receiver) or "both". Defaults to "both".
+
+        Returns:
+            pd.DataFrame: The transactions in the order of the cleaned data, with their position in the "row" column
+        """
+
+        # assert that the role is supported
+        assert role in ("initiator", "target", "both")
+
+        roles = list(ROLE_COLUMNS) if role == "both" else [role]
+        key = np.bytes_(account_id)
+
+        # slice the rows of the account out of every segment and role
+        tables = []
+        for segment in self.segments:
+            for segment_role in roles:
+                accounts, offsets, table = segment[segment_role]
+                position = np.searchsorted(accounts, key)
+                if position < accounts.shape[0] and accounts[position] == key:
+                    start, end = offsets[position], offsets[position + 1]
+                    tables.append(table.slice(start, end - start))
+
+        # no transactions
+        if not tables:
+            return self._empty()
+
+        # a transfer to itself is found as initiator and as target
+        transactions = pd.concat([table.to_pandas() for table in tables])
+        return (
+            transactions.drop_duplicates("row")
+            .sort_values("row")
+            .reset_index(drop=True)
+        )
+
+    def _empty(self) -> pd.DataFrame:
+        """An empty result with the columns of the index
+
+        Returns:
+            pd.DataFrame: No rows
+        """
+
+        if not self.segments:
+            return pd.DataFrame()
+        return self.segments[0]["initiator"][2].schema.empty_table().to_pandas()
+
+
+def read_index_key(index_dir: Path) -> str:
+    """The key of the data the index was built from
+
+    Args:
+        index_dir (Path): Where the index is stored
+
+    Returns:
+        str: The key (None when the index is missing or was changed after it was keyed)
+    """
+
+    path = Path(index_dir) / KEY_NAME
+    return path.read_text() if path.exists() else None
+
+
+def write_index_key(index_dir: Path, key: str) -> None:
+    """Record the key of the data a complete index was built from (ex. cache_key of the raw file)
+
+    Args:
+        index_dir (Path): Where the index is stored
+        key (str): The key of the data
+    """
+
+    # write to a temporary file and move it into place
+    path = Path(index_dir) / KEY_NAME
+    Path(f"{path}.tmp").write_text(key)
+    os.replace(f"{path}.tmp", path)
+
+
+def index_segments(index_dir: Path) -> list:
+    """The published segments of the index, in row order
+
+    Args:
+        index_dir (Path): Where the index is stored
+
+    Returns:
+        list: The segment directories
+    """
+
+    return sorted(Path(index_dir).glob("segment-*"))
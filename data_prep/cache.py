@@ -0,0 +1,266 @@
+from pyarrow import feather
+import pyarrow as pa
+import pandas as pd
+
+from pathlib import Path
+from typing import Tuple
+import hashlib
+import json
+import os
+
+from data_prep.account_index import (
+    build_account_index,
+    index_segments,
+    read_index_key,
+    write_index_key,
+)
+from data_prep.clean import (
+    CLEAN_VERSION,
+    CLEANED_PATH,
+    SCHEMA_VERSION,
+    clean_df,
+    read_cleaned_manifest,
+    write_cleaned_csv,
+)
+from data_prep.compact import expand_account_ids
+
+# where the cached cleaned and validated frames are stored
+CACHE_DIR = "./data/cache"
+# the maximum size of the cache directory before old entries are evicted (5 GB)
+MAX_CACHE_BYTES = 5 * 1024**3
+# suffix of the account ID lookup table stored next to a compact entry
+ACCOUNTS_SUFFIX = ".accounts.feather"
+# the number of account index segments past which a cache hit compacts them into one
+MAX_INDEX_SEGMENTS = 16
+# the schema metadata of an entry holding the manifest of the cleaned CSV file
+MANIFEST_METADATA = b"paysim_cleaned_manifest"
+
+
+def file_digest(path: Path, block_size: int = 1024 * 1024, size: int = None) -> str:
+    """Hash the contents of a file without loading it into memory
+
+    Args:
+        path (Path): The file to hash
+        block_size (int, optional): The number of bytes read at a time. Defaults to 1 MB.
+        size (int, optional): Only hash the first size bytes. Defaults to None (the whole file).
+
+    Returns:
+        str: The SHA-256 hex digest of the file
+    """
+
+    # create hash object
+    digest = hashlib.sha256()
+    # feed the file (or its first size bytes) to the hash object block by block
+    remaining = float("inf") if size is None else size
+    with open(path, "rb") as fd:
+        while remaining > 0:
+            block = fd.read(int(min(block_size, remaining)))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+
+    # return the hex digest
+    return digest.hexdigest()
+
+
+def cache_key(path: Path) -> str:
+    """Build the cache key of a raw PaySim file
+
+    Args:
+        path (Path): The path of the CSV file containing the PaySim data
+
+    Returns:
+        str: The key made of the file hash and the cleaning/schema versions
+    """
+
+    return f"{file_digest(path)}-c{CLEAN_VERSION}-s{SCHEMA_VERSION}"
+
+
+def load_cleaned_df(
+    path: Path,
+    cache_dir: Path = CACHE_DIR,
+    max_bytes: int = MAX_CACHE_BYTES,
+    output_path: Path = CLEANED_PATH,
+    compact: bool = False,
+    index_dir: Path = None,
+) -> pd.DataFrame | Tuple[pd.DataFrame, pd.Index]:
+    """Return the cleaned and validated PaySim data, cleaning and validating only on a cache miss
+
+    Args:
+        path (Path): The path of the CSV file containing the PaySim data
+        cache_dir (Path, optional): Where the cached frames are stored. Defaults to CACHE_DIR.
+        max_bytes (int, optional): The size cap of the cache directory. Defaults to MAX_CACHE_BYTES.
+        output_path (Path, optional): Where the cleaned CSV file is written. Defaults to CLEANED_PATH.
+        compact (bool, optional): Return the data with compact dtypes together with its account ID lookup table. Defaults to False.
+        index_dir (Path, optional): Also build the account index of the data here (see data_prep.account_index). Defaults to None.
+
+    Returns:
+        pd.DataFrame | Tuple[pd.DataFrame, pd.Index]: The cleaned and validated PaySim data
+    """
+
+    # the cache entry of the current file contents, code versions and dtypes
+    key = cache_key(path)
+    entry = Path(cache_dir) / f"{key}{'-compact' if compact else ''}.feather"
+    # the account ID lookup table stored next to a compact entry
+    accounts_entry = entry.with_suffix(ACCOUNTS_SUFFIX)
+
+    # cache hit
+    if entry.exists() and (not compact or accounts_entry.exists()):
+        # mark the entry as recently used
+        os.utime(entry)
+        # memory map the uncompressed Arrow file
+        table = feather.read_table(entry, memory_map=True)
+        df = table.to_pandas()
+
+        # the account ID lookup table of compact entries
+        if compact:
+            account_ids = feather.read_table(accounts_entry).to_pandas()
+            account_ids = pd.Index(account_ids["account_id"], name="account_id")
+
+        # the cleaned CSV file is still consumed by MySQL and Tableau (write it from the
+        # cached frame when it is missing or was cleaned from other data)
+        manifest = read_cleaned_manifest(output_path)
+        if manifest is None or manifest["key"] != key:
+            # the manifest stored with the entry (entries written before it was stored
+            # only know their key and rows)
+            metadata = table.schema.metadata or {}
+            manifest = (
+                json.loads(metadata[MANIFEST_METADATA])
+                if MANIFEST_METADATA in metadata
+                else {"key": key, "rows": df.shape[0]}
+            )
+            write_cleaned_csv(
+                expand_account_ids(df, account_ids) if compact else df,
+                output_path,
+                {"duplicates": None, "fixed_money_values": None, **manifest},
+            )
+
+        # rebuild the account index from the cached frame when it was built from other
+        # data (or compact its segments into one)
+        if index_dir is not None and (
+            read_index_key(index_dir) != key
+            or len(index_segments(index_dir)) > MAX_INDEX_SEGMENTS
+        ):
+            build_account_index(
+                expand_account_ids(df, account_ids) if compact else df, index_dir
+            )
+            write_index_key(index_dir, key)
+
+        # return the frame with its account ID lookup table for compact entries
+        return (df, account_ids) if compact else df
+
+    # cache miss -> clean the data
+    if compact:
+        df, account_ids = clean_df(
+            path, output_path=output_path, compact=True, index_dir=index_dir, key=key
+        )
+    else:
+        df = clean_df(path, output_path=output_path, index_dir=index_dir, key=key)
+    # the account index built while cleaning is the index of this data
+    if index_dir is not None:
+        write_index_key(index_dir, key)
+    # validate every row across a process pool (pandera is only imported on a cache miss)
+    from data_prep.validate import validate_partitioned
+
+    df = validate_partitioned(df, compact=compact)
+
+    # write the entries under a temporary name so readers never see a partial file (with
+    # the manifest of the cleaned CSV file, to write it again on a cache hit)
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    if compact:
+        _write_entry(account_ids.to_frame(index=False), accounts_entry)
+    _write_entry(df, entry, read_cleaned_manifest(output_path))
+
+    # keep the cache under its size cap
+    evict_cache(cache_dir, max_bytes)
+
+    return (df, account_ids) if compact else df
+
+
+def _write_entry(df: pd.DataFrame, entry: Path, manifest: dict = None) -> None:
+    """Atomically write a DataFrame to an uncompressed (memory-mappable) Feather file
+
+    Args:
+        df (pd.DataFrame): The frame to store
+        entry (Path): The cache file
+        manifest (dict, optional): The manifest of the cleaned CSV file, stored in the schema metadata. Defaults to None.
+    """
+
+    # the frame with the manifest in its schema metadata
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if manifest is not None:
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, MANIFEST_METADATA: json.dumps(manifest)}
+        )
+
+    # write to a temporary file and move it into place
+    tmp_entry = entry.with_suffix(".tmp")
+    feather.write_feather(table, tmp_entry, compression="uncompressed")
+    os.replace(tmp_entry, entry)
+
+
+def invalidate_cache(path: Path = None, cache_dir: Path = CACHE_DIR) -> int:
+    """Remove cached entries
+
+    Args:
+        path (Path, optional): Only remove the entries of this raw PaySim file. Defaults to None (remove everything).
+        cache_dir (Path, optional): Where the cached frames are stored. Defaults to CACHE_DIR.
+
+    Returns:
+        int: The number of entries removed
+    """
+
+    # every entry, or only the entries whose key starts with the file hash
+    pattern = "*.feather" if path is None else f"{file_digest(path)}-*.feather"
+
+    # initialize counter
+    removed = 0
+    # delete the matching entries and their account ID lookup tables
+    for entry in Path(cache_dir).glob(pattern):
+        if entry.name.endswith(ACCOUNTS_SUFFIX):
+            continue
+        entry.unlink()
+        entry.with_suffix(ACCOUNTS_SUFFIX).unlink(missing_ok=True)
+        removed += 1
+
+    return removed
+
+
+def evict_cache(cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES) -> int:
+    """Evict the least recently used entries until the cache fits in max_bytes
+
+    Args:
+        cache_dir (Path, optional): Where the cached frames are stored. Defaults to CACHE_DIR.
+        max_bytes (int, optional): The size cap of the cache directory. Defaults to MAX_CACHE_BYTES.
+
+    Returns:
+        int: The number of entries evicted
+    """
+
+    # order the entries from least to most recently used
+    entries = sorted(
+        (
+            entry
+            for entry in Path(cache_dir).glob("*.feather")
+            if not entry.name.endswith(ACCOUNTS_SUFFIX)
+        ),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    # current size of the cache
+    total = sum(entry.stat().st_size for entry in Path(cache_dir).glob("*.feather"))
+
+    # initialize counter
+    evicted = 0
+    # drop the oldest entries while the cache is over its cap (always keep the newest)
+    for entry in entries[:-1]:
+        if total <= max_bytes:
+            break
+        # remove the entry together with its account ID lookup table
+        for file in (entry, entry.with_suffix(ACCOUNTS_SUFFIX)):
+            if file.exists():
+                total -= file.stat().st_size
+                file.unlink()
+        evicted += 1
+
+    return evicted
@@ -1,25 +1,267 @@
+import pyarrow.compute as pc
+import pyarrow as pa
 import pandas as pd
+import numpy as np
 
+from typing import Tuple
 from pathlib import Path
+import json
+import os
 
+from data_prep.account_index import build_account_index
+from data_prep.compact import compact_df
+from data_prep.dedup import (
+    SPILL_DIR,
+    FingerprintSet,
+    count_duplicates,
+    drop_duplicate_rows,
+)
 
-def clean_df(path: Path) -> None:
+
+# define new column names
+RENAMED_COLUMNS = {
+    "step": "hour",
+    "nameOrig": "initiator_id",
+    "oldbalanceOrg": "initiator_old_balance",
+    "newbalanceOrig": "initiator_new_balance",
+    "nameDest": "target_id",
+    "oldbalanceDest": "target_old_balance",
+    "newbalanceDest": "target_new_balance",
+    "isFraud": "is_fraud",
+}
+
+# columns that represent dollar amounts
+MONEY_COLUMNS = [
+    "amount",
+    "initiator_old_balance",
+    "initiator_new_balance",
+    "target_old_balance",
+    "target_new_balance",
+]
+
+# a money value that parses as a number as it is (ex. "1234.50", "1.5e3", "-5.0")
+MONEY_PATTERN = r"^-?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+# a number inside a malformed money value (ex. "-3.25" in "USD -3.25", "1.5e3" in "USD 1.5e3",
+# the sign is kept so a negative value stays negative and is rejected by the schema)
+MONEY_TOKEN_PATTERN = r"(?P<money>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+
+# set the order of columns
+COLUMN_ORDER = [
+    "hour",
+    "type",
+    "amount",
+    "initiator_id",
+    "initiator_old_balance",
+    "initiator_new_balance",
+    "target_id",
+    "target_old_balance",
+    "target_new_balance",
+    "is_fraud",
+]
+
+# bump whenever the cleaned output changes so cached cleaned data is invalidated
+CLEAN_VERSION = 5
+# bump whenever PaySimSchema (data_prep.validate) changes so cached validated data is invalidated
+# (kept here so cache keys are computed without importing pandera)
+SCHEMA_VERSION = 1
+
+# where the cleaned data is written to
+CLEANED_PATH = "./data/output/cleaned_paysim_data.csv"
+# the statistics of a complete cleaned CSV file are written next to it with this suffix
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def clean_df(
+    path: Path,
+    chunksize: int = None,
+    output_path: Path = CLEANED_PATH,
+    compact: bool = False,
+    index_dir: Path = None,
+    key: str = None,
+) -> pd.DataFrame:
     """Clean the PaySim dataset and write to file
 
     Args:
         path (Path): The path of the CSV file containing the PaySim data
+        chunksize (int, optional): Stream the file in chunks of this many rows to keep memory flat. Defaults to None (load the whole file).
+        output_path (Path, optional): Where the cleaned CSV file is written. Defaults to CLEANED_PATH.
+        compact (bool, optional): Return the frame with compact dtypes together with its account ID lookup table (see compact_df). Defaults to False.
+        index_dir (Path, optional): Also (re)build the account index of the cleaned data here (see data_prep.account_index). Defaults to None.
+        key (str, optional): Identifies the raw data, recorded in the manifest of the cleaned file (ex. cache_key of the raw file). Defaults to None.
 
     Returns:
-        pd.DataFrame: A cleaned DataFrame with the PaySim data
+        pd.DataFrame: A cleaned DataFrame with the PaySim data (None when streaming in chunks)
     """
 
     # set all floats to 2 decimal places
     pd.options.display.float_format = "{:.2f}".format
+    # the manifest of a previous cleaned file no longer applies
+    cleaned_manifest_path(output_path).unlink(missing_ok=True)
+
+    # stream the file when a chunk size is provided
+    if chunksize is not None:
+        _clean_in_chunks(path, chunksize, output_path, index_dir, key)
+        return None
 
     # read CSV into dataframe
     df = pd.read_csv(path, encoding="utf-8")
-    # drop duplicate rows
-    df = df.drop_duplicates(keep="first")
+    # clean the dataframe
+    counts = {"fixed_money_values": 0}
+    df = clean_chunk(df, path, counts)
+    # drop duplicate rows by their 64-bit fingerprints
+    seen = FingerprintSet()
+    df = drop_duplicate_rows(df, seen)
+    print(f"Fixed {counts['fixed_money_values']} malformed money values")
+    print(f"Dropped {seen.duplicates} duplicate rows")
+
+    # write cleaned dataframe to CSV and then its manifest
+    write_cleaned_csv(
+        df,
+        output_path,
+        {"key": key, "rows": df.shape[0], "duplicates": seen.duplicates, **counts},
+    )
+
+    # fresh index for the cleaned dataframe
+    df = df.reset_index(drop=True)
+    # index the rows by account
+    if index_dir is not None:
+        build_account_index(df, index_dir)
+
+    # return the cleaned dataframe (as compact dtypes and account lookup table if requested)
+    return compact_df(df) if compact else df
+
+
+def _clean_in_chunks(
+    path: Path,
+    chunksize: int,
+    output_path: Path,
+    index_dir: Path = None,
+    key: str = None,
+) -> None:
+    """Clean the PaySim dataset chunk by chunk and append each chunk to the output file
+
+    Duplicate rows are dropped across chunks: the fingerprints of the rows seen so far
+    are kept (spilling to disk past MAX_FINGERPRINTS_IN_MEMORY) instead of the rows.
+
+    Args:
+        path (Path): The path of the CSV file containing the PaySim data
+        chunksize (int): The number of rows read per chunk
+        output_path (Path): Where the cleaned CSV file is written
+        index_dir (Path, optional): Where the account index is built (one segment per chunk). Defaults to None.
+        key (str, optional): Identifies the raw data, recorded in the manifest. Defaults to None.
+    """
+
+    # the first chunk truncates the output file and writes the header
+    first_chunk = True
+    # the number of cleaned rows written so far
+    rows = 0
+    # the number of malformed money values fixed so far
+    counts = {"fixed_money_values": 0}
+
+    # read the CSV file lazily in chunks
+    with pd.read_csv(
+        path, encoding="utf-8", chunksize=chunksize
+    ) as reader, FingerprintSet(spill_dir=SPILL_DIR) as seen:
+        for chunk in reader:
+            # clean the chunk and drop the rows seen in this or an earlier chunk
+            chunk = drop_duplicate_rows(clean_chunk(chunk, path, counts), seen)
+
+            # append the cleaned chunk to the output file
+            chunk.to_csv(
+                output_path,
+                mode="w" if first_chunk else "a",
+                header=first_chunk,
+                index=False,
+                encoding="utf-8",
+            )
+            # index the rows of the chunk by account
+            if index_dir is not None:
+                build_account_index(chunk, index_dir, first_row=rows)
+            rows += chunk.shape[0]
+            first_chunk = False
+
+        # report the malformed values fixed and the duplicates dropped
+        print(f"Fixed {counts['fixed_money_values']} malformed money values")
+        print(f"Dropped {seen.duplicates} duplicate rows")
+
+        # the output file is complete
+        _write_cleaned_manifest(
+            output_path,
+            {"key": key, "rows": rows, "duplicates": seen.duplicates, **counts},
+        )
+
+
+def cleaned_manifest_path(output_path: Path = CLEANED_PATH) -> Path:
+    """The manifest written next to a cleaned CSV file
+
+    Args:
+        output_path (Path, optional): The cleaned CSV file. Defaults to CLEANED_PATH.
+
+    Returns:
+        Path: The path of the manifest
+    """
+
+    return Path(f"{output_path}{MANIFEST_SUFFIX}")
+
+
+def read_cleaned_manifest(output_path: Path = CLEANED_PATH) -> dict:
+    """Read the statistics of a complete cleaned CSV file
+
+    Args:
+        output_path (Path, optional): The cleaned CSV file. Defaults to CLEANED_PATH.
+
+    Returns:
+        dict: The key of the raw data, rows, duplicates dropped and malformed money values fixed (None when the file is missing or incomplete)
+    """
+
+    path = cleaned_manifest_path(output_path)
+    if not path.exists() or not Path(output_path).exists():
+        return None
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def write_cleaned_csv(df: pd.DataFrame, output_path: Path, manifest: dict) -> None:
+    """Write cleaned data to CSV and then the manifest that marks the file complete
+
+    Args:
+        df (pd.DataFrame): The cleaned data (default dtypes)
+        output_path (Path): The cleaned CSV file
+        manifest (dict): The statistics of the cleaning (see read_cleaned_manifest)
+    """
+
+    # the manifest of a previous cleaned file no longer applies
+    cleaned_manifest_path(output_path).unlink(missing_ok=True)
+    df.to_csv(output_path, index=False, encoding="utf-8")
+    _write_cleaned_manifest(output_path, manifest)
+
+
+def _write_cleaned_manifest(output_path: Path, manifest: dict) -> None:
+    """Atomically write the manifest of a complete cleaned CSV file
+
+    Args:
+        output_path (Path): The cleaned CSV file
+        manifest (dict): The statistics of the cleaning
+    """
+
+    # write to a temporary file and move it into place
+    path = cleaned_manifest_path(output_path)
+    with open(f"{path}.tmp", "w") as fd:
+        json.dump(manifest, fd, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def clean_chunk(df: pd.DataFrame, path: Path, counts: dict = None) -> pd.DataFrame:
+    """Rename, strip, parse and reorder the columns of (a chunk of) the raw PaySim data
+
+    Args:
+        df (pd.DataFrame): Raw PaySim rows
+        path (Path): The path of the CSV file the rows were read from
+        counts (dict, optional): Add the number of malformed money values fixed to counts["fixed_money_values"] instead of printing it. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The cleaned rows
+    """
 
     # ensure there are no NaN values
     empty_values = df.isnull().values.any()
@@ -27,61 +269,111 @@ def clean_df(path: Path) -> None:
     if empty_values:
         raise ValueError(f"Empty values found in dataframe here -> {path}")
 
-    # define new column names
-    renamed_columns = {
-        "step": "hour",
-        "nameOrig": "initiator_id",
-        "oldbalanceOrg": "initiator_old_balance",
-        "newbalanceOrig": "initiator_new_balance",
-        "nameDest": "target_id",
-        "oldbalanceDest": "target_old_balance",
-        "newbalanceDest": "target_new_balance",
-        "isFraud": "is_fraud",
-    }
     # rename columns
-    df.rename(columns=renamed_columns, inplace=True)
+    df = df.rename(columns=RENAMED_COLUMNS)
 
-    # select all columns of the object data type
-    object_cols = df.select_dtypes(object).columns
+    # select all columns of the object data type (the money parser handles whitespace)
+    object_cols = df.select_dtypes(object).columns.difference(MONEY_COLUMNS)
     # strip all whitespace from values in object_cols
     df[object_cols] = df[object_cols].apply(lambda x: x.str.strip())
 
     # drop "isFlaggedFraud" column
     df = df.drop("isFlaggedFraud", axis=1)
 
-    # columns that represent dollar amounts
-    money_columns = [
-        "amount",
-        "initiator_old_balance",
-        "initiator_new_balance",
-        "target_old_balance",
-        "target_new_balance",
-    ]
-    # loop through money_columns
-    for column in money_columns:
-        # remove non-numerical characters (except "." to distinguish cents)
-        df[column] = df[column].astype(str).str.extract("(\d.+)", expand=False)
-        # convert column to float
-        df[column] = df[column].astype(float)
-
-    # set the order of columns
-    column_order = [
-        "hour",
-        "type",
-        "amount",
-        "initiator_id",
-        "initiator_old_balance",
-        "initiator_new_balance",
-        "target_id",
-        "target_old_balance",
-        "target_new_balance",
-        "is_fraud",
-    ]
+    # parse the money columns (only malformed values are cleaned up)
+    raw_money = df[MONEY_COLUMNS]
+    df, fixed = parse_money_columns(df)
+    if counts is not None:
+        counts["fixed_money_values"] = counts.get("fixed_money_values", 0) + fixed
+    else:
+        print(f"Fixed {fixed} malformed money values")
+    # raise exception if a money value has no number (or several numbers) in it
+    unparseable = df[MONEY_COLUMNS].isnull().to_numpy()
+    if unparseable.any():
+        examples = raw_money.to_numpy()[unparseable][:5].tolist()
+        raise ValueError(
+            f"Unparseable money values (ex. {examples}) found in dataframe here -> {path}"
+        )
+
     # reorder columns
-    df = df[column_order]
+    return df[COLUMN_ORDER]
+
+
+def parse_money_columns(
+    df: pd.DataFrame, columns: list = MONEY_COLUMNS
+) -> Tuple[pd.DataFrame, int]:
+    """Parse the money columns as floats, cleaning up only the values that fail to parse
+
+    Well-formed columns are already parsed as floats by read_csv and are left as they are.
+    The values of the remaining columns are parsed together in one pass over an Arrow
+    array: the well-formed values are cast directly, and only the malformed ones (ex.
+    "$1,234.50", "USD 1.5e3") are reduced to the number in them first. A malformed value
+    with no number or with several numbers in it (ex. "12-34") is not guessed at.
 
-    # write cleaned dataframe to CSV
-    df.to_csv("./data/output/cleaned_paysim_data.csv", index=False, encoding="utf-8")
+    Args:
+        df (pd.DataFrame): Rows with the money columns
+        columns (list, optional): The money columns. Defaults to MONEY_COLUMNS.
+
+    Returns:
+        Tuple[pd.DataFrame, int]: The rows with float money columns (NaN where no single number was found) and the number of values that were cleaned up
+    """
+
+    # the columns read_csv could not parse as numbers
+    unparsed = [
+        column
+        for column in columns
+        if not pd.api.types.is_numeric_dtype(df[column].dtype)
+    ]
+    df = df.astype({column: "float64" for column in columns if column not in unparsed})
+    if not unparsed:
+        return df, 0
+
+    # the values of every unparsed column as one array of strings
+    values = df[unparsed].to_numpy().ravel()
+    try:
+        values = pa.array(values, type=pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        values = pa.array(values.astype(str), type=pa.string())
+
+    # cast the well-formed values directly
+    well_formed = pc.match_substring_regex(values, MONEY_PATTERN)
+    parsed = _cast_money(values, well_formed)
+
+    # clean up and cast only the malformed values
+    failed = np.flatnonzero(~well_formed.to_numpy(zero_copy_only=False))
+    if failed.shape[0]:
+        # drop the thousands separators and keep the values with exactly one number
+        malformed = pc.replace_substring(values.take(failed), ",", "")
+        tokens = pc.struct_field(pc.extract_regex(malformed, MONEY_TOKEN_PATTERN), [0])
+        single = pc.equal(pc.count_substring_regex(malformed, MONEY_TOKEN_PATTERN), 1)
+        parsed[failed] = _cast_money(tokens, single)
+
+    # put the parsed values back in their columns
+    parsed = parsed.reshape(df.shape[0], len(unparsed))
+    df = df.assign(
+        **{column: parsed[:, position] for position, column in enumerate(unparsed)}
+    )
+
+    return df, failed.shape[0]
+
+
+def _cast_money(values: pa.Array, well_formed: pa.Array) -> np.ndarray:
+    """Cast money strings to floats
+
+    Args:
+        values (pa.Array): Money values as strings
+        well_formed (pa.Array): Whether every value matches MONEY_PATTERN
+
+    Returns:
+        np.ndarray: The values as floats (NaN where they are not well formed)
+    """
+
+    # the values that are not well formed are cast as nulls (-> NaN)
+    return (
+        pc.cast(pc.if_else(well_formed, values, None), pa.float64())
+        .to_numpy(zero_copy_only=False)
+        .copy()
+    )
 
 
 def dataframe_insights(df: pd.DataFrame) -> None:
@@ -92,7 +384,7 @@ def dataframe_insights(df: pd.DataFrame) -> None:
     """
 
     # number of dupes
-    print("Number of duplicates: ", df.duplicated().sum())
+    print("Number of duplicates: ", count_duplicates(df))
     print("\n")
 
     # number of transactions
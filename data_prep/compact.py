@@ -0,0 +1,78 @@
+import pandas as pd
+import numpy as np
+
+from typing import Tuple
+
+# the transaction types present in the PaySim data (categories of the "type" column)
+TRANSACTION_TYPES = ["CASH_IN", "CASH_OUT", "DEBIT", "PAYMENT", "TRANSFER"]
+
+
+def compact_df(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Index]:
+    """Convert the cleaned PaySim data to compact in-memory dtypes
+
+    "type" becomes a categorical, "hour" int16, "is_fraud" int8 and both account ID
+    columns become int32 codes into a single shared lookup table of account IDs.
+
+    Args:
+        df (pd.DataFrame): The cleaned PaySim data
+
+    Returns:
+        Tuple[pd.DataFrame, pd.Index]: The compact DataFrame and the account IDs indexed by code
+    """
+
+    # memory used by the default dtypes
+    before = df.memory_usage(deep=True).sum()
+
+    # encode initiators and targets into one code space (in order of first appearance)
+    codes, account_ids = pd.factorize(
+        np.concatenate([df["initiator_id"].to_numpy(), df["target_id"].to_numpy()])
+    )
+    # lookup table of account IDs indexed by code
+    account_ids = pd.Index(account_ids, name="account_id")
+    # number of transactions
+    rows = df.shape[0]
+
+    # build the compact dataframe column by column
+    compact = pd.DataFrame(
+        {
+            "hour": df["hour"].astype(np.int16),
+            "type": df["type"].astype(pd.CategoricalDtype(TRANSACTION_TYPES)),
+            "amount": df["amount"],
+            "initiator_id": codes[:rows].astype(np.int32),
+            "initiator_old_balance": df["initiator_old_balance"],
+            "initiator_new_balance": df["initiator_new_balance"],
+            "target_id": codes[rows:].astype(np.int32),
+            "target_old_balance": df["target_old_balance"],
+            "target_new_balance": df["target_new_balance"],
+            "is_fraud": df["is_fraud"].astype(np.int8),
+        },
+        index=df.index,
+    )
+
+    # memory used by the compact dtypes (including the lookup table)
+    after = compact.memory_usage(deep=True).sum() + account_ids.memory_usage(deep=True)
+    # report the memory saved
+    print(
+        f"Compact dtypes: {before / 1024**2:.1f} MB -> {after / 1024**2:.1f} MB "
+        f"({(before - after) / 1024**2:.1f} MB saved)"
+    )
+
+    return compact, account_ids
+
+
+def expand_account_ids(df: pd.DataFrame, account_ids: pd.Index) -> pd.DataFrame:
+    """Replace the account ID codes of a compact DataFrame with the original account IDs
+
+    Args:
+        df (pd.DataFrame): Compact PaySim data (or a subset of it)
+        account_ids (pd.Index): The account IDs indexed by code
+
+    Returns:
+        pd.DataFrame: A copy of df with string account IDs
+    """
+
+    # look the codes up in the account ID table
+    return df.assign(
+        initiator_id=account_ids.take(df["initiator_id"].to_numpy()).to_numpy(),
+        target_id=account_ids.take(df["target_id"].to_numpy()).to_numpy(),
+    )
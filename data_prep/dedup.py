@@ -0,0 +1,273 @@
+import pandas as pd
+import numpy as np
+
+from pathlib import Path
+import tempfile
+import shutil
+import os
+
+# where fingerprints are spilled to when a set outgrows its memory budget
+SPILL_DIR = "./data/cache/fingerprints"
+# the number of fingerprints kept in memory before spilling (16M x 8 bytes = 128 MB)
+MAX_FINGERPRINTS_IN_MEMORY = 16 * 1024**2
+# the number of spilled runs merged into one (every lookup searches every run)
+MAX_RUNS = 16
+
+
+def row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """Hash every row (all columns, not the index) into a 64-bit fingerprint
+
+    Two different rows share a fingerprint with a probability of about n^2 / 2^65 for n
+    rows (ex. 1e-6 for 6M rows).
+
+    Args:
+        df (pd.DataFrame): The rows to hash
+
+    Returns:
+        np.ndarray: One uint64 fingerprint per row
+    """
+
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class FingerprintSet:
+    """Array-backed set of 64-bit row fingerprints that can spill sorted runs to disk."""
+
+    def __init__(
+        self,
+        max_in_memory: int = MAX_FINGERPRINTS_IN_MEMORY,
+        spill_dir: Path = None,
+        max_runs: int = MAX_RUNS,
+    ):
+        """Create an empty set
+
+        Args:
+            max_in_memory (int, optional): The number of fingerprints kept in memory before spilling. Defaults to MAX_FINGERPRINTS_IN_MEMORY.
+            spill_dir (Path, optional): Where sorted runs are spilled (memory-mapped on lookup). Defaults to None (never spill).
+            max_runs (int, optional): The number of runs above which the runs are merged into one. Defaults to MAX_RUNS.
+        """
+
+        self.max_in_memory = max_in_memory
+        self.max_runs = max_runs
+        # sorted fingerprints in memory and memory-mapped sorted runs on disk
+        self.memory = np.empty(0, dtype=np.uint64)
+        self.runs = []
+        # number of runs written (names the next run)
+        self.spilled = 0
+        # a private directory for the runs of this set
+        self.spill_dir = None
+        if spill_dir is not None:
+            Path(spill_dir).mkdir(parents=True, exist_ok=True)
+            self.spill_dir = Path(tempfile.mkdtemp(prefix="run-", dir=spill_dir))
+
+        # number of rows added and how many of them were duplicates
+        self.rows = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return self.memory.shape[0] + sum(run.shape[0] for run in self.runs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Add fingerprints and flag the ones seen for the first time
+
+        Args:
+            fingerprints (np.ndarray): uint64 fingerprints (ex. of the rows of a chunk)
+
+        Returns:
+            np.ndarray: True for the first occurrence of every fingerprint not in the set yet
+        """
+
+        # the first occurrence of every fingerprint in the batch
+        unique, first = np.unique(fingerprints, return_index=True)
+        # drop the ones already in the set
+        new = ~self._contains(unique)
+
+        # flag the first occurrences of the new fingerprints
+        is_new = np.zeros(fingerprints.shape[0], dtype=bool)
+        is_new[first[new]] = True
+
+        # merge the new fingerprints (sorted, and none of them in memory) into memory
+        self.memory = np.insert(
+            self.memory, np.searchsorted(self.memory, unique[new]), unique[new]
+        )
+        if self.spill_dir is not None and self.memory.shape[0] >= self.max_in_memory:
+            self._spill()
+
+        # update the counters
+        self.rows += fingerprints.shape[0]
+        self.duplicates += fingerprints.shape[0] - int(new.sum())
+
+        return is_new
+
+    def save(self, directory: Path) -> None:
+        """Store the fingerprints so a later process can resume the set (see load)
+
+        The sorted runs are immutable, so they are hard linked into the directory when it
+        is on the same file system (copied otherwise) instead of rewritten.
+
+        Args:
+            directory (Path): Where the runs and the in-memory fingerprints are written (created)
+        """
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # the sorted runs on disk
+        for number, run in enumerate(self.runs):
+            path = directory / f"run-{number:05d}.npy"
+            try:
+                os.link(run.filename, path)
+            except OSError:
+                shutil.copyfile(run.filename, path)
+        # the fingerprints in memory
+        np.save(directory / "memory.npy", self.memory)
+
+    @classmethod
+    def load(
+        cls,
+        directory: Path,
+        max_in_memory: int = MAX_FINGERPRINTS_IN_MEMORY,
+        spill_dir: Path = None,
+        max_runs: int = MAX_RUNS,
+    ) -> "FingerprintSet":
+        """Resume a set stored by save (the stored runs are memory mapped, not read)
+
+        Args:
+            directory (Path): Where the set was saved
+            max_in_memory (int, optional): The number of fingerprints kept in memory before spilling. Defaults to MAX_FINGERPRINTS_IN_MEMORY.
+            spill_dir (Path, optional): Where new sorted runs are spilled. Defaults to None (never spill).
+            max_runs (int, optional): The number of runs above which the runs are merged into one. Defaults to MAX_RUNS.
+
+        Returns:
+            FingerprintSet: The set with the stored fingerprints (and fresh counters)
+        """
+
+        seen = cls(max_in_memory, spill_dir, max_runs)
+        seen.runs = [
+            np.load(path, mmap_mode="r")
+            for path in sorted(Path(directory).glob("run-*.npy"))
+        ]
+        seen.memory = np.load(Path(directory) / "memory.npy")
+
+        return seen
+
+    def close(self) -> None:
+        """Remove the spilled runs"""
+
+        self.runs = []
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _contains(self, values: np.ndarray) -> np.ndarray:
+        """Membership test of sorted unique values by binary search in every sorted array
+
+        Args:
+            values (np.ndarray): Sorted unique fingerprints
+
+        Returns:
+            np.ndarray: True for the values in the set
+        """
+
+        found = np.zeros(values.shape[0], dtype=bool)
+        for array in [self.memory, *self.runs]:
+            if array.shape[0] == 0:
+                continue
+            position = np.minimum(np.searchsorted(array, values), array.shape[0] - 1)
+            found |= array[position] == values
+
+        return found
+
+    def _spill(self) -> None:
+        """Move the in-memory fingerprints to a sorted run on disk"""
+
+        path = self._next_run_path()
+        np.save(path, self.memory)
+        self.runs.append(np.load(path, mmap_mode="r"))
+        self.spilled += 1
+        self.memory = np.empty(0, dtype=np.uint64)
+
+        # merge the runs once there are too many to search
+        if len(self.runs) > self.max_runs:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Merge the sorted runs into one, max_in_memory fingerprints at a time"""
+
+        # every run has at most block fingerprints between two consecutive splitters
+        block = max(self.max_in_memory // len(self.runs), 1)
+        splitters = np.unique(np.concatenate([run[::block] for run in self.runs]))
+        bounds = [
+            np.concatenate([[0], np.searchsorted(run, splitters), [run.shape[0]]])
+            for run in self.runs
+        ]
+
+        # merge the runs segment by segment into a memory-mapped run
+        path = self._next_run_path()
+        merged = np.lib.format.open_memmap(
+            path,
+            mode="w+",
+            dtype=np.uint64,
+            shape=(sum(run.shape[0] for run in self.runs),),
+        )
+        offset = 0
+        for segment in range(splitters.shape[0] + 1):
+            values = np.sort(
+                np.concatenate(
+                    [
+                        run[start[segment] : start[segment + 1]]
+                        for run, start in zip(self.runs, bounds)
+                    ]
+                )
+            )
+            merged[offset : offset + values.shape[0]] = values
+            offset += values.shape[0]
+        merged.flush()
+        del merged
+
+        # replace the runs (the runs of a loaded set belong to the saved set)
+        for run in self.runs:
+            if Path(run.filename).parent == self.spill_dir.resolve():
+                os.remove(run.filename)
+        self.runs = [np.load(path, mmap_mode="r")]
+        self.spilled += 1
+
+    def _next_run_path(self) -> Path:
+        """The file of the next sorted run in the spill directory"""
+
+        return self.spill_dir / f"run-{self.spilled:05d}.npy"
+
+
+def drop_duplicate_rows(df: pd.DataFrame, seen: FingerprintSet = None) -> pd.DataFrame:
+    """Drop duplicate rows (keeping the first) by fingerprint instead of hashing whole rows
+
+    Pass the same FingerprintSet for every chunk of a stream to drop duplicates across chunks.
+
+    Args:
+        df (pd.DataFrame): The rows (or a chunk of them)
+        seen (FingerprintSet, optional): The fingerprints of the rows seen so far. Defaults to None (only df).
+
+    Returns:
+        pd.DataFrame: The rows seen for the first time
+    """
+
+    seen = FingerprintSet() if seen is None else seen
+    return df[seen.add(row_fingerprints(df))]
+
+
+def count_duplicates(df: pd.DataFrame) -> int:
+    """Count the duplicate rows of a DataFrame by fingerprint (like df.duplicated().sum())
+
+    Args:
+        df (pd.DataFrame): The rows
+
+    Returns:
+        int: The number of rows that repeat an earlier row
+    """
+
+    return df.shape[0] - np.unique(row_fingerprints(df)).shape[0]
@@ -0,0 +1,248 @@
+from pyarrow import feather
+import pandas as pd
+import numpy as np
+
+from pathlib import Path
+import shutil
+import json
+import os
+
+from data_prep.clean import CLEANED_PATH
+from data_prep.compact import TRANSACTION_TYPES
+
+# where the cleaned data partitioned by hour range is stored
+PARTITION_DIR = "./data/partitions"
+# the number of hours per partition (one day)
+HOURS_PER_PARTITION = 24
+# written last, marks a complete set of partitions
+MANIFEST_NAME = "_manifest.json"
+
+
+def write_partitions(
+    cleaned_path: Path = CLEANED_PATH,
+    partition_dir: Path = PARTITION_DIR,
+    hours_per_partition: int = HOURS_PER_PARTITION,
+    chunksize: int = 1000000,
+    key: str = None,
+    duplicates: int = None,
+) -> dict:
+    """Store the cleaned PaySim data partitioned by hour range without loading it into memory
+
+    The cleaned CSV file is streamed in chunks. Every chunk is validated and its rows are
+    appended to the partition of their hour range as a feather fragment
+    (ex. hours=0001-0024/part-00000.feather). Duplicate rows share their hour, so they
+    always land in the same partition.
+
+    Args:
+        cleaned_path (Path, optional): The cleaned CSV file. Defaults to CLEANED_PATH.
+        partition_dir (Path, optional): Where the partitions are written. Defaults to PARTITION_DIR.
+        hours_per_partition (int, optional): The number of hours per partition. Defaults to HOURS_PER_PARTITION.
+        chunksize (int, optional): The number of rows read at a time. Defaults to 1000000.
+        key (str, optional): Identifies the data the partitions were built from (ex. cache_key of the raw file). Defaults to None.
+        duplicates (int, optional): The number of duplicate rows dropped while cleaning (see read_cleaned_manifest). Defaults to None.
+
+    Returns:
+        dict: The manifest of the partitions (key, hours per partition, rows, duplicates, first and last hour and partitions)
+    """
+
+    # assert that the partitions hold at least one hour
+    assert hours_per_partition >= 1
+
+    # remove the partitions of a previous run (only the directories written here)
+    partition_dir = Path(partition_dir)
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    (partition_dir / MANIFEST_NAME).unlink(missing_ok=True)
+    for old_partition in partition_dir.glob("hours=*"):
+        shutil.rmtree(old_partition)
+
+    # pandera is only imported when partitions are written
+    from data_prep.validate import validate_frame
+
+    # initialize counters
+    rows = 0
+    partitions = set()
+    first_hour_seen, last_hour_seen = None, None
+
+    # read the cleaned CSV file lazily in chunks
+    with pd.read_csv(cleaned_path, encoding="utf-8", chunksize=chunksize) as reader:
+        for chunk_number, chunk in enumerate(reader):
+            # validate the chunk and convert it to the partition dtypes
+            chunk = _partition_dtypes(validate_frame(chunk))
+            rows += chunk.shape[0]
+            if chunk.shape[0] == 0:
+                continue
+
+            # track the hour range of the data
+            chunk_first, chunk_last = int(chunk["hour"].min()), int(chunk["hour"].max())
+            if first_hour_seen is None or chunk_first < first_hour_seen:
+                first_hour_seen = chunk_first
+            if last_hour_seen is None or chunk_last > last_hour_seen:
+                last_hour_seen = chunk_last
+
+            # the first hour of the partition of every row
+            first_hour = (
+                chunk["hour"] - 1
+            ) // hours_per_partition * hours_per_partition + 1
+            for start_hour, part in chunk.groupby(first_hour, sort=True):
+                # one fragment per chunk and partition
+                directory = partition_dir / _partition_name(
+                    start_hour, start_hour + hours_per_partition - 1
+                )
+                directory.mkdir(exist_ok=True)
+                feather.write_feather(
+                    part.reset_index(drop=True),
+                    directory / f"part-{chunk_number:05d}.feather",
+                )
+                partitions.add(directory.name)
+
+    # write the manifest last so incomplete partitions are never used
+    manifest = {
+        "key": key,
+        "hours_per_partition": hours_per_partition,
+        "rows": rows,
+        "duplicates": duplicates,
+        "first_hour": first_hour_seen,
+        "last_hour": last_hour_seen,
+        "partitions": sorted(partitions),
+    }
+    with open(partition_dir / f"{MANIFEST_NAME}.tmp", "w") as fd:
+        json.dump(manifest, fd, indent=2)
+    os.replace(partition_dir / f"{MANIFEST_NAME}.tmp", partition_dir / MANIFEST_NAME)
+
+    return manifest
+
+
+def read_manifest(partition_dir: Path = PARTITION_DIR) -> dict:
+    """Read the manifest of a complete set of partitions
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+
+    Returns:
+        dict: The manifest (None when the partitions are missing or incomplete)
+    """
+
+    path = Path(partition_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def hour_range(partition_dir: Path = PARTITION_DIR) -> tuple:
+    """The first and last hour of the partitioned data
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+
+    Raises:
+        FileNotFoundError: There is no complete set of partitions in partition_dir
+
+    Returns:
+        tuple: The first and last hour
+    """
+
+    # assert that the partitions are complete
+    manifest = read_manifest(partition_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No complete partitions found here -> {partition_dir}")
+
+    # manifests written before the hour range was recorded span their partitions
+    if manifest.get("first_hour") is None:
+        hours = [
+            int(hour)
+            for name in manifest["partitions"]
+            for hour in name.split("=")[1].split("-")
+        ]
+        return min(hours), max(hours)
+
+    return manifest["first_hour"], manifest["last_hour"]
+
+
+def list_partitions(
+    partition_dir: Path = PARTITION_DIR, start_hour: int = None, end_hour: int = None
+) -> list:
+    """The partitions overlapping an hour range, in hour order
+
+    Args:
+        partition_dir (Path, optional): Where the partitions are stored. Defaults to PARTITION_DIR.
+        start_hour (int, optional): The first hour of interest. Defaults to None (from the first hour).
+        end_hour (int, optional): The last hour of interest. Defaults to None (to the last hour).
+
+    Raises:
+        FileNotFoundError: There is no complete set of partitions in partition_dir
+
+    Returns:
+        list: The paths of the partition directories
+    """
+
+    # assert that the partitions are complete
+    manifest = read_manifest(partition_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No complete partitions found here -> {partition_dir}")
+
+    # keep the partitions overlapping the hour range
+    selected = []
+    for name in manifest["partitions"]:
+        first, last = (int(hour) for hour in name.split("=")[1].split("-"))
+        if (start_hour is None or last >= start_hour) and (
+            end_hour is None or first <= end_hour
+        ):
+            selected.append(Path(partition_dir) / name)
+
+    return selected
+
+
+def read_partition(partition: Path, columns: list = None) -> pd.DataFrame:
+    """Read the fragments of one partition into a DataFrame
+
+    Args:
+        partition (Path): The partition directory
+        columns (list, optional): The columns to read. Defaults to None (all columns).
+
+    Returns:
+        pd.DataFrame: The cleaned rows of the partition
+    """
+
+    # memory map the fragments and read only the requested columns
+    fragments = [
+        feather.read_feather(fragment, columns=columns, memory_map=True)
+        for fragment in sorted(Path(partition).glob("part-*.feather"))
+    ]
+
+    return pd.concat(fragments, ignore_index=True)
+
+
+def _partition_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert cleaned rows to the dtypes stored in the partitions
+
+    Account IDs stay strings so partitions do not depend on a global lookup table.
+
+    Args:
+        df (pd.DataFrame): Cleaned PaySim rows
+
+    Returns:
+        pd.DataFrame: The rows with compact hour, type and is_fraud columns
+    """
+
+    return df.astype(
+        {
+            "hour": np.int16,
+            "type": pd.CategoricalDtype(TRANSACTION_TYPES),
+            "is_fraud": np.int8,
+        }
+    )
+
+
+def _partition_name(first_hour: int, last_hour: int) -> str:
+    """Directory name of the partition of an hour range
+
+    Args:
+        first_hour (int): The first hour of the partition
+        last_hour (int): The last hour of the partition
+
+    Returns:
+        str: ex. hours=0001-0024
+    """
+
+    return f"hours={first_hour:04d}-{last_hour:04d}"
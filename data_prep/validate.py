@@ -2,7 +2,25 @@ from pandera.typing import DataFrame, Series
 import pandera as pa
 import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Tuple
+import math
+import os
+
+from data_prep.clean import SCHEMA_VERSION
+from data_prep.compact import TRANSACTION_TYPES, compact_df
+
+
+class PartitionedSchemaErrors(ValueError):
+    """Lazy validation failures merged across the partitions of a DataFrame."""
+
+    def __init__(self, failure_cases: pd.DataFrame):
+        # the failure cases of every partition ("index" is the row offset in the full data)
+        self.failure_cases = failure_cases
+        super().__init__(
+            f"{failure_cases.shape[0]} schema failure cases found:\n{failure_cases.head(20)}"
+        )
 
 
 class PaySimSchema(pa.SchemaModel):
@@ -20,13 +38,165 @@ class PaySimSchema(pa.SchemaModel):
     is_fraud: Series[int] = pa.Field(nullable=False, ge=0, le=1)
 
 
-@pa.check_types(lazy=True)
-def validate_df(path: Path) -> DataFrame[PaySimSchema]:
+class CompactPaySimSchema(PaySimSchema):
+    """Schema for PaySim dataset with compact dtypes (see data_prep.compact.compact_df)."""
+
+    hour: Series[pa.Int16] = pa.Field(nullable=False, ge=1)
+    type: Series[pd.CategoricalDtype] = pa.Field(
+        nullable=False, dtype_kwargs={"categories": TRANSACTION_TYPES}
+    )
+    initiator_id: Series[pa.Int32] = pa.Field(nullable=False, ge=0)
+    target_id: Series[pa.Int32] = pa.Field(nullable=False, ge=0)
+    is_fraud: Series[pa.Int8] = pa.Field(nullable=False, ge=0, le=1)
+
+
+def validate_df(
+    path: Path, compact: bool = False
+) -> DataFrame[PaySimSchema] | Tuple[DataFrame[CompactPaySimSchema], pd.Index]:
     """Validates the data in a Pandas DataFrame
 
     Args:
         path (Path): The file path to the Pandas DataFrame
+        compact (bool, optional): Validate (and return) the data with compact dtypes together with its account ID lookup table. Defaults to False.
+    """
+
+    # read CSV file into dataframe
+    df = pd.read_csv(path, encoding="utf-8")
+
+    # validate with the default dtypes
+    if not compact:
+        return validate_frame(df)
+
+    # convert to compact dtypes and validate those
+    df, account_ids = compact_df(df)
+    return validate_compact_frame(df), account_ids
+
+
+@pa.check_types(lazy=True)
+def validate_frame(df: pd.DataFrame) -> DataFrame[PaySimSchema]:
+    """Validates the data in an already loaded Pandas DataFrame
+
+    Args:
+        df (pd.DataFrame): The cleaned PaySim data
+    """
+
+    # return the dataframe so it is checked against the schema
+    return df
+
+
+@pa.check_types(lazy=True)
+def validate_compact_frame(df: pd.DataFrame) -> DataFrame[CompactPaySimSchema]:
+    """Validates an already loaded Pandas DataFrame with compact dtypes
+
+    Args:
+        df (pd.DataFrame): The cleaned PaySim data with compact dtypes
     """
 
-    # return read CSV file into dataframe
-    return pd.read_csv(path, encoding="utf-8")
+    # return the dataframe so it is checked against the schema
+    return df
+
+
+def validate_partitioned(
+    data: pd.DataFrame | Path,
+    mode: str = "full",
+    partitions: int = None,
+    compact: bool = False,
+    confidence: float = 0.99,
+    defect_rate: float = 0.001,
+) -> pd.DataFrame:
+    """Validate the PaySim data in partitions across a process pool
+
+    "full" validates every row. "fast" validates a random sample just large enough to
+    find at least one failing row with the given confidence when at least defect_rate
+    of the rows fail the schema.
+
+    Args:
+        data (pd.DataFrame | Path): The cleaned PaySim data or the path of the cleaned CSV file
+        mode (str, optional): "full" or "fast". Defaults to "full".
+        partitions (int, optional): The number of partitions (and processes). Defaults to the number of CPUs.
+        compact (bool, optional): Validate against CompactPaySimSchema. Defaults to False.
+        confidence (float, optional): The confidence of the fast check. Defaults to 0.99.
+        defect_rate (float, optional): The smallest share of failing rows the fast check must detect. Defaults to 0.001.
+
+    Raises:
+        ValueError: confidence or defect_rate is not strictly between 0 and 1
+        PartitionedSchemaErrors: The merged failure cases of all partitions
+
+    Returns:
+        pd.DataFrame: The validated data
+    """
+
+    # assert that the validation mode is supported
+    assert mode in ("full", "fast")
+    # the sample size of the fast check is only defined for probabilities in (0, 1)
+    if not 0 < confidence < 1:
+        raise ValueError(
+            f"confidence must be between 0 and 1 (exclusive), got {confidence}"
+        )
+    if not 0 < defect_rate < 1:
+        raise ValueError(
+            f"defect_rate must be between 0 and 1 (exclusive), got {defect_rate}"
+        )
+
+    # the schema to validate against
+    schema = CompactPaySimSchema if compact else PaySimSchema
+    # default to one partition per CPU
+    partitions = partitions or os.cpu_count()
+
+    # read CSV file into dataframe
+    df = pd.read_csv(data, encoding="utf-8") if isinstance(data, (str, Path)) else data
+
+    # rows that are validated (the original index is kept so failures point at the full data)
+    rows = df
+    if mode == "fast":
+        # sample size for detecting defect_rate with the given confidence
+        sample_size = math.ceil(math.log(1 - confidence) / math.log(1 - defect_rate))
+        rows = df.sample(min(sample_size, df.shape[0]), random_state=121).sort_index()
+        print(
+            f"Fast check: validating {rows.shape[0]} of {df.shape[0]} rows "
+            f"({confidence:.0%} confidence of catching a {defect_rate:.2%} failure rate)"
+        )
+
+    # split the rows into contiguous partitions
+    bounds = range(0, rows.shape[0], max(1, math.ceil(rows.shape[0] / partitions)))
+    parts = [rows.iloc[start : start + bounds.step] for start in bounds]
+
+    # validate the partitions in parallel (a single partition is validated in-process)
+    if len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+            failures = list(
+                executor.map(_validate_partition, [schema] * len(parts), parts)
+            )
+    else:
+        failures = [_validate_partition(schema, part) for part in parts]
+
+    # merge the failure cases of every partition
+    failures = [failure for failure in failures if failure is not None]
+    if failures:
+        # column level failures (without a row index) are reported once
+        failure_cases = pd.concat(failures, ignore_index=True).drop_duplicates(
+            subset=["schema_context", "column", "check", "index"]
+        )
+        raise PartitionedSchemaErrors(failure_cases.reset_index(drop=True))
+
+    return df
+
+
+def _validate_partition(schema: type, part: pd.DataFrame) -> pd.DataFrame:
+    """Lazily validate one partition
+
+    Args:
+        schema (type): The pandera schema model
+        part (pd.DataFrame): The rows of the partition
+
+    Returns:
+        pd.DataFrame: The failure cases of the partition (None when it is valid)
+    """
+
+    try:
+        schema.validate(part, lazy=True)
+    # return the failure cases instead of raising them across processes
+    except pa.errors.SchemaErrors as err:
+        return err.failure_cases
+
+    return None
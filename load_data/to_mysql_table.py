@@ -1,33 +1,124 @@
 from mysql.connector import MySQLConnection
-from sqlite3 import OperationalError
 import mysql.connector
 import mysql
+import pandas as pd
+import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from typing import Callable, Tuple
+from functools import partial
+from pathlib import Path
+import tempfile
+import operator
+import sqlite3
+import queue
+import time
 import os
 
-# get the .env file
-load_dotenv(".env")
-# get MySQL auth
-MYSQL_USERNAME = os.getenv("mysql_user")
-MYSQL_PASSWORD = os.getenv("mysql_password")
+from data_prep.clean import CLEANED_PATH, COLUMN_ORDER
+from data_prep.cache import file_digest
 
+# the .env file holding the MySQL auth
+ENV_PATH = ".env"
 
-def load_csv_into_mysql() -> None:
-    """Load the cleaned CSV file into a MySQL table."""
+# table that records which row ranges of a file have been committed (replaces
+# load_checkpoints, whose batches were only valid for the batch size they were loaded with)
+CHECKPOINT_TABLE = "load_row_ranges"
+# portable (MySQL and SQLite) definition of the checkpoint table
+CHECKPOINT_DDL = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+    source VARCHAR(255) NOT NULL,
+    first_row BIGINT NOT NULL,
+    row_count INT NOT NULL,
+    PRIMARY KEY (source, first_row)
+)
+"""
+# table that records the file the rows of every target table were loaded from: its size
+# and digest, and the rows (and bytes) that are all committed
+SOURCE_TABLE = "load_sources"
+# portable (MySQL and SQLite) definition of the source table
+SOURCE_DDL = f"""
+CREATE TABLE IF NOT EXISTS {SOURCE_TABLE} (
+    source VARCHAR(255) NOT NULL,
+    size BIGINT NOT NULL,
+    digest CHAR(64) NOT NULL,
+    committed_rows BIGINT NOT NULL,
+    committed_bytes BIGINT NOT NULL,
+    PRIMARY KEY (source)
+)
+"""
+# SQLite stand-in for the MySQL transactions table
+SQLITE_TRANSACTIONS_DDL = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hour INT NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    amount DECIMAL(15, 2) NOT NULL,
+    initiator_id VARCHAR(11) NOT NULL,
+    initiator_old_balance DECIMAL(15, 2) NOT NULL,
+    initiator_new_balance DECIMAL(15, 2) NOT NULL,
+    target_id VARCHAR(11) NOT NULL,
+    target_old_balance DECIMAL(15, 2) NOT NULL,
+    target_new_balance DECIMAL(15, 2) NOT NULL,
+    is_fraud INT NOT NULL
+)
+"""
+
+
+def load_csv_into_mysql(
+    csv_path: Path = CLEANED_PATH,
+    batch_size: int = 50000,
+    workers: int = 4,
+    method: str = "executemany",
+) -> dict:
+    """Load the cleaned CSV file into a MySQL table.
+
+    Args:
+        csv_path (Path, optional): The cleaned CSV file. Defaults to CLEANED_PATH.
+        batch_size (int, optional): The number of rows committed per batch. Defaults to 50000.
+        workers (int, optional): The number of parallel connections. Defaults to 4.
+        method (str, optional): "executemany" or "infile" (LOAD DATA LOCAL INFILE). Defaults to "executemany".
+
+    Returns:
+        dict: The load statistics (see bulk_load)
+    """
+
+    # stream the cleaned data into the table
+    return bulk_load(
+        csv_path,
+        setup_paysim_database(),
+        batch_size=batch_size,
+        workers=workers,
+        method=method,
+    )
+
+
+def setup_paysim_database() -> Callable:
+    """Create the paysim database and its transactions table (when they are missing)
+
+    Returns:
+        Callable: Opens a new connection to the paysim database (see bulk_load)
+    """
 
     # get MySQL connection object
     conn = mysql_connect("localhost", None)
-    # execute .sql file to load cleaned Paysim data into table
-    execute_sql_from_file(".load_data/setup_and_import.sql", conn)
+    # execute .sql file to create the database and table
+    execute_sql_from_file("./load_data/setup_and_import.sql", conn)
+    conn.close()
 
+    return partial(mysql_connect, "localhost", "paysim", allow_local_infile=True)
 
-def mysql_connect(host: str, db_name: str) -> MySQLConnection:
+
+def mysql_connect(
+    host: str, db_name: str, allow_local_infile: bool = False
+) -> MySQLConnection:
     """Connect to MySQL database
 
     Args:
         host (str): Host of the database
         db_name (str): The name of the database that you will be connecting to
+        allow_local_infile (bool, optional): Allow LOAD DATA LOCAL INFILE on the connection. Defaults to False.
 
     Raises:
         err: MySQL connection error
@@ -36,6 +127,9 @@ def mysql_connect(host: str, db_name: str) -> MySQLConnection:
         MySQLConnection: The connection object to MySQL database
     """
 
+    # get MySQL auth (read on first connect, not at import)
+    username, password = mysql_credentials()
+
     # try to connect to db
     try:
         # if db_name is NOT None
@@ -43,17 +137,19 @@ def mysql_connect(host: str, db_name: str) -> MySQLConnection:
             # connect to a mySQL db
             db = mysql.connector.connect(
                 host=host,
-                user=MYSQL_USERNAME,
-                passwd=MYSQL_PASSWORD,
+                user=username,
+                passwd=password,
                 database=db_name,
+                allow_local_infile=allow_local_infile,
             )
         # if db_name is None
         else:
             # connect to a mySQL server (not a specific database on server)
             db = mysql.connector.connect(
                 host=host,
-                user=MYSQL_USERNAME,
-                passwd=MYSQL_PASSWORD,
+                user=username,
+                passwd=password,
+                allow_local_infile=allow_local_infile,
             )
 
         # return the db cursor object
@@ -64,6 +160,43 @@ def mysql_connect(host: str, db_name: str) -> MySQLConnection:
         raise err
 
 
+def mysql_credentials(env_path: Path = ENV_PATH) -> Tuple[str, str]:
+    """Read the MySQL username and password from the .env file
+
+    Args:
+        env_path (Path, optional): The .env file. Defaults to ENV_PATH.
+
+    Returns:
+        Tuple[str, str]: The username and password (None when not set)
+    """
+
+    # get the .env file
+    load_dotenv(env_path)
+    # get MySQL auth
+    return os.getenv("mysql_user"), os.getenv("mysql_password")
+
+
+def sqlite_connect(path: Path) -> sqlite3.Connection:
+    """Connect to a SQLite database standing in for MySQL (creates the transactions table)
+
+    Args:
+        path (Path): The SQLite database file
+
+    Returns:
+        sqlite3.Connection: The connection object to the SQLite database
+    """
+
+    # the connection is handed between the threads of the loader
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    # MOD (used by analysis.backends) is only built into SQLite with the math functions
+    conn.create_function("MOD", 2, operator.mod, deterministic=True)
+    # create the transactions table
+    conn.execute(SQLITE_TRANSACTIONS_DDL)
+    conn.commit()
+
+    return conn
+
+
 def execute_sql_from_file(filename: str, conn: MySQLConnection) -> None:
     """Execute a SQL script from file
 
@@ -73,12 +206,17 @@ def execute_sql_from_file(filename: str, conn: MySQLConnection) -> None:
     """
 
     # open and read the file as a single buffer
-    fd = open(filename, "r")
-    sql_file = fd.read()
-    fd.close()
+    with open(filename, "r") as fd:
+        sql_file = fd.read()
 
-    # split SQL commands by ";"
-    sql_commands = sql_file.split(";")
+    # drop comment lines so they are not sent as (empty) statements
+    sql_lines = [line for line in sql_file.splitlines() if not line.startswith("--")]
+    # split SQL commands by ";" and skip blank commands
+    sql_commands = [
+        command.strip()
+        for command in "\n".join(sql_lines).split(";")
+        if command.strip()
+    ]
 
     # create cursor object
     with conn.cursor() as curr:
@@ -87,6 +225,314 @@ def execute_sql_from_file(filename: str, conn: MySQLConnection) -> None:
             try:
                 curr.execute(command)
             # catch exception is there is an error with the SQL command
-            except OperationalError as err:
+            except mysql.connector.Error as err:
                 # log error
                 print(f"Command skipped: {err}")
+
+    # commit the script
+    conn.commit()
+
+
+def bulk_load(
+    csv_path: Path,
+    connect: Callable,
+    batch_size: int = 50000,
+    workers: int = 4,
+    method: str = "executemany",
+    table: str = "transactions",
+) -> dict:
+    """Stream a cleaned CSV file into a table in batches over a pool of parallel connections
+
+    Each batch is a contiguous row range of the file (and so an hour range, as the data is
+    ordered by hour). A batch is inserted and its row range recorded in the checkpoint
+    table in the same transaction, so a rerun after a failure (with any batch size) only
+    inserts the rows that are not committed yet.
+
+    The checkpoints belong to the target table. They stay valid while the file only grows
+    (ex. rows appended by pipeline.incremental): the rows committed by a previous load are
+    skipped without being read again and only the appended rows are inserted. When the
+    file the table was loaded from is no longer the start of csv_path (ex. the data was
+    cleaned again), the table and its checkpoints are emptied and every row is loaded.
+
+    Args:
+        csv_path (Path): The cleaned CSV file
+        connect (Callable): Returns a new DB-API connection (MySQL or SQLite)
+        batch_size (int, optional): The number of rows committed per batch. Defaults to 50000.
+        workers (int, optional): The number of parallel connections. Defaults to 4.
+        method (str, optional): "executemany" or "infile" (LOAD DATA LOCAL INFILE, MySQL only). Defaults to "executemany".
+        table (str, optional): The target table. Defaults to "transactions".
+
+    Returns:
+        dict: The number of rows and batches loaded, rows and batches skipped, seconds and rows/s
+    """
+
+    # assert that the load method is supported
+    assert method in ("executemany", "infile")
+
+    # the checkpoints are kept per target table
+    source = table
+
+    # open the pool of connections
+    pool = queue.Queue()
+    for _ in range(workers):
+        pool.put(connect())
+
+    # create the checkpoint tables and read what a previous load committed
+    conn = pool.get()
+    placeholder = "?" if isinstance(conn, sqlite3.Connection) else "%s"
+    cursor = conn.cursor()
+    cursor.execute(CHECKPOINT_DDL)
+    cursor.execute(SOURCE_DDL)
+    cursor.execute(
+        f"SELECT size, digest, committed_rows, committed_bytes FROM {SOURCE_TABLE} "
+        f"WHERE source = {placeholder}",
+        (source,),
+    )
+    record = cursor.fetchone()
+
+    # the committed rows are rows of this file when the file they were loaded from is
+    # still its start (anything else is other data -> replace the table)
+    size = os.path.getsize(csv_path)
+    if (
+        record is None
+        or record[0] > size
+        or file_digest(csv_path, size=record[0]) != record[1]
+    ):
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"DELETE FROM {CHECKPOINT_TABLE} WHERE source = {placeholder}", (source,)
+        )
+        committed_rows, committed_bytes = 0, 0
+    else:
+        committed_rows, committed_bytes = record[2], record[3]
+
+    # record the file being loaded before any batch is committed
+    cursor.execute(
+        f"DELETE FROM {SOURCE_TABLE} WHERE source = {placeholder}", (source,)
+    )
+    cursor.execute(
+        f"INSERT INTO {SOURCE_TABLE} "
+        f"(source, size, digest, committed_rows, committed_bytes) "
+        f"VALUES ({', '.join([placeholder] * 5)})",
+        (source, size, file_digest(csv_path), committed_rows, committed_bytes),
+    )
+
+    # the row ranges committed after the rows that are all committed
+    cursor.execute(
+        f"SELECT first_row, row_count FROM {CHECKPOINT_TABLE} "
+        f"WHERE source = {placeholder} AND first_row >= {placeholder} "
+        f"ORDER BY first_row",
+        (source, committed_rows),
+    )
+    committed = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    cursor.close()
+    conn.commit()
+    pool.put(conn)
+
+    # initialize statistics
+    stats = {"rows": 0, "batches": 0, "skipped_rows": 0, "skipped_batches": 0}
+    # start the timer
+    start = time.perf_counter()
+
+    try:
+        # insert batches concurrently while reading at most 2 batches ahead per worker
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            with open(csv_path, "rb") as fd, _read_after(
+                fd, committed_bytes, batch_size
+            ) as reader:
+                # the rows that are all committed are skipped without being read
+                stats["skipped_rows"] += committed_rows
+                first_row = committed_rows
+                for chunk in reader:
+                    # the row ranges of the batch that no previous run committed
+                    ranges = _uncommitted_ranges(first_row, chunk.shape[0], committed)
+                    uncommitted = sum(stop - start for start, stop in ranges)
+                    stats["skipped_rows"] += chunk.shape[0] - uncommitted
+                    stats["skipped_batches"] += int(uncommitted == 0)
+
+                    for start, stop in ranges:
+                        # wait for a free slot
+                        if len(pending) >= 2 * workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            _collect(done, stats)
+
+                        # insert the row range on a pooled connection
+                        rows = chunk.iloc[start - first_row : stop - first_row]
+                        pending.add(
+                            executor.submit(
+                                _load_batch, pool, rows, start, source, table, method
+                            )
+                        )
+                    first_row += chunk.shape[0]
+
+            # wait for the remaining batches
+            _collect(wait(pending).done, stats)
+
+        # every row of the file is committed -> the next load starts after them
+        conn = pool.get()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE {SOURCE_TABLE} SET committed_rows = {placeholder}, "
+            f"committed_bytes = {placeholder} WHERE source = {placeholder}",
+            (first_row, size, source),
+        )
+        cursor.close()
+        conn.commit()
+        pool.put(conn)
+    # close the pool
+    finally:
+        while not pool.empty():
+            pool.get().close()
+
+    # throughput of the load
+    seconds = time.perf_counter() - start
+    stats["seconds"] = round(seconds, 2)
+    stats["rows_per_second"] = round(stats["rows"] / seconds)
+    # report the throughput
+    print(
+        f"Loaded {stats['rows']} rows in {stats['batches']} batches "
+        f"({stats['skipped_rows']} rows already committed) in {stats['seconds']}s "
+        f"-> {stats['rows_per_second']} rows/s"
+    )
+
+    return stats
+
+
+def _read_after(fd, offset: int, chunksize: int) -> pd.io.parsers.TextFileReader:
+    """Read the rows of a CSV file that start after a byte offset, in chunks
+
+    Args:
+        fd: The CSV file, opened in binary mode
+        offset (int): The byte offset of the first row to read (0 -> from the header)
+        chunksize (int): The number of rows per chunk
+
+    Returns:
+        pd.io.parsers.TextFileReader: The reader of the chunks
+    """
+
+    # the whole file
+    if offset == 0:
+        return pd.read_csv(fd, encoding="utf-8", chunksize=chunksize)
+
+    # the rows after the offset, with the column names of the header
+    columns = fd.readline().decode("utf-8").strip().split(",")
+    fd.seek(offset)
+    return pd.read_csv(
+        fd, encoding="utf-8", header=None, names=columns, chunksize=chunksize
+    )
+
+
+def _uncommitted_ranges(first_row: int, rows: int, committed: np.ndarray) -> list:
+    """The row ranges of a batch that are not covered by committed row ranges
+
+    Args:
+        first_row (int): The position of the first row of the batch in the file
+        rows (int): The number of rows of the batch
+        committed (np.ndarray): The (first_row, row_count) of every committed range, sorted and disjoint
+
+    Returns:
+        list: The (start, stop) row positions of every uncommitted range, in order
+    """
+
+    # nothing is committed yet
+    if committed.shape[0] == 0:
+        return [(first_row, first_row + rows)]
+
+    # the committed range each row could fall in (the last one starting at or before it)
+    positions = np.arange(first_row, first_row + rows)
+    candidate = np.searchsorted(committed[:, 0], positions, side="right") - 1
+    covered = (candidate >= 0) & (
+        positions < committed[candidate, 0] + committed[candidate, 1]
+    )
+
+    # the boundaries of the runs of uncovered rows
+    edges = np.flatnonzero(np.diff(np.concatenate([[True], covered, [True]])))
+    starts, stops = edges[::2], edges[1::2]
+
+    return [
+        (first_row + int(start), first_row + int(stop))
+        for start, stop in zip(starts, stops)
+    ]
+
+
+def _collect(done: set, stats: dict) -> None:
+    """Add the row counts of finished batches to the statistics (re-raising their errors)
+
+    Args:
+        done (set): Finished futures of _load_batch
+        stats (dict): The load statistics
+    """
+
+    for future in done:
+        stats["rows"] += future.result()
+        stats["batches"] += 1
+
+
+def _load_batch(
+    pool: queue.Queue,
+    chunk: pd.DataFrame,
+    first_row: int,
+    source: str,
+    table: str,
+    method: str,
+) -> int:
+    """Insert one batch and record its row range in the checkpoint table in a single transaction
+
+    Args:
+        pool (queue.Queue): The pool of connections
+        chunk (pd.DataFrame): The rows of the batch
+        first_row (int): The position of the first row of the batch within the file
+        source (str): The checkpoint key of the file
+        table (str): The target table
+        method (str): "executemany" or "infile"
+
+    Returns:
+        int: The number of rows inserted
+    """
+
+    # borrow a connection from the pool
+    conn = pool.get()
+    placeholder = "?" if isinstance(conn, sqlite3.Connection) else "%s"
+
+    try:
+        cursor = conn.cursor()
+
+        # LOAD DATA LOCAL INFILE from a temporary CSV file of the batch
+        if method == "infile":
+            with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as fd:
+                chunk[COLUMN_ORDER].to_csv(fd, index=False, header=False)
+            try:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE '{Path(fd.name).as_posix()}' "
+                    f"INTO TABLE {table} FIELDS TERMINATED BY ',' "
+                    f"LINES TERMINATED BY '\\n' ({', '.join(COLUMN_ORDER)})"
+                )
+            finally:
+                os.unlink(fd.name)
+        # parameterized multi-row insert
+        else:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(COLUMN_ORDER)}) "
+                f"VALUES ({', '.join([placeholder] * len(COLUMN_ORDER))})",
+                chunk[COLUMN_ORDER].to_numpy(dtype=object).tolist(),
+            )
+
+        # record the batch in the same transaction
+        cursor.execute(
+            f"INSERT INTO {CHECKPOINT_TABLE} (source, first_row, row_count) "
+            f"VALUES ({placeholder}, {placeholder}, {placeholder})",
+            (source, first_row, chunk.shape[0]),
+        )
+        cursor.close()
+        # commit the batch
+        conn.commit()
+    # undo the partial batch so it is retried on the next run
+    except Exception:
+        conn.rollback()
+        raise
+    # return the connection to the pool
+    finally:
+        pool.put(conn)
+
+    return chunk.shape[0]
@@ -1 +1,2 @@
-from .log import setup_logger, get_logger
+from .log import setup_logger, get_logger, JsonFormatter
+from .instrument import instrument, instrumented, count_rows, summary_table
@@ -0,0 +1,262 @@
+import pandas as pd
+import numpy as np
+
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from logging import Logger
+from pathlib import Path
+import tracemalloc
+import threading
+import functools
+import resource
+import cProfile
+import pstats
+import time
+import sys
+import io
+
+from .log import get_logger
+
+# the logger the stage records are written to
+STAGE_LOGGER = "pipeline"
+# where the cProfile stats of profiled stages are written
+PROFILE_DIR = "./logger/logs/profiles"
+# every stage record of this process
+STAGE_RECORDS = []
+# guards STAGE_RECORDS (stages may run in threads)
+_records_lock = threading.Lock()
+
+
+@contextmanager
+def instrument(
+    stage: str,
+    rows_in: int = None,
+    logger: Logger = None,
+    profile: bool = False,
+    trace_memory: bool = False,
+    profile_dir: Path = PROFILE_DIR,
+) -> Iterator[dict]:
+    """Time a stage and log a structured record of it
+
+    The record holds the duration, rows in/out, the growth of the peak RSS and the
+    throughput. Set record["rows_out"] (and optionally record["status"]) inside the block.
+    The peak RSS is process wide, so stages running concurrently share it; trace_memory
+    measures the peak of the allocations made while the stage runs instead (slower).
+    tracemalloc is process wide too: its peak includes the allocations of every thread,
+    so Pipeline.run runs stages one at a time when tracing them in threads.
+
+    Args:
+        stage (str): The name of the stage
+        rows_in (int, optional): The number of rows the stage reads. Defaults to None.
+        logger (Logger, optional): Where the record is written. Defaults to the STAGE_LOGGER logger.
+        profile (bool, optional): Run the stage under cProfile and write its stats to profile_dir. Defaults to False.
+        trace_memory (bool, optional): Measure the peak allocations of the stage with tracemalloc. Defaults to False.
+        profile_dir (Path, optional): Where the cProfile stats are written. Defaults to PROFILE_DIR.
+
+    Yields:
+        Iterator[dict]: The record of the stage
+    """
+
+    # default to the stage logger
+    logger = logger or get_logger(STAGE_LOGGER, "stages")
+    record = {"stage": stage, "rows_in": rows_in, "rows_out": None}
+
+    # start tracing allocations (if not traced already)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+
+    # start profiling
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    # peak RSS before the stage
+    rss_before = _peak_rss_mb()
+    # start the timer
+    start = time.perf_counter()
+
+    try:
+        yield record
+        # the block may set its own status (ex. "memoized")
+        record.setdefault("status", "ok")
+    except BaseException as err:
+        record["status"] = "failed"
+        record["error"] = repr(err)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+
+        # stop profiling and write the stats
+        if profiler is not None:
+            profiler.disable()
+            record["profile_path"] = _write_profile(profiler, stage, profile_dir)
+            logger.info(_top_functions(profiler))
+
+        # the peak of the traced allocations during the stage
+        if trace_memory:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            record["traced_peak_mb"] = round((traced_peak - traced_before) / 2**20, 1)
+            if started_tracing:
+                tracemalloc.stop()
+
+        # duration, memory and throughput of the stage
+        rss_after = _peak_rss_mb()
+        rows = (
+            record["rows_in"] if record["rows_in"] is not None else record["rows_out"]
+        )
+        record.update(
+            {
+                "seconds": round(seconds, 3),
+                "peak_rss_mb": round(rss_after, 1),
+                "peak_rss_delta_mb": round(rss_after - rss_before, 1),
+                "rows_per_second": round(rows / seconds)
+                if rows is not None and seconds > 0
+                else None,
+            }
+        )
+
+        # keep and write the record
+        with _records_lock:
+            STAGE_RECORDS.append(record)
+        logger.info(f"stage {stage} {record['status']}", extra={"fields": record})
+
+
+def instrumented(stage: str = None, **options) -> Callable:
+    """Decorator that instruments every call of a function as a stage
+
+    The rows in are counted from the DataFrame (or (DataFrame, ...) tuple) arguments and
+    the rows out from the return value.
+
+    ex. @instrumented("hourly", trace_memory=True)
+
+    Args:
+        stage (str, optional): The name of the stage. Defaults to the name of the function.
+        **options: Passed on to instrument (logger, profile, trace_memory, profile_dir)
+
+    Returns:
+        Callable: The decorator
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(
+                stage or func.__name__, count_rows(*args, *kwargs.values()), **options
+            ) as record:
+                result = func(*args, **kwargs)
+                record["rows_out"] = count_rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def count_rows(*objects) -> int:
+    """Count the rows of DataFrames, Series and arrays (others are ignored)
+
+    Args:
+        *objects: The objects to count (a tuple counts as its first element, ex. a compact df)
+
+    Returns:
+        int: The total number of rows (None when there is nothing to count)
+    """
+
+    # number of rows of every countable object
+    counts = []
+    for obj in objects:
+        if isinstance(obj, tuple) and obj:
+            obj = obj[0]
+        if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+            counts.append(obj.shape[0])
+
+    return sum(counts) if counts else None
+
+
+def summary_table(records: list = None) -> pd.DataFrame:
+    """Summarize stage records as a table
+
+    Args:
+        records (list, optional): Stage records. Defaults to every record of this process.
+
+    Returns:
+        pd.DataFrame: Status, duration, rows, throughput and memory per stage (slowest first)
+    """
+
+    # default to every record of this process
+    if records is None:
+        with _records_lock:
+            records = list(STAGE_RECORDS)
+
+    columns = [
+        "stage",
+        "status",
+        "seconds",
+        "rows_in",
+        "rows_out",
+        "rows_per_second",
+        "peak_rss_delta_mb",
+        "traced_peak_mb",
+    ]
+    summary = pd.DataFrame.from_records(records).reindex(columns=columns)
+    if summary.empty:
+        return summary
+    # counts stay integers next to the stages that did not count
+    counts = ["rows_in", "rows_out", "rows_per_second"]
+    summary[counts] = summary[counts].astype("Int64")
+
+    # drop the columns no stage measured
+    return (
+        summary.dropna(axis=1, how="all")
+        .sort_values("seconds", ascending=False, na_position="last")
+        .reset_index(drop=True)
+    )
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident memory of the process so far
+
+    Returns:
+        float: The peak RSS in MB (ru_maxrss is in KB on Linux and bytes on macOS)
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _write_profile(profiler: cProfile.Profile, stage: str, profile_dir: Path) -> str:
+    """Write the cProfile stats of a stage (open with pstats or snakeviz)
+
+    Args:
+        profiler (cProfile.Profile): The profiler of the stage
+        stage (str): The name of the stage
+        profile_dir (Path): Where the stats are written
+
+    Returns:
+        str: The path of the stats file
+    """
+
+    Path(profile_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(profile_dir) / f"{stage}.prof"
+    profiler.dump_stats(path)
+    return str(path)
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int = 20) -> str:
+    """The functions with the highest cumulative time
+
+    Args:
+        profiler (cProfile.Profile): The profiler of the stage
+        limit (int, optional): The number of functions. Defaults to 20.
+
+    Returns:
+        str: The pstats report
+    """
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(limit)
+    return report.getvalue()
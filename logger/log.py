@@ -1,22 +1,57 @@
 from logging import Logger, getLogger
 import logging
+import json
 
 
-def setup_logger(logger_tag: str, file_path: str, logging_level: str) -> Logger:
+class JsonFormatter(logging.Formatter):
+    """Formats every log message as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a log message as JSON
+
+        Args:
+            record (logging.LogRecord): The log message
+
+        Returns:
+            str: The time, logger, level and message (or the fields of a structured record)
+        """
+
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "logger": record.name,
+            "level": record.levelname,
+        }
+        # structured records are passed with extra={"fields": {...}}
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            entry.update(fields)
+        else:
+            entry["message"] = record.getMessage()
+
+        return json.dumps(entry, default=str)
+
+
+def setup_logger(
+    logger_tag: str, file_path: str, logging_level: str, structured: bool = False
+) -> Logger:
     """Setup a logger for project logging
 
     Args:
         logger_tag (str): The tag of the logger
         file_name (str): Where the
         logging_level (str): The level of the logger | ex. (FATAL, ERROR, WARN, INFO, DEBUG, TRACE, ALL, OFF)
+        structured (bool, optional): Write one JSON object per message. Defaults to False.
 
     Returns:
         Logger: The logging channel that messages will be written to
     """
     # set the format for log messages
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
-    )
+    if structured:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
+        )
 
     # initialize handler
     handler = ""
@@ -1,59 +1,272 @@
-import pandas as pd
-
-from data_prep.clean import clean_df, dataframe_insights
-from analysis.filter_data import create_pivot_table
-from data_prep.validate import validate_df
-from analysis.filter_data import (
-    get_transactions_over_amount,
-    transactional_data_per_hour,
-)
-from load_data.to_mysql_table import load_csv_into_mysql
-from analysis.fraud_detection import (
-    consecutive_fraudulent_hours,
-    zero_amount_transactions,
-    fraud_detection,
-)
+import argparse
+import sys
 
-if __name__ == "__main__":
-    # read original CSV file into data
-    raw_df = pd.read_csv("./data/input/paysim_data.csv")
-    # get some general info on the raw data
-    dataframe_insights(raw_df)
-
-    # clean the data
-    clean_df("./data/input/paysim_data.csv")
-    # validate the cleaned data
-    cleaned_df = validate_df("./data/output/cleaned_paysim_data.csv")
-    # insert cleaned df into mysql table
-    load_csv_into_mysql()
-
-    # write filtered dataframe to CSV file
-    get_transactions_over_amount(cleaned_df, "amount", 200000.00)
-
-    # get number of transactions where the amount == 0
-    zero_amount_transactions = zero_amount_transactions(cleaned_df)
-
-    # create pivot table from cleaned_df
-    pivot_table = create_pivot_table(cleaned_df)
-
-    # get number transactional volume per hour
-    transactions_by_hour = transactional_data_per_hour(cleaned_df, 1, 743)
-    # hours that consist of 100% fraudulent transactions
-    df_fraudulent_hours = transactions_by_hour[
-        transactions_by_hour["percentage_of_fradulent_transactions"] == 100
-    ]
-    # convert "hour" column to list
-    fraudulent_hours = df_fraudulent_hours["hour"].to_list()
-    # get the number of instances of consecutive fraud and average number of consecutive fraudulent hours
-    consecutive_fraudulent_hours(fraudulent_hours)
-
-    # create dataframe of transactions in fraudulent hours
-    transactions_in_fraudulent_hours = cleaned_df[
-        cleaned_df["hour"].isin(fraudulent_hours)
-    ]
-
-    # get the precision score from the random forest
-    avg_precision_score = fraud_detection(cleaned_df)
-    print(
-        f"The average precision score of the current fraud detection system is: {avg_precision_score}%"
+# the heavy dependencies (pandas, pandera, sklearn, the MySQL driver) are imported by the
+# subcommands that use them, so --help and argument errors return immediately
+
+# where the structured stage records are written
+STAGE_LOG_PATH = "./logger/logs/pipeline.log"
+# the pipeline stage run by every subcommand (together with the stages it needs)
+COMMAND_STAGES = {
+    "insights": "insights",
+    "clean": "cleaned",
+    "load": "load_mysql",
+    "hourly": "hourly",
+    "pivot": "pivot",
+    "detect": "detect",
+    "evaluate": "evaluate",
+}
+
+
+def backend(value: str) -> str:
+    """Parse the --backend option (see pipeline.stages.build_pipeline)
+
+    Args:
+        value (str): "pandas", "mysql" or the path of a SQLite database
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a backend
+
+    Returns:
+        str: The backend
+    """
+
+    if value in ("pandas", "mysql") or value.endswith((".db", ".sqlite")):
+        return value
+    raise argparse.ArgumentTypeError(
+        f"{value!r} is not pandas, mysql or a SQLite database (.db, .sqlite)"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Declare the subcommands and their options
+
+    Returns:
+        argparse.ArgumentParser: The command line parser
+    """
+
+    # options shared by every subcommand that runs pipeline stages
+    stage_options = argparse.ArgumentParser(add_help=False)
+    stage_options.add_argument(
+        "--workers", type=int, default=None, help="Number of stages run at once"
+    )
+    stage_options.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Run independent stages in threads or processes",
     )
+    stage_options.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        help="Run this stage under cProfile (stats in ./logger/logs/profiles)",
+    )
+    stage_options.add_argument(
+        "--backend",
+        type=backend,
+        default="pandas",
+        help="Aggregate the hourly, pivot and over amount stages with pandas, in MySQL "
+        "(mysql) or in a SQLite database standing in for it (its .db path)",
+    )
+    stage_options.add_argument(
+        "--trace-memory",
+        action="append",
+        default=[],
+        help="Trace the allocations of this stage with tracemalloc",
+    )
+
+    parser = argparse.ArgumentParser(description="Analyze the PaySim dataset")
+    commands = parser.add_subparsers(
+        dest="command", metavar="command", help="Defaults to run"
+    )
+
+    # the whole pipeline (or some of its stages)
+    run_parser = commands.add_parser(
+        "run", parents=[stage_options], help="Run the pipeline"
+    )
+    run_parser.add_argument(
+        "--stage",
+        action="append",
+        help="Run only this stage and what it needs (repeatable), ex. --stage hourly",
+    )
+    run_parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Run the analyses out of core over hour range partitions",
+    )
+
+    # one subcommand per stage of interest
+    stage_help = {
+        "insights": "Print general info on the raw data",
+        "clean": "Clean, validate and cache the raw data",
+        "load": "Insert the cleaned data into MySQL",
+        "hourly": "Print the transactional volume per hour",
+        "pivot": "Print the pivot table of the amounts per type",
+        "detect": "Print the average precision of the fraud detection",
+        "evaluate": "Cross-validate the fraud model on time-ordered folds",
+    }
+    stage_parsers = {
+        command: commands.add_parser(command, parents=[stage_options], help=description)
+        for command, description in stage_help.items()
+    }
+    stage_parsers["insights"].add_argument(
+        "--approximate",
+        action="store_true",
+        help="Sketch the cleaned data in one pass and report figures with error bounds",
+    )
+
+    # validate a cleaned CSV file
+    validate_parser = commands.add_parser(
+        "validate", help="Validate a cleaned CSV file against the PaySim schema"
+    )
+    validate_parser.add_argument(
+        "path", nargs="?", default=None, help="Defaults to the cleaned data"
+    )
+    validate_parser.add_argument(
+        "--mode",
+        choices=["full", "fast"],
+        default="full",
+        help="Validate every row or a random sample",
+    )
+
+    # process the rows appended to the raw file since the last run
+    incremental_parser = commands.add_parser(
+        "incremental", help="Process only the rows appended since the last run"
+    )
+    incremental_parser.add_argument(
+        "path", nargs="?", default=None, help="Defaults to the raw data"
+    )
+    incremental_parser.add_argument(
+        "--mysql",
+        action="store_true",
+        help="Also append the new rows to the MySQL table",
+    )
+
+    return parser
+
+
+def run_stages(args: argparse.Namespace, targets: list = None) -> dict:
+    """Run pipeline stages and print where the time and memory went
+
+    Args:
+        args (argparse.Namespace): The parsed options of the subcommand
+        targets (list, optional): The stages to run. Defaults to None (every stage).
+
+    Returns:
+        dict: The output of every stage that was run or loaded, by name
+    """
+
+    from logger import setup_logger, summary_table
+    from pipeline.stages import build_pipeline
+
+    # write one JSON record per stage
+    setup_logger("pipeline", STAGE_LOG_PATH, "INFO", structured=True)
+
+    # run the stages (independent analyses run concurrently, memoized outputs are reused)
+    pipeline = build_pipeline(getattr(args, "partitioned", False), args.backend)
+    try:
+        return pipeline.run(
+            targets,
+            workers=args.workers,
+            executor=args.executor,
+            profile=args.profile,
+            trace_memory=args.trace_memory,
+        )
+    finally:
+        # where the time and memory went
+        print(summary_table(pipeline.records).to_string(index=False))
+
+
+def validate(args: argparse.Namespace) -> int:
+    """Validate a cleaned CSV file and print the failure cases
+
+    Args:
+        args (argparse.Namespace): The parsed options of the subcommand
+
+    Returns:
+        int: The exit status (1 when the file fails the schema)
+    """
+
+    from data_prep.clean import CLEANED_PATH
+    from data_prep.validate import PartitionedSchemaErrors, validate_partitioned
+
+    path = args.path or CLEANED_PATH
+    try:
+        df = validate_partitioned(path, mode=args.mode)
+    except PartitionedSchemaErrors as err:
+        print(err)
+        return 1
+
+    print(f"{df.shape[0]} rows of {path} are valid")
+    return 0
+
+
+def incremental(args: argparse.Namespace) -> None:
+    """Process the rows appended to the raw file and print the updated results
+
+    Args:
+        args (argparse.Namespace): The parsed options of the subcommand
+    """
+
+    from pipeline.incremental import run_incremental
+    from pipeline.stages import INPUT_PATH
+
+    # the connections to the MySQL table the new rows are appended to
+    connect = None
+    if args.mysql:
+        from load_data.to_mysql_table import setup_paysim_database
+
+        connect = setup_paysim_database()
+
+    result = run_incremental(args.path or INPUT_PATH, connect=connect)
+    print(f"{result['new_rows']} new rows processed")
+    print(f"Fraudulent hours: {result['fraudulent_hours']}")
+
+
+def main(argv: list = None) -> int:
+    """Run a subcommand
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to None (sys.argv).
+
+    Returns:
+        int: The exit status
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # no subcommand -> run the whole pipeline
+    if args.command is None:
+        args = parser.parse_args(["run"])
+
+    if args.command == "validate":
+        return validate(args)
+    if args.command == "incremental":
+        incremental(args)
+        return 0
+
+    # the partitioned pipeline aggregates the partitions itself
+    if getattr(args, "partitioned", False) and args.backend != "pandas":
+        parser.error("--backend cannot be combined with --partitioned")
+
+    # subcommands that run one stage (and the stages it needs)
+    targets = args.stage if args.command == "run" else [COMMAND_STAGES[args.command]]
+    if getattr(args, "approximate", False):
+        targets = ["approximate_insights"]
+    outputs = run_stages(args, targets)
+
+    # print the tables the stages return
+    if args.command in ("hourly", "pivot"):
+        print(outputs[COMMAND_STAGES[args.command]].to_string())
+    elif args.command == "clean":
+        print(f"{outputs['cleaned'][0].shape[0]} cleaned rows")
+    elif args.command == "load":
+        print(outputs["load_mysql"])
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+from pyarrow import feather
+import pandas as pd
+
+from typing import Callable
+from pathlib import Path
+import tempfile
+import shutil
+import json
+import io
+import os
+
+from analysis.filter_data import (
+    hourly_partials,
+    hourly_stats_from_partials,
+    merge_partials,
+)
+from analysis.cube import (
+    build_cube,
+    export_cube_for_tableau,
+    load_cube,
+    merge_cubes,
+    pivot_table_from_cube,
+    save_cube,
+)
+from data_prep.account_index import build_account_index
+from data_prep.cache import file_digest
+from data_prep.clean import CLEANED_PATH, clean_chunk, cleaned_manifest_path
+from data_prep.dedup import SPILL_DIR, FingerprintSet, drop_duplicate_rows
+
+# where the state of the incremental pipeline is stored
+STATE_DIR = "./data/state"
+
+
+def run_incremental(
+    path: Path,
+    state_dir: Path = STATE_DIR,
+    output_path: Path = CLEANED_PATH,
+    connect: Callable = None,
+    index_dir: Path = None,
+) -> dict:
+    """Process only the rows appended to the raw PaySim file since the last run
+
+    The new rows are cleaned, validated and appended to the cleaned CSV file (and MySQL).
+    Their (hour, type) partial aggregates are merged into the stored ones, from which the
+    hourly statistics and the 100% fraudulent hours are derived, and their cells are merged
+    into the amount cube, from which the pivot table is rolled up, so the results equal a
+    full recompute over all rows.
+
+    Args:
+        path (Path): The path of the (append-only) CSV file containing the PaySim data
+        state_dir (Path, optional): Where the high-water mark, partial aggregates and row fingerprints are stored. Defaults to STATE_DIR.
+        output_path (Path, optional): The cleaned CSV file the new rows are appended to. Defaults to CLEANED_PATH.
+        connect (Callable, optional): Returns a new DB connection to append the new rows to (see bulk_load). Defaults to None.
+        index_dir (Path, optional): The account index the new rows are added to as a new segment (see data_prep.account_index). Defaults to None.
+
+    Returns:
+        dict: The number of new rows, high-water mark, hourly statistics, fraudulent hours and pivot table
+    """
+
+    # load the state of the previous run
+    state = _read_state(state_dir)
+    previous_offset = state["raw_offset"]
+    # read the rows that arrived since the previous run
+    new_rows, state["raw_offset"] = _read_new_rows(path, state)
+
+    # the artifacts of the previous run (the generation its state points to)
+    generation_dir = Path(state_dir) / (state.get("generation") or "")
+    # load the partial aggregates of every previous run
+    partials_path = generation_dir / "hourly_partials.feather"
+    partials = feather.read_feather(partials_path) if partials_path.exists() else None
+    # load the amount cube of every previous run
+    cube_path = generation_dir / "amount_cube.feather"
+    cube = load_cube(cube_path) if cube_path.exists() else None
+
+    # the fingerprints of the rows cleaned by every previous run
+    fingerprints_dir = generation_dir / "fingerprints"
+    seen = (
+        FingerprintSet.load(fingerprints_dir, spill_dir=SPILL_DIR)
+        if fingerprints_dir.exists()
+        else FingerprintSet(spill_dir=SPILL_DIR)
+    )
+
+    with seen:
+        # clean the new rows (dropping the rows cleaned by any run)
+        if new_rows.shape[0] > 0:
+            new_rows = drop_duplicate_rows(clean_chunk(new_rows, path), seen)
+
+        # validate and store the new rows
+        if new_rows.shape[0] > 0:
+            # pandera is only imported when there are new rows to validate
+            from data_prep.validate import validate_partitioned
+
+            new_rows = validate_partitioned(new_rows.reset_index(drop=True))
+
+            # assert that the cleaned CSV file is still the one the previous runs wrote
+            if state["rows"] > 0:
+                _check_cleaned_file(output_path, state, state_dir)
+            # the file no longer matches the manifest of a full clean_df
+            cleaned_manifest_path(output_path).unlink(missing_ok=True)
+            # drop rows appended by a run that crashed before committing its state
+            if state["rows"] > 0:
+                os.truncate(output_path, state["cleaned_offset"])
+            # append the new rows to the cleaned CSV file
+            new_rows.to_csv(
+                output_path,
+                mode="a" if state["rows"] > 0 else "w",
+                header=state["rows"] == 0,
+                index=False,
+                encoding="utf-8",
+            )
+            # append the new rows to MySQL
+            if connect is not None:
+                _append_to_db(output_path, connect)
+            # index the new rows by account (replaces the segments of a crashed run)
+            if index_dir is not None:
+                build_account_index(new_rows, index_dir, first_row=state["rows"])
+
+            # merge the partial aggregates of the new rows into the stored ones
+            new_partials = hourly_partials(
+                new_rows, new_rows["hour"].min(), new_rows["hour"].max()
+            )
+            partials = merge_partials(
+                pd.concat([partials, new_partials], ignore_index=True)
+            )
+            # merge the cells of the new rows into the cube
+            cube = merge_cubes([cube, build_cube(new_rows)])
+
+            # advance the high-water mark
+            state["high_water_mark"] = max(
+                state["high_water_mark"], int(new_rows["hour"].max())
+            )
+            state["rows"] += new_rows.shape[0]
+            state["cleaned_offset"] = os.path.getsize(output_path)
+            state["cleaned_digest"] = file_digest(output_path)
+
+        # nothing has been processed yet
+        if partials is None:
+            raise ValueError(f"No transactions found here -> {path}")
+
+        # derive the outputs from the merged partial aggregates
+        transactions_by_hour = hourly_stats_from_partials(partials)
+        fraudulent_hours = transactions_by_hour[
+            transactions_by_hour["percentage_of_fradulent_transactions"] == 100
+        ]["hour"].to_list()
+        pivot_table = pivot_table_from_cube(cube)
+
+        # write the outputs
+        transactions_by_hour.to_csv(
+            "./data/output/transactional_data_per_hour.csv", index=False
+        )
+        pivot_table.to_csv("./data/output/pivot_table.csv", index="type")
+        export_cube_for_tableau(cube)
+
+        # commit the partial aggregates, cube and state together
+        if new_rows.shape[0] > 0 or state["raw_offset"] != previous_offset:
+            _commit(state_dir, state, partials, cube, seen)
+
+    # print to log
+    print(
+        f"Processed {new_rows.shape[0]} new transactions "
+        f"(high-water mark: hour {state['high_water_mark']})"
+    )
+
+    return {
+        "new_rows": new_rows.shape[0],
+        "high_water_mark": state["high_water_mark"],
+        "transactions_by_hour": transactions_by_hour,
+        "fraudulent_hours": fraudulent_hours,
+        "pivot_table": pivot_table,
+        "cube": cube,
+    }
+
+
+def _check_cleaned_file(output_path: Path, state: dict, state_dir: Path) -> None:
+    """Assert that the cleaned CSV file starts with the rows the previous runs wrote
+
+    Another writer (ex. `main.py clean` or the partitions stage) may have replaced the
+    file since. Appending to it would then mix rows of other data with the new rows.
+
+    Args:
+        output_path (Path): The cleaned CSV file the new rows are appended to
+        state (dict): The state of the previous run
+        state_dir (Path): Where the state of the incremental pipeline is stored
+
+    Raises:
+        ValueError: If the file is missing, shorter, or its first bytes changed
+    """
+
+    if not (
+        Path(output_path).exists()
+        and os.path.getsize(output_path) >= state["cleaned_offset"]
+        and file_digest(output_path, size=state["cleaned_offset"])
+        == state.get("cleaned_digest")
+    ):
+        raise ValueError(
+            f"{output_path} was rewritten since the last incremental run "
+            f"(remove {state_dir} to process the raw file from the start)"
+        )
+
+
+def _read_new_rows(path: Path, state: dict) -> tuple:
+    """Read the raw rows appended after the byte offset reached by the previous run
+
+    If the file is shorter than that offset it has been replaced, in which case the rows
+    after the hour high-water mark are read instead.
+
+    Args:
+        path (Path): The path of the CSV file containing the PaySim data
+        state (dict): The state of the previous run
+
+    Returns:
+        tuple: The new raw rows and the byte offset to resume from on the next run
+    """
+
+    # size of the raw file
+    size = os.path.getsize(path)
+
+    # the file has been replaced -> fall back to the hour high-water mark
+    if size < state["raw_offset"]:
+        df = pd.read_csv(path, encoding="utf-8")
+        return df[df["step"] > state["high_water_mark"]], size
+
+    # read the bytes appended since the previous run
+    with open(path, "rb") as fd:
+        fd.seek(state["raw_offset"])
+        data = fd.read()
+    # only consume complete lines (the writer may be mid-line)
+    data = data[: data.rfind(b"\n") + 1]
+    offset = state["raw_offset"] + len(data)
+
+    # no new rows
+    if not data.strip() or (state["raw_offset"] == 0 and data.count(b"\n") <= 1):
+        return pd.DataFrame(), state["raw_offset"]
+
+    # the first run reads the header, later runs reuse it
+    if state["raw_offset"] == 0:
+        df = pd.read_csv(io.BytesIO(data), encoding="utf-8")
+        state["columns"] = df.columns.to_list()
+    else:
+        df = pd.read_csv(
+            io.BytesIO(data), encoding="utf-8", header=None, names=state["columns"]
+        )
+
+    return df, offset
+
+
+def _append_to_db(output_path: Path, connect: Callable) -> None:
+    """Append the new rows of the cleaned CSV file to the database
+
+    The checkpointed bulk loader skips the rows a previous load committed without reading
+    them, so only the appended rows are inserted (and an interrupted load resumes safely).
+
+    Args:
+        output_path (Path): The cleaned CSV file the new rows were appended to
+        connect (Callable): Returns a new DB connection (see bulk_load)
+    """
+
+    # the MySQL driver is only imported when appending to a database
+    from load_data.to_mysql_table import bulk_load
+
+    bulk_load(output_path, connect)
+
+
+def _commit(
+    state_dir: Path,
+    state: dict,
+    partials: pd.DataFrame,
+    cube: pd.DataFrame,
+    seen: FingerprintSet,
+) -> None:
+    """Store the artifacts of the current run and its state as one atomic step
+
+    The artifacts are written to a new generation directory, which the state names. The
+    state file is replaced atomically, so a crash at any point leaves the state of the
+    previous run pointing at its own artifacts, and the next run processes the same rows
+    again from there (instead of merging them twice).
+
+    Args:
+        state_dir (Path): Where the state of the incremental pipeline is stored
+        state (dict): The state of the current run (its generation is set here)
+        partials (pd.DataFrame): The merged partial aggregates
+        cube (pd.DataFrame): The merged amount cube
+        seen (FingerprintSet): The fingerprints of every row cleaned so far
+    """
+
+    # write the artifacts to a new generation directory
+    Path(state_dir).mkdir(parents=True, exist_ok=True)
+    generation_dir = Path(tempfile.mkdtemp(prefix="generation-", dir=state_dir))
+    feather.write_feather(partials, generation_dir / "hourly_partials.feather")
+    save_cube(cube, generation_dir / "amount_cube.feather")
+    seen.save(generation_dir / "fingerprints")
+
+    # publish the generation by replacing the state
+    state["generation"] = generation_dir.name
+    _write_state(state_dir, state)
+
+    # remove the previous generations (and those of crashed runs)
+    for directory in Path(state_dir).glob("generation-*"):
+        if directory != generation_dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _read_state(state_dir: Path) -> dict:
+    """Read the state of the previous run
+
+    Args:
+        state_dir (Path): Where the state of the incremental pipeline is stored
+
+    Returns:
+        dict: The high-water mark, byte offsets, digest of the cleaned CSV file, raw columns, number of rows processed and generation of the stored artifacts
+    """
+
+    # the state file
+    state_path = Path(state_dir) / "incremental.json"
+    # nothing has been processed yet
+    if not state_path.exists():
+        return {
+            "high_water_mark": 0,
+            "raw_offset": 0,
+            "cleaned_offset": 0,
+            "cleaned_digest": None,
+            "columns": None,
+            "rows": 0,
+            "generation": None,
+        }
+
+    with open(state_path, "r") as fd:
+        return json.load(fd)
+
+
+def _write_state(state_dir: Path, state: dict) -> None:
+    """Atomically write the state of the current run
+
+    Args:
+        state_dir (Path): Where the state of the incremental pipeline is stored
+        state (dict): The state to store
+    """
+
+    # write to a temporary file and move it into place
+    state_path = Path(state_dir) / "incremental.json"
+    with open(state_path.with_suffix(".tmp"), "w") as fd:
+        json.dump(state, fd)
+    os.replace(state_path.with_suffix(".tmp"), state_path)
@@ -0,0 +1,285 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Callable
+from pathlib import Path
+import hashlib
+import pickle
+import os
+
+from logger import count_rows, instrument
+
+# where the memoized stage outputs are stored
+STAGE_CACHE_DIR = "./data/cache/stages"
+
+
+class Stage:
+    """A named step of the pipeline that takes the outputs of its input stages as arguments."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        inputs: list = (),
+        key: Callable = None,
+        memoize: bool = True,
+        version: int = 1,
+        write: Callable = None,
+    ):
+        """Declare a stage
+
+        Args:
+            name (str): The unique name of the stage
+            func (Callable): Called with the outputs of the input stages (in order)
+            inputs (list, optional): The names of the stages whose outputs func takes. Defaults to ().
+            key (Callable, optional): Returns a string identifying the external data a stage without inputs reads (ex. a file hash). Defaults to None (never memoized).
+            memoize (bool, optional): Store the output on disk keyed by the inputs. Defaults to True.
+            version (int, optional): Bump when func changes so memoized outputs are invalidated. Defaults to 1.
+            write (Callable, optional): Writes the files func writes from its output, called when the output is loaded from the memo instead (stages whose files cannot be written from their output are not memoized). Defaults to None.
+        """
+
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.key = key
+        self.memoize = memoize
+        self.version = version
+        self.write = write
+
+
+class Pipeline:
+    """Runs a DAG of stages, concurrently where they are independent, memoizing their outputs on disk."""
+
+    def __init__(self, stages: list, cache_dir: Path = STAGE_CACHE_DIR):
+        """Declare the pipeline
+
+        Args:
+            stages (list): The stages of the pipeline
+            cache_dir (Path, optional): Where memoized outputs are stored. Defaults to STAGE_CACHE_DIR.
+        """
+
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = Path(cache_dir)
+        # the instrumentation record of every stage of the last run
+        self.records = []
+
+        # assert that every input is a declared stage
+        for stage in stages:
+            for name in stage.inputs:
+                assert name in self.stages, f"{stage.name} depends on unknown {name}"
+
+    def run(
+        self,
+        targets: list = None,
+        workers: int = None,
+        executor: str = "thread",
+        profile: list = (),
+        trace_memory: list = (),
+    ) -> dict:
+        """Run the target stages and whatever they depend on that is not memoized
+
+        Every stage is instrumented (see logger.instrument); the records are kept in self.records.
+
+        Args:
+            targets (list, optional): The stages to run. Defaults to None (every stage).
+            workers (int, optional): The number of stages run at once. Defaults to the number of CPUs (1 when tracing memory in threads).
+            executor (str, optional): "thread" or "process". Defaults to "thread".
+            profile (list, optional): The stages run under cProfile. Defaults to ().
+            trace_memory (list, optional): The stages whose allocations are traced with tracemalloc. Defaults to ().
+
+        Returns:
+            dict: The output of every stage that was run or loaded, by name
+        """
+
+        # assert that the executor is supported
+        assert executor in ("thread", "process")
+        # tracemalloc is process wide: stages in threads run one at a time while tracing, so
+        # the peak of a traced stage only holds its own allocations
+        if trace_memory and executor == "thread":
+            workers = 1
+
+        # default to every stage
+        targets = list(self.stages) if targets is None else targets
+        # the memoization key of every stage
+        keys = {}
+        for name in targets:
+            self._stage_key(name, keys)
+
+        # outputs that are available (loaded or computed)
+        outputs = {}
+        self.records = []
+        # stages that have to be computed
+        to_run = set()
+        for name in targets:
+            self._plan(name, keys, outputs, to_run)
+
+        # run the stages as soon as all of their inputs are available
+        pool = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool(max_workers=workers or os.cpu_count()) as workers_pool:
+            running = {}
+            while to_run or running:
+                # submit every stage whose inputs are available
+                for name in sorted(to_run):
+                    stage = self.stages[name]
+                    if all(input_name in outputs for input_name in stage.inputs):
+                        args = [outputs[input_name] for input_name in stage.inputs]
+                        future = workers_pool.submit(
+                            _run_stage,
+                            name,
+                            stage.func,
+                            args,
+                            name in profile,
+                            name in trace_memory,
+                        )
+                        running[future] = name
+                        to_run.discard(name)
+
+                # assert that the remaining stages can make progress
+                assert running, f"Stages {sorted(to_run)} can never run"
+
+                # collect the stages that finished
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    output, record, error = future.result()
+                    self.records.append(record)
+                    # re-raise the error of a failed stage (after recording it)
+                    if error is not None:
+                        raise error
+                    outputs[name] = output
+                    self._store(name, keys.get(name), outputs[name])
+
+        return outputs
+
+    def _stage_key(self, name: str, keys: dict) -> str:
+        """Compute (and record) the memoization key of a stage from the keys of its inputs
+
+        Args:
+            name (str): The name of the stage
+            keys (dict): The keys computed so far, by name
+
+        Returns:
+            str: The key of the stage (None when it cannot be memoized)
+        """
+
+        # already computed
+        if name in keys:
+            return keys[name]
+
+        stage = self.stages[name]
+        # the keys of the input stages
+        input_keys = [self._stage_key(input_name, keys) for input_name in stage.inputs]
+
+        # stages without inputs are identified by the data they read
+        if not stage.inputs:
+            parts = [stage.key()] if stage.key is not None else [None]
+        else:
+            parts = input_keys
+
+        # the key is unknown if any part is unknown
+        if any(part is None for part in parts):
+            keys[name] = None
+        else:
+            keys[name] = hashlib.sha256(
+                "|".join([name, str(stage.version), *parts]).encode()
+            ).hexdigest()
+
+        return keys[name]
+
+    def _plan(self, name: str, keys: dict, outputs: dict, to_run: set) -> None:
+        """Load the memoized output of a stage or mark it (and its missing inputs) to run
+
+        Args:
+            name (str): The name of the stage
+            keys (dict): The memoization keys, by name
+            outputs (dict): The outputs available so far, by name
+            to_run (set): The stages that have to be computed
+        """
+
+        # already planned
+        if name in outputs or name in to_run:
+            return
+
+        stage = self.stages[name]
+        # the memoized output of the stage
+        path = self._memo_path(name, keys[name])
+        if stage.memoize and path is not None and path.exists():
+            with instrument(name) as record, open(path, "rb") as fd:
+                outputs[name] = pickle.load(fd)
+                # the files of the stage may have been overwritten since it ran
+                if stage.write is not None:
+                    stage.write(outputs[name])
+                record["rows_out"] = count_rows(outputs[name])
+                record["status"] = "memoized"
+            self.records.append(record)
+            return
+
+        # compute the stage (and whatever it needs)
+        to_run.add(name)
+        for input_name in stage.inputs:
+            self._plan(input_name, keys, outputs, to_run)
+
+    def _store(self, name: str, key: str, output: object) -> None:
+        """Memoize the output of a stage
+
+        Args:
+            name (str): The name of the stage
+            key (str): The memoization key of the stage
+            output (object): The output of the stage
+        """
+
+        # the stage is not memoized
+        path = self._memo_path(name, key)
+        if not self.stages[name].memoize or path is None:
+            return
+
+        # write to a temporary file and move it into place
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(".tmp"), "wb") as fd:
+            pickle.dump(output, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path.with_suffix(".tmp"), path)
+
+    def _memo_path(self, name: str, key: str) -> Path:
+        """Path of the memoized output of a stage
+
+        Args:
+            name (str): The name of the stage
+            key (str): The memoization key of the stage
+
+        Returns:
+            Path: The memo file (None when the stage cannot be memoized)
+        """
+
+        return None if key is None else self.cache_dir / f"{name}-{key[:32]}.pkl"
+
+
+def _run_stage(
+    name: str, func: Callable, args: list, profile: bool, trace_memory: bool
+) -> tuple:
+    """Run a stage under instrumentation (in a worker thread or process)
+
+    Args:
+        name (str): The name of the stage
+        func (Callable): The function of the stage
+        args (list): The outputs of its input stages
+        profile (bool): Run the stage under cProfile
+        trace_memory (bool): Trace the allocations of the stage
+
+    Returns:
+        tuple: The output of the stage (None if it failed), its instrumentation record and its error (None if it succeeded)
+    """
+
+    record = {"stage": name}
+    try:
+        with instrument(
+            name, count_rows(*args), profile=profile, trace_memory=trace_memory
+        ) as record:
+            output = func(*args)
+            record["rows_out"] = count_rows(output)
+    except Exception as err:
+        return None, record, err
+
+    return output, record, None
@@ -0,0 +1,382 @@
+import pandas as pd
+
+from functools import partial
+
+from data_prep.account_index import INDEX_DIR
+from data_prep.cache import cache_key, load_cleaned_df
+from data_prep.clean import (
+    CLEANED_PATH,
+    clean_df,
+    dataframe_insights,
+    read_cleaned_manifest,
+)
+from data_prep.partition import (
+    PARTITION_DIR,
+    hour_range,
+    read_manifest,
+    write_partitions,
+)
+from analysis.backends import SqlBackend
+from analysis.cube import CUBE_PATH, build_cube, export_cube_for_tableau, save_cube
+from analysis.features import add_account_features
+from analysis.extract import Extractor, amount_at_least, amount_equals, hour_in
+from analysis.filter_data import create_pivot_table, transactional_data_per_hour
+from analysis.sketches import print_approximate_insights, sketch_transactions
+from analysis.partitioned import (
+    partitioned_approximate_insights,
+    partitioned_dataframe_insights,
+    partitioned_pivot_table,
+    partitioned_transactional_data_per_hour,
+    partitioned_transactions_over_amount,
+    partitioned_zero_amount_transactions,
+)
+from pipeline.runner import Pipeline, Stage
+
+# sklearn (analysis.fraud_detection, analysis.evaluation) and the MySQL driver
+# (load_data.to_mysql_table) are imported by the stages that use them, so running any
+# other stage never pays for them
+
+# the raw PaySim data
+INPUT_PATH = "./data/input/paysim_data.csv"
+# the number of rows cleaned and partitioned at a time in partitioned mode
+PARTITION_CHUNKSIZE = 1000000
+# the backends the hourly, pivot and over amount stages can run on (besides the path of a
+# SQLite database standing in for MySQL)
+BACKENDS = ["pandas", "mysql"]
+
+
+def cleaned() -> tuple:
+    """Clean and validate the data with compact dtypes and index it by account (cached by data_prep.cache)"""
+    return load_cleaned_df(INPUT_PATH, compact=True, index_dir=INDEX_DIR)
+
+
+def insights() -> None:
+    """Get some general info on the raw data"""
+    dataframe_insights(pd.read_csv(INPUT_PATH))
+
+
+def approximate_insights(cleaned: tuple) -> dict:
+    """Get approximate insights with error bounds from sketches streamed over the cleaned data"""
+    return print_approximate_insights(
+        sketch_transactions(CLEANED_PATH, chunksize=PARTITION_CHUNKSIZE)
+    )
+
+
+def load_mysql(cleaned: tuple, database: str = "mysql") -> dict:
+    """Insert the cleaned data into the MySQL table (or the SQLite database at `database`)"""
+    from load_data.to_mysql_table import bulk_load, load_csv_into_mysql, sqlite_connect
+
+    if database == "mysql":
+        return load_csv_into_mysql()
+    return bulk_load(CLEANED_PATH, partial(sqlite_connect, database))
+
+
+def database(load_mysql: dict, database: str) -> SqlBackend:
+    """Push the aggregations down to the database the cleaned data was loaded into"""
+    from load_data.to_mysql_table import mysql_connect, sqlite_connect
+
+    if database == "mysql":
+        return SqlBackend(partial(mysql_connect, "localhost", "paysim"))
+    return SqlBackend(partial(sqlite_connect, database))
+
+
+def database_pivot(database: SqlBackend) -> pd.DataFrame:
+    """Create the pivot table from the cube aggregated in the database"""
+    return database.pivot_table()
+
+
+def database_hourly(database: SqlBackend) -> pd.DataFrame:
+    """Get the transactional volume per hour from the partials aggregated in the database"""
+    return database.transactional_data_per_hour(1, 743)
+
+
+def database_over_amount(database: SqlBackend) -> int:
+    """Write the transactions of at least 200,000 selected in the database to CSV"""
+    return database.transactions_over_amount("amount", 200000.00)
+
+
+def cube(cleaned: tuple) -> pd.DataFrame:
+    """Materialize the type x hour x day x is_fraud amount cube and export it for Tableau"""
+    amount_cube = build_cube(cleaned[0])
+    save_cube(amount_cube, CUBE_PATH)
+    export_cube_for_tableau(amount_cube)
+    return amount_cube
+
+
+def pivot(cleaned: tuple, cube: pd.DataFrame) -> pd.DataFrame:
+    """Create the pivot table of the cleaned data (rolled up from the cube)"""
+    return create_pivot_table(cleaned[0], cube)
+
+
+def hourly(cleaned: tuple) -> pd.DataFrame:
+    """Get the transactional volume per hour"""
+    return transactional_data_per_hour(cleaned[0], 1, 743)
+
+
+def fraudulent_hours(hourly: pd.DataFrame) -> list:
+    """Hours that consist of 100% fraudulent transactions"""
+    return hourly[hourly["percentage_of_fradulent_transactions"] == 100][
+        "hour"
+    ].to_list()
+
+
+def consecutive_hours(fraudulent_hours: list) -> None:
+    """Get the number of instances and average length of consecutive fraudulent hours"""
+    from analysis.fraud_detection import consecutive_fraudulent_hours
+
+    consecutive_fraudulent_hours(fraudulent_hours)
+
+
+def extract(cleaned: tuple, fraudulent_hours: list, over_amount: bool = True) -> dict:
+    """Write the transactions of at least 200,000, of zero amount and in fraudulent hours in one scan"""
+    extractor = Extractor()
+    # the transactions of at least 200,000 are selected by the database stage instead
+    if over_amount:
+        extractor.register("transactions_over_200000.0", amount_at_least(200000.00))
+    return (
+        extractor.register("transactions_with_0_amount", amount_equals(0))
+        .register("transactions_in_fraudulent_hours", hour_in(fraudulent_hours))
+        .run(*cleaned)
+    )
+
+
+def features(cleaned: tuple) -> pd.DataFrame:
+    """Add the per-account velocity and balance error features to the cleaned data"""
+    return add_account_features(cleaned[0])
+
+
+def detect(features: pd.DataFrame) -> float:
+    """Get the precision score from the random forest"""
+    from analysis.fraud_detection import fraud_detection
+
+    avg_precision_score = fraud_detection(features)
+    print(
+        f"The average precision score of the current fraud detection system is: {avg_precision_score}%"
+    )
+    return avg_precision_score
+
+
+def evaluate(features: pd.DataFrame) -> pd.DataFrame:
+    """Cross-validate the fraud model on time-ordered folds over a small hyperparameter grid"""
+    from analysis.evaluation import cross_validate_fraud_model
+
+    return cross_validate_fraud_model(features)
+
+
+def model(features: pd.DataFrame) -> dict:
+    """Train the fraud model on all cleaned data and store it for scoring"""
+    from analysis.fraud_detection import save_fraud_model, train_fraud_model
+
+    fraud_model = train_fraud_model(features)
+    save_fraud_model(fraud_model)
+    return fraud_model
+
+
+def partitions() -> str:
+    """Clean the data in chunks and store it partitioned by hour range (skipped when up to date)"""
+    key = cache_key(INPUT_PATH)
+    manifest = read_manifest(PARTITION_DIR)
+    if manifest is None or manifest["key"] != key:
+        clean_df(INPUT_PATH, chunksize=PARTITION_CHUNKSIZE, key=key)
+        write_partitions(
+            CLEANED_PATH,
+            PARTITION_DIR,
+            chunksize=PARTITION_CHUNKSIZE,
+            key=key,
+            duplicates=read_cleaned_manifest(CLEANED_PATH)["duplicates"],
+        )
+    return PARTITION_DIR
+
+
+def partitioned_insights(partitions: str) -> None:
+    """Get some general info on the cleaned data, partition by partition"""
+    partitioned_dataframe_insights(partitions)
+
+
+def partitioned_approximate(partitions: str) -> dict:
+    """Get approximate insights with error bounds from sketches merged across the partitions"""
+    return partitioned_approximate_insights(partitions)
+
+
+def partitioned_over_amount(partitions: str) -> int:
+    """Write the transactions of at least 200,000 to CSV, partition by partition"""
+    return partitioned_transactions_over_amount("amount", 200000.00, partitions)
+
+
+def partitioned_zero_amount(partitions: str) -> int:
+    """Get the number of transactions where the amount == 0, partition by partition"""
+    return partitioned_zero_amount_transactions(partitions)
+
+
+def partitioned_pivot(partitions: str) -> pd.DataFrame:
+    """Create the pivot table from the partial aggregates of every partition"""
+    return partitioned_pivot_table(partitions)
+
+
+def partitioned_hourly(partitions: str) -> pd.DataFrame:
+    """Get the transactional volume per hour from the partial aggregates of every partition"""
+
+    # every hour of the partitioned data (any number of months)
+    start_hour, end_hour = hour_range(partitions)
+    return partitioned_transactional_data_per_hour(
+        start_hour, end_hour, partition_dir=partitions
+    )
+
+
+def write_hourly(hourly: pd.DataFrame) -> None:
+    """Write the transactional volume per hour of a memoized hourly stage"""
+    hourly.to_csv("./data/output/transactional_data_per_hour.csv", index=False)
+
+
+def write_pivot(pivot: pd.DataFrame) -> None:
+    """Write the pivot table of a memoized pivot stage"""
+    pivot.to_csv("./data/output/pivot_table.csv", index="type")
+
+
+def write_cube(cube: pd.DataFrame) -> None:
+    """Store and export the amount cube of a memoized cube stage"""
+    save_cube(cube, CUBE_PATH)
+    export_cube_for_tableau(cube)
+
+
+def write_evaluation(evaluation: pd.DataFrame) -> None:
+    """Write the per-fold results of a memoized evaluate stage"""
+    from analysis.evaluation import EVALUATION_PATH
+
+    evaluation.to_csv(EVALUATION_PATH, index=False)
+
+
+def write_model(model: dict) -> None:
+    """Store the fraud model of a memoized model stage"""
+    from analysis.fraud_detection import save_fraud_model
+
+    save_fraud_model(model)
+
+
+def build_pipeline(partitioned: bool = False, backend: str = "pandas") -> Pipeline:
+    """Declare the stages of the PaySim analysis and their inputs
+
+    Args:
+        partitioned (bool, optional): Run the analyses out of core as map/reduce over hour range partitions (the model stages need the full frame and are left out). Defaults to False.
+        backend (str, optional): Where the hourly, pivot and over amount stages aggregate: "pandas" (in memory), "mysql" or the path of a SQLite database (after load_mysql). Defaults to "pandas".
+
+    Raises:
+        ValueError: If the backend is unknown or combined with partitioned
+
+    Returns:
+        Pipeline: The PaySim analysis pipeline
+    """
+
+    # assert that the backend is known (and that partitioned mode aggregates itself)
+    if backend not in BACKENDS and not str(backend).endswith((".db", ".sqlite")):
+        raise ValueError(f"Unknown backend {backend!r}")
+    if partitioned and backend != "pandas":
+        raise ValueError("The partitioned pipeline aggregates the partitions itself")
+
+    # the analyses map over the partitions in process pools (never loading the full frame)
+    if partitioned:
+        return Pipeline(
+            [
+                # checks the raw file hash itself before cleaning and partitioning
+                Stage(
+                    "partitions",
+                    partitions,
+                    key=lambda: cache_key(INPUT_PATH),
+                    memoize=False,
+                ),
+                Stage("insights", partitioned_insights, ["partitions"], memoize=False),
+                Stage(
+                    "approximate_insights",
+                    partitioned_approximate,
+                    ["partitions"],
+                    memoize=False,
+                ),
+                Stage("load_mysql", load_mysql, ["partitions"], memoize=False),
+                Stage(
+                    "over_amount",
+                    partitioned_over_amount,
+                    ["partitions"],
+                    memoize=False,
+                ),
+                Stage(
+                    "zero_amount",
+                    partitioned_zero_amount,
+                    ["partitions"],
+                    memoize=False,
+                ),
+                Stage("pivot", partitioned_pivot, ["partitions"], write=write_pivot),
+                Stage("hourly", partitioned_hourly, ["partitions"], write=write_hourly),
+                Stage("fraudulent_hours", fraudulent_hours, ["hourly"]),
+                Stage(
+                    "consecutive_hours",
+                    consecutive_hours,
+                    ["fraudulent_hours"],
+                    memoize=False,
+                ),
+            ]
+        )
+
+    # the aggregations run in pandas, or in the database after the cleaned data is loaded
+    if backend == "pandas":
+        aggregations = [
+            Stage("load_mysql", load_mysql, ["cleaned"], memoize=False),
+            Stage("pivot", pivot, ["cleaned", "cube"], write=write_pivot),
+            Stage("hourly", hourly, ["cleaned"], write=write_hourly),
+            # every filtered output is written from one scan of the cleaned data
+            Stage("extract", extract, ["cleaned", "fraudulent_hours"], memoize=False),
+        ]
+    else:
+        aggregations = [
+            Stage(
+                "load_mysql",
+                partial(load_mysql, database=backend),
+                ["cleaned"],
+                memoize=False,
+            ),
+            # the connections are opened by the stages using the database
+            Stage(
+                "database",
+                partial(database, database=backend),
+                ["load_mysql"],
+                memoize=False,
+            ),
+            Stage("pivot", database_pivot, ["database"], write=write_pivot),
+            Stage("hourly", database_hourly, ["database"], write=write_hourly),
+            Stage("over_amount", database_over_amount, ["database"], memoize=False),
+            Stage(
+                "extract",
+                partial(extract, over_amount=False),
+                ["cleaned", "fraudulent_hours"],
+                memoize=False,
+            ),
+        ]
+
+    return Pipeline(
+        [
+            # already cached on the input hash by data_prep.cache
+            Stage("cleaned", cleaned, key=lambda: cache_key(INPUT_PATH), memoize=False),
+            # side effects only (printing, loading MySQL) -> always run
+            Stage("insights", insights, memoize=False),
+            Stage(
+                "approximate_insights",
+                approximate_insights,
+                ["cleaned"],
+                memoize=False,
+            ),
+            # analyses that only depend on the cleaned data run concurrently
+            Stage("cube", cube, ["cleaned"], write=write_cube),
+            *aggregations,
+            # computed in seconds -> recomputed rather than memoized
+            Stage("features", features, ["cleaned"], memoize=False),
+            Stage("detect", detect, ["features"]),
+            Stage("evaluate", evaluate, ["features"], write=write_evaluation),
+            Stage("model", model, ["features"], write=write_model),
+            Stage("fraudulent_hours", fraudulent_hours, ["hourly"]),
+            Stage(
+                "consecutive_hours",
+                consecutive_hours,
+                ["fraudulent_hours"],
+                memoize=False,
+            ),
+        ]
+    )
@@ -0,0 +1,36 @@
+import pytest
+
+from pathlib import Path
+
+from benchmarks.synthetic import generate_paysim
+
+# the number of synthetic transactions shared by the tests
+ROWS = 4000
+# the number of rows repeated at the end of the raw file (dropped by cleaning)
+DUPLICATE_ROWS = 25
+
+
+@pytest.fixture
+def workdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Run the test from an empty directory with the ./data layout the modules write to"""
+
+    (tmp_path / "data" / "input").mkdir(parents=True)
+    (tmp_path / "data" / "output").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def raw_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """A small raw PaySim file (with dirty money values and duplicate rows)"""
+
+    path = tmp_path_factory.mktemp("raw") / "paysim_data.csv"
+    generate_paysim(path, ROWS)
+
+    # repeat some rows at the end of the file
+    lines = path.read_bytes().splitlines(keepends=True)
+    with open(path, "ab") as fd:
+        fd.write(b"".join(lines[1 : DUPLICATE_ROWS + 1]))
+
+    return path
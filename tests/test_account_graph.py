@@ -0,0 +1,109 @@
+import pandas as pd
+
+from analysis.account_graph import AccountGraph
+
+
+def transactions(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        rows, columns=["initiator_id", "target_id", "hour", "amount", "type"]
+    )
+
+
+# A -> B twice, a cycle A -> B -> C -> A and a tail C -> D
+FLOWS = transactions(
+    [
+        ("A", "B", 1, 100.0, "TRANSFER"),
+        ("A", "B", 2, 50.0, "TRANSFER"),
+        ("A", "C", 3, 10.0, "PAYMENT"),
+        ("B", "C", 4, 30.0, "TRANSFER"),
+        ("C", "A", 5, 5.0, "TRANSFER"),
+        ("C", "D", 6, 7.0, "TRANSFER"),
+    ]
+)
+
+
+def test_fan_stats_count_distinct_counterparties():
+    fan_stats = AccountGraph(FLOWS).fan_stats().sort_index()
+
+    assert fan_stats.index.tolist() == ["A", "B", "C", "D"]
+    assert fan_stats["fan_in"].tolist() == [1, 1, 2, 1]
+    assert fan_stats["fan_out"].tolist() == [2, 1, 2, 0]
+    assert fan_stats["transactions_in"].tolist() == [1, 2, 2, 1]
+    assert fan_stats["transactions_out"].tolist() == [3, 1, 2, 0]
+    assert fan_stats["amount_in"].tolist() == [5.0, 150.0, 40.0, 7.0]
+    assert fan_stats["amount_out"].tolist() == [160.0, 30.0, 12.0, 0.0]
+
+
+def test_compact_frames_use_the_account_id_lookup():
+    account_ids = pd.Index(["A", "B", "C", "D"])
+    compact = FLOWS.assign(
+        initiator_id=account_ids.get_indexer(FLOWS["initiator_id"]),
+        target_id=account_ids.get_indexer(FLOWS["target_id"]),
+    )
+
+    pd.testing.assert_frame_equal(
+        AccountGraph(compact, account_ids).fan_stats(),
+        AccountGraph(FLOWS).fan_stats().sort_index(),
+    )
+
+
+def test_reachable_accounts_are_at_their_shortest_distance():
+    graph = AccountGraph(FLOWS)
+
+    # the cycle back to A neither revisits it nor stops the search
+    reachable = graph.reachable(["A"], hops=5)
+    assert list(reachable.itertuples(index=False, name=None)) == [
+        ("B", 1),
+        ("C", 1),
+        ("D", 2),
+    ]
+    assert graph.reachable(["B"], hops=1)["account_id"].tolist() == ["C"]
+    assert graph.reachable(["B"], hops=2)["account_id"].tolist() == ["C", "A", "D"]
+
+    # following the money back
+    reaching = graph.reachable(["D"], hops=3, direction="in")
+    assert list(reaching.itertuples(index=False, name=None)) == [
+        ("C", 1),
+        ("A", 2),
+        ("B", 2),
+    ]
+
+    # unknown and sink accounts reach nothing
+    assert graph.reachable(["Z"], hops=3).empty
+    assert graph.reachable(["D"], hops=3).empty
+
+
+def test_cash_outs_are_paired_within_the_window():
+    graph = AccountGraph(
+        transactions(
+            [
+                # X cashes out 3 hours after receiving
+                ("S", "X", 10, 500.0, "TRANSFER"),
+                ("X", "M", 13, 400.0, "CASH_OUT"),
+                # Y cashed out before receiving and again in the same hour
+                ("S", "Y", 20, 300.0, "TRANSFER"),
+                ("Y", "M", 19, 100.0, "CASH_OUT"),
+                ("Y", "M", 20, 250.0, "CASH_OUT"),
+                # Z only pays after receiving
+                ("S", "Z", 30, 50.0, "TRANSFER"),
+                ("Z", "M", 31, 50.0, "PAYMENT"),
+            ]
+        )
+    )
+
+    # the end of the window is inclusive
+    pairs = graph.receive_then_cash_out(within_hours=3)
+    assert list(pairs.itertuples(index=False, name=None)) == [
+        ("X", 10, 500.0, 13, 400.0),
+        ("Y", 20, 300.0, 20, 250.0),
+    ]
+
+    # one hour less excludes X
+    pairs = graph.receive_then_cash_out(within_hours=2)
+    assert pairs["account_id"].tolist() == ["Y"]
+
+    # other transaction types count when asked for
+    pairs = graph.receive_then_cash_out(
+        within_hours=1, cash_out_types=["CASH_OUT", "PAYMENT"]
+    )
+    assert pairs["account_id"].tolist() == ["Y", "Z"]
@@ -0,0 +1,106 @@
+from mysql.connector.conversion import MySQLConverter
+from mysql.connector.cursor import MySQLCursor
+import pandas as pd
+import pytest
+
+from functools import partial
+import shutil
+
+from analysis.backends import PandasBackend, SqlBackend
+from data_prep.clean import clean_df
+from load_data.to_mysql_table import bulk_load, sqlite_connect
+from pipeline.stages import build_pipeline
+
+
+class StatementSent(Exception):
+    """Raised by FakeMySQLConnection with the statement a MySQL cursor sends"""
+
+
+class FakeMySQLConnection:
+    """Just enough of a MySQL connection for a MySQL cursor to format its statement"""
+
+    python_charset = "utf8"
+    sql_mode = None
+    converter = MySQLConverter("utf8mb4")
+
+    def is_connected(self) -> bool:
+        return True
+
+    def handle_unread_result(self) -> None:
+        pass
+
+    def cmd_query(self, statement: bytes) -> None:
+        raise StatementSent(statement.decode())
+
+    def cursor(self) -> MySQLCursor:
+        return MySQLCursor(self)
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def backends(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    bulk_load("cleaned.csv", partial(sqlite_connect, "paysim.db"), batch_size=500)
+
+    return PandasBackend(df), SqlBackend(partial(sqlite_connect, "paysim.db"))
+
+
+@pytest.mark.parametrize("bucket_size", [1, 6])
+def test_sqlite_hourly_matches_pandas(backends, bucket_size):
+    pandas_backend, sql_backend = backends
+    pd.testing.assert_frame_equal(
+        sql_backend.transactional_data_per_hour(3, 700, bucket_size),
+        pandas_backend.transactional_data_per_hour(3, 700, bucket_size),
+        check_dtype=False,
+    )
+
+
+def test_sqlite_pivot_and_selections_match_pandas(backends, workdir):
+    pandas_backend, sql_backend = backends
+    pd.testing.assert_frame_equal(
+        sql_backend.pivot_table(), pandas_backend.pivot_table(), check_dtype=False
+    )
+    assert sql_backend.count("amount", "=", 0) == pandas_backend.count("amount", "=", 0)
+
+    # the same transactions over the amount, in hour order
+    output = workdir / "data" / "output" / "transactions_over_200000.0.csv"
+    rows = pandas_backend.transactions_over_amount("amount", 200000.0)
+    expected = pd.read_csv(output)
+    assert sql_backend.transactions_over_amount("amount", 200000.0) == rows
+    selected = pd.read_csv(output)
+    assert selected["hour"].is_monotonic_increasing
+    pd.testing.assert_frame_equal(
+        selected.sort_values(list(selected.columns)).reset_index(drop=True),
+        expected.sort_values(list(expected.columns)).reset_index(drop=True),
+    )
+
+
+def test_mysql_statement_keeps_the_bucket_expression():
+    sql_backend = SqlBackend(FakeMySQLConnection)
+    with pytest.raises(StatementSent) as sent:
+        sql_backend.hourly_partials(1, 743, 6)
+
+    statement = sent.value.args[0]
+    assert "hour - MOD(hour - 1, 6) AS bucket" in statement
+    assert "%" not in statement
+
+
+def test_pipeline_aggregates_in_the_database(workdir, raw_path):
+    shutil.copy(raw_path, "data/input/paysim_data.csv")
+    targets = ["hourly", "pivot"]
+
+    in_pandas = build_pipeline().run(targets, workers=1)
+    pipeline = build_pipeline(backend="paysim.db")
+    in_database = pipeline.run([*targets, "over_amount"], workers=1)
+
+    assert {record["stage"] for record in pipeline.records} >= {
+        "load_mysql",
+        "database",
+    }
+    for name in targets:
+        pd.testing.assert_frame_equal(
+            in_database[name], in_pandas[name], check_dtype=False
+        )
+    assert in_database["over_amount"] > 0
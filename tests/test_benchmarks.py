@@ -0,0 +1,77 @@
+import pandas as pd
+import numpy as np
+
+import json
+
+from benchmarks.run import compare_results, run_benchmarks
+from benchmarks.synthetic import HOURS, generate_paysim
+from data_prep.clean import clean_df
+
+# the columns of the raw PaySim extract
+RAW_COLUMNS = [
+    "step",
+    "type",
+    "amount",
+    "nameOrig",
+    "oldbalanceOrg",
+    "newbalanceOrig",
+    "nameDest",
+    "oldbalanceDest",
+    "newbalanceDest",
+    "isFraud",
+    "isFlaggedFraud",
+]
+
+
+def test_generated_data_is_deterministic(tmp_path):
+    generate_paysim(tmp_path / "first.csv", 3000, chunksize=1000)
+    generate_paysim(tmp_path / "second.csv", 3000, chunksize=1000)
+    generate_paysim(tmp_path / "other_seed.csv", 3000, seed=7, chunksize=1000)
+
+    first = (tmp_path / "first.csv").read_bytes()
+    assert first == (tmp_path / "second.csv").read_bytes()
+    assert first != (tmp_path / "other_seed.csv").read_bytes()
+
+
+def test_generated_data_has_the_raw_paysim_schema(workdir):
+    generate_paysim("raw.csv", 3000, chunksize=700)
+
+    raw = pd.read_csv("raw.csv", dtype=str)
+    assert raw.columns.tolist() == RAW_COLUMNS
+    assert raw.shape[0] == 3000
+
+    # the steps cover a month in file order
+    steps = raw["step"].astype(int)
+    assert steps.is_monotonic_increasing
+    assert steps.min() == 1 and steps.max() == HOURS
+    # fraud only happens in transfers and cash outs
+    assert set(raw.loc[raw["isFraud"] == "1", "type"]) <= {"TRANSFER", "CASH_OUT"}
+    # some money values are dirty, and all of them are cleaned
+    assert raw["amount"].str.contains(r"\$|USD").any()
+    cleaned = clean_df("raw.csv", output_path="cleaned.csv")
+    assert cleaned.shape[0] == 3000
+    np.testing.assert_allclose(
+        cleaned["amount"],
+        raw["amount"].str.replace(r"[$ USD]", "", regex=True).astype(float),
+    )
+
+
+def test_results_are_recorded_and_compared(tmp_path):
+    results = run_benchmarks([500], ["clean_df"], bench_dir=tmp_path)
+
+    assert [(record["rows"], record["stage"]) for record in results] == [
+        (500, "clean_df")
+    ]
+    assert results[0]["seconds"] > 0 and results[0]["peak_rss_mb"] > 0
+    assert (tmp_path / "cleaned_paysim_500.csv").exists()
+
+    # two commits of the same stage
+    with open(tmp_path / "results.jsonl", "w") as fd:
+        for commit, seconds, peak_rss_mb in [("aaa", 4.0, 100.0), ("bbb", 2.0, 50.0)]:
+            record = {"commit": commit, "rows": 500, "stage": "clean_df"}
+            record.update(seconds=seconds, peak_rss_mb=peak_rss_mb)
+            fd.write(json.dumps(record) + "\n")
+
+    comparison = compare_results("aaa", "bbb", bench_dir=tmp_path)
+    assert comparison.loc[(500, "clean_df"), "speedup"] == 2.0
+    assert comparison.loc[(500, "clean_df"), "memory_ratio"] == 0.5
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from data_prep.clean import clean_df
+from load_data import to_mysql_table
+from load_data.to_mysql_table import bulk_load, sqlite_connect
+
+
+def test_rerun_with_another_batch_size_skips_committed_rows(
+    workdir, raw_path, monkeypatch
+):
+    cleaned = clean_df(raw_path, output_path="cleaned.csv")
+    connect = lambda: sqlite_connect(workdir / "t.db")
+
+    # a load that fails after its first batches
+    load_batch = to_mysql_table._load_batch
+
+    def failing_load_batch(pool, chunk, first_row, *args):
+        if first_row >= 1000:
+            raise RuntimeError("connection lost")
+        return load_batch(pool, chunk, first_row, *args)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(to_mysql_table, "_load_batch", failing_load_batch)
+        with pytest.raises(RuntimeError):
+            bulk_load("cleaned.csv", connect, batch_size=250, workers=1)
+
+    # a rerun with another batch size only inserts the rows that are missing
+    stats = bulk_load("cleaned.csv", connect, batch_size=300, workers=2)
+    assert stats["skipped_rows"] == 1000
+    assert stats["rows"] == cleaned.shape[0] - 1000
+
+    conn = sqlite3.connect(workdir / "t.db")
+    ((rows,),) = conn.execute("SELECT COUNT(*) FROM transactions").fetchall()
+    assert rows == cleaned.shape[0]
+
+    # a third run inserts nothing
+    assert bulk_load("cleaned.csv", connect, batch_size=1000)["rows"] == 0
+
+
+def count_rows(path) -> int:
+    conn = sqlite3.connect(path)
+    ((rows,),) = conn.execute("SELECT COUNT(*) FROM transactions").fetchall()
+    conn.close()
+    return rows
+
+
+def test_appended_rows_are_inserted_once(workdir, raw_path):
+    cleaned = clean_df(raw_path, output_path="cleaned.csv")
+    connect = lambda: sqlite_connect(workdir / "t.db")
+    lines = open("cleaned.csv", "rb").readlines()
+
+    # load the first rows, then the rows appended to the same file
+    with open("growing.csv", "wb") as fd:
+        fd.writelines(lines[:2001])
+    bulk_load("growing.csv", connect, batch_size=300)
+    with open("growing.csv", "ab") as fd:
+        fd.writelines(lines[2001:])
+    stats = bulk_load("growing.csv", connect, batch_size=700)
+
+    assert stats["skipped_rows"] == 2000
+    assert stats["rows"] == cleaned.shape[0] - 2000
+    assert count_rows(workdir / "t.db") == cleaned.shape[0]
+
+    # nothing is appended -> nothing is read or inserted
+    assert bulk_load("growing.csv", connect)["rows"] == 0
+
+
+def test_other_data_replaces_the_table(workdir, raw_path):
+    cleaned = clean_df(raw_path, output_path="cleaned.csv")
+    connect = lambda: sqlite_connect(workdir / "t.db")
+    bulk_load("cleaned.csv", connect)
+
+    # the file is cleaned again from other data (the same rows in another order)
+    cleaned.iloc[::-1].to_csv("cleaned.csv", index=False)
+    stats = bulk_load("cleaned.csv", connect, batch_size=300)
+
+    assert stats["skipped_rows"] == 0
+    assert count_rows(workdir / "t.db") == cleaned.shape[0]
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from data_prep.account_index import AccountIndex, index_segments, read_index_key
+from data_prep import cache
+from data_prep.cache import cache_key, load_cleaned_df
+from data_prep.clean import clean_df, read_cleaned_manifest
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_cache_hit_rewrites_a_cleaned_csv_of_other_data(
+    workdir, raw_path, monkeypatch, compact
+):
+    df = load_cleaned_df(
+        raw_path, cache_dir="cache", output_path="cleaned.csv", compact=compact
+    )
+    cleaned = (workdir / "cleaned.csv").read_bytes()
+    manifest = read_cleaned_manifest("cleaned.csv")
+
+    # another input overwrites the cleaned CSV file
+    other_path = workdir / "other.csv"
+    other_path.write_bytes(b"".join(raw_path.read_bytes().splitlines(True)[:100]))
+    clean_df(other_path, output_path="cleaned.csv")
+
+    # the cache hit writes the cleaned CSV file from the cached frame (no clean_df)
+    def clean_df_again(*args, **kwargs):
+        raise AssertionError("the raw file was cleaned again on a cache hit")
+
+    monkeypatch.setattr(cache, "clean_df", clean_df_again)
+    cached = load_cleaned_df(
+        raw_path, cache_dir="cache", output_path="cleaned.csv", compact=compact
+    )
+    if compact:
+        pd.testing.assert_frame_equal(cached[0], df[0])
+    else:
+        pd.testing.assert_frame_equal(cached, df)
+    assert (workdir / "cleaned.csv").read_bytes() == cleaned
+    assert read_cleaned_manifest("cleaned.csv") == manifest
+    assert manifest["key"] == cache_key(raw_path)
+
+
+def test_cache_hit_rebuilds_an_index_of_other_data(workdir, raw_path):
+    df = load_cleaned_df(
+        raw_path, cache_dir="cache", output_path="cleaned.csv", index_dir="index"
+    )
+
+    # another input is indexed in chunks (one segment per chunk)
+    other_path = workdir / "other.csv"
+    other_path.write_bytes(b"".join(raw_path.read_bytes().splitlines(True)[:100]))
+    clean_df(
+        other_path, chunksize=10, output_path="other_cleaned.csv", index_dir="index"
+    )
+    assert len(index_segments("index")) == 10
+
+    # the cache hit rebuilds the index of the cached data as one segment
+    load_cleaned_df(
+        raw_path, cache_dir="cache", output_path="cleaned.csv", index_dir="index"
+    )
+    assert len(index_segments("index")) == 1
+    assert read_index_key("index") == cache_key(raw_path)
+    account = df["initiator_id"].iloc[-1]
+    assert AccountIndex("index").lookup(account, "initiator").shape[0] == (
+        (df["initiator_id"] == account).sum()
+    )
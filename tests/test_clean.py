@@ -0,0 +1,68 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+import io
+
+from data_prep.clean import (
+    clean_chunk,
+    clean_df,
+    parse_money_columns,
+    read_cleaned_manifest,
+)
+from tests.conftest import DUPLICATE_ROWS
+
+
+def test_signed_money_values_keep_their_sign():
+    df = pd.DataFrame({"amount": ["-5.0", "$12.50", "7", "USD -3.25"]})
+
+    parsed, fixed = parse_money_columns(df, ["amount"])
+
+    np.testing.assert_array_equal(parsed["amount"], [-5.0, 12.5, 7.0, -3.25])
+    # only the values with junk around the number were cleaned up
+    assert fixed == 2
+
+
+def test_malformed_values_keep_their_whole_number():
+    df = pd.DataFrame(
+        {"amount": ["1.5e3", "USD 1.5e3", "$2E-2", "$1,234.50", " 4 ", "-.5 USD"]}
+    )
+
+    parsed, fixed = parse_money_columns(df, ["amount"])
+
+    # the exponent is part of the number, with or without junk around it
+    np.testing.assert_array_equal(
+        parsed["amount"], [1500.0, 1500.0, 0.02, 1234.5, 4.0, -0.5]
+    )
+    assert fixed == 5
+
+
+def test_values_with_several_numbers_are_not_guessed():
+    df = pd.DataFrame({"amount": ["12-34", "1.2.3", "USD", "12.5"]})
+
+    parsed, _ = parse_money_columns(df, ["amount"])
+    np.testing.assert_array_equal(parsed["amount"], [np.nan, np.nan, np.nan, 12.5])
+
+    # cleaning fails and names the values
+    raw = pd.read_csv(
+        io.StringIO(
+            "step,type,amount,nameOrig,oldbalanceOrg,newbalanceOrig,nameDest,"
+            "oldbalanceDest,newbalanceDest,isFraud,isFlaggedFraud\n"
+            "1,PAYMENT,12-34,C1,100.0,0.0,M1,0.0,0.0,0,0\n"
+        )
+    )
+    with pytest.raises(ValueError, match="'12-34'"):
+        clean_chunk(raw, "raw.csv")
+
+
+@pytest.mark.parametrize("chunksize", [700, 4000, 100000])
+def test_chunked_cleaning_writes_the_whole_file_output(workdir, raw_path, chunksize):
+    whole = clean_df(raw_path, output_path="whole.csv", key="raw")
+
+    # the duplicates at the end of the file repeat rows of earlier chunks
+    assert clean_df(raw_path, chunksize, output_path="chunked.csv", key="raw") is None
+
+    assert open("chunked.csv", "rb").read() == open("whole.csv", "rb").read()
+    assert read_cleaned_manifest("chunked.csv") == read_cleaned_manifest("whole.csv")
+    assert read_cleaned_manifest("chunked.csv")["rows"] == whole.shape[0]
+    assert read_cleaned_manifest("chunked.csv")["duplicates"] == DUPLICATE_ROWS
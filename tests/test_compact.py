@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pandera as pa
+import pytest
+
+from data_prep.clean import clean_df
+from data_prep.compact import TRANSACTION_TYPES, compact_df, expand_account_ids
+from data_prep.validate import validate_compact_frame
+
+
+def test_compact_frames_expand_to_the_original(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    compact, account_ids = compact_df(df)
+
+    # the documented dtypes
+    assert compact["hour"].dtype == np.int16
+    assert compact["type"].dtype == pd.CategoricalDtype(TRANSACTION_TYPES)
+    assert compact["initiator_id"].dtype == np.int32
+    assert compact["target_id"].dtype == np.int32
+    assert compact["is_fraud"].dtype == np.int8
+    # one lookup table for initiators and targets
+    assert account_ids.is_unique
+    assert set(account_ids) == set(df["initiator_id"]) | set(df["target_id"])
+
+    # the account IDs and values are restored (in the default dtypes)
+    expanded = expand_account_ids(compact, account_ids)
+    pd.testing.assert_frame_equal(expanded.astype(df.dtypes), df)
+    # the compact frame itself is left as is
+    assert compact["initiator_id"].dtype == np.int32
+
+
+def test_unknown_types_fail_the_compact_schema(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    validate_compact_frame(compact_df(df)[0])
+
+    # a type outside the categories is not silently dropped
+    df.loc[df.index[3], "type"] = "REFUND"
+    compact, _ = compact_df(df)
+    with pytest.raises(pa.errors.SchemaErrors) as errors:
+        validate_compact_frame(compact)
+
+    failure_cases = errors.value.failure_cases
+    assert failure_cases["column"].unique().tolist() == ["type"]
+    assert failure_cases["index"].tolist() == [df.index[3]]
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from analysis.cube import build_cube, merge_cubes, rollup
+from analysis.filter_data import create_pivot_table
+from data_prep.clean import clean_df
+from data_prep.compact import compact_df
+
+
+def test_pivot_table_matches_pandas(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    expected = df.pivot_table(
+        index="type",
+        values=["amount", "is_fraud"],
+        aggfunc=["sum", "std"],
+        margins=True,
+    )
+    pivot_table = create_pivot_table(df)
+
+    pd.testing.assert_frame_equal(
+        pivot_table[expected.columns],
+        expected,
+        check_dtype=False,
+        check_names=False,
+        rtol=1e-9,
+    )
+
+
+def test_cubes_of_halves_merge_into_the_cube_of_the_whole(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    cube = build_cube(df)
+
+    # split the rows (not the cells) so cells are shared by the halves
+    half = len(df) // 2
+    merged = merge_cubes([build_cube(df.iloc[:half]), build_cube(df.iloc[half:])])
+    pd.testing.assert_frame_equal(merged, cube, check_exact=False)
+
+    # the cube of a compact frame is the same
+    compact, _ = compact_df(df)
+    pd.testing.assert_frame_equal(build_cube(compact), cube, check_exact=False)
+
+
+def test_rollup_of_a_slice_matches_pandas(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    frauds = rollup(build_cube(df), ["type"], where={"is_fraud": 1})
+    expected = (
+        df[df["is_fraud"] == 1]
+        .groupby("type")["amount"]
+        .agg(["size", "sum", "std"])
+        .reset_index()
+    )
+
+    assert frauds["type"].tolist() == expected["type"].tolist()
+    assert frauds["count"].tolist() == expected["size"].tolist()
+    pd.testing.assert_series_equal(
+        frauds["amount_sum"], expected["sum"], check_names=False
+    )
+    pd.testing.assert_series_equal(
+        frauds["amount_std"], expected["std"], check_names=False, rtol=1e-9
+    )
+    assert (frauds["fraud_rate"] == 1).all()
@@ -0,0 +1,77 @@
+import numpy as np
+
+from data_prep.dedup import FingerprintSet
+
+
+def test_saved_set_resumes_with_its_spilled_runs(tmp_path):
+    fingerprints = np.arange(1000, dtype=np.uint64) * 7919
+
+    # spill a few sorted runs and keep the rest in memory
+    with FingerprintSet(max_in_memory=300, spill_dir=tmp_path / "spill") as seen:
+        for batch in np.array_split(fingerprints, 7):
+            seen.add(batch)
+        assert seen.runs
+        seen.save(tmp_path / "saved")
+
+    # the resumed set knows every fingerprint (the spill directory is gone)
+    with FingerprintSet.load(tmp_path / "saved") as resumed:
+        assert len(resumed) == fingerprints.shape[0]
+        is_new = resumed.add(np.array([7919 * 5, 7919 * 5000, 3], dtype=np.uint64))
+        assert is_new.tolist() == [False, True, True]
+        assert resumed.duplicates == 1
+
+
+def test_batches_are_merged_into_a_sorted_set():
+    rng = np.random.default_rng(7)
+    batches = [rng.integers(0, 500, 120).astype(np.uint64) for _ in range(10)]
+
+    seen, first_seen = FingerprintSet(), set()
+    for batch in batches:
+        is_new = seen.add(batch)
+
+        # the first occurrence of every fingerprint is new, once
+        expected = np.zeros(batch.shape[0], dtype=bool)
+        for position, fingerprint in enumerate(batch.tolist()):
+            if fingerprint not in first_seen:
+                first_seen.add(fingerprint)
+                expected[position] = True
+        assert is_new.tolist() == expected.tolist()
+
+    np.testing.assert_array_equal(seen.memory, sorted(first_seen))
+    assert seen.duplicates == seen.rows - len(first_seen)
+
+
+def test_spilled_runs_are_compacted(tmp_path):
+    rng = np.random.default_rng(11)
+    fingerprints = rng.permutation(np.arange(2000, dtype=np.uint64) * 104729)
+
+    # a saved set with 4 runs on disk
+    with FingerprintSet(max_in_memory=100, spill_dir=tmp_path / "spill") as seen:
+        for batch in np.array_split(fingerprints[:400], 4):
+            seen.add(batch)
+        seen.save(tmp_path / "saved")
+
+    with FingerprintSet.load(
+        tmp_path / "saved", max_in_memory=100, spill_dir=tmp_path / "spill", max_runs=3
+    ) as resumed:
+        for batch in np.array_split(fingerprints[400:], 16):
+            resumed.add(batch)
+
+            # never more than max_runs runs to search
+            assert len(resumed.runs) <= 3
+            assert all(np.all(np.diff(run) > 0) for run in resumed.runs)
+
+        # 16 spills and the merges of the runs
+        assert resumed.spilled > 16
+        assert len(resumed) == fingerprints.shape[0]
+        assert not resumed.add(fingerprints).any()
+        assert resumed.add(np.array([1, 104729 * 7], dtype=np.uint64)).tolist() == [
+            True,
+            False,
+        ]
+        # the merged runs are removed from the spill directory
+        assert len(list(resumed.spill_dir.glob("*.npy"))) == len(resumed.runs)
+
+    # the runs of the saved set are left alone
+    with FingerprintSet.load(tmp_path / "saved") as saved:
+        assert len(saved) == 400
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.evaluation import (
+    cross_validate_fraud_model,
+    time_folds,
+    write_feature_matrix,
+)
+from analysis.fraud_detection import model_features
+from data_prep.clean import clean_df
+from data_prep.compact import TRANSACTION_TYPES, compact_df
+
+
+def test_folds_never_train_on_the_future():
+    hours = np.repeat(np.arange(1, 13), 5)
+
+    folds = time_folds(hours, n_folds=3)
+    assert [(f["train_start"], f["train_end"]) for f in folds] == [
+        (1, 3),
+        (1, 6),
+        (1, 9),
+    ]
+    assert [(f["test_start"], f["test_end"]) for f in folds] == [
+        (4, 6),
+        (7, 9),
+        (10, 12),
+    ]
+
+    # a rolling window of one block
+    rolling = time_folds(hours, n_folds=3, window=1)
+    assert [(f["train_start"], f["train_end"]) for f in rolling] == [
+        (1, 3),
+        (4, 6),
+        (7, 9),
+    ]
+
+    with pytest.raises(AssertionError):
+        time_folds(np.arange(1, 3), n_folds=3)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_feature_matrix_matches_the_model_features(workdir, raw_path, compact):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    data = compact_df(df)[0] if compact else df
+
+    arrays = write_feature_matrix(data, "features")
+
+    expected = model_features(df, TRANSACTION_TYPES)
+    assert arrays["columns"] == list(expected.columns)
+    np.testing.assert_array_equal(
+        np.load(arrays["features"]), expected.to_numpy(dtype=np.float32)
+    )
+    np.testing.assert_array_equal(np.load(arrays["labels"]), df["is_fraud"])
+    np.testing.assert_array_equal(np.load(arrays["hours"]), df["hour"])
+
+
+def test_every_fold_and_parameter_set_is_evaluated(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    results = cross_validate_fraud_model(
+        df,
+        param_grid={"n_estimators": [3], "max_depth": [None, 4]},
+        n_folds=3,
+        workers=2,
+        feature_dir="features",
+        output_path="folds.csv",
+    )
+
+    assert results.shape[0] == 6
+    assert results.groupby("params")["fold"].apply(list).tolist() == [[1, 2, 3]] * 2
+    assert (results["train_end"] < results["test_start"]).all()
+    # the rows of every fold are the rows of its hours
+    for fold in results.itertuples():
+        hours = df["hour"]
+        assert fold.test_rows == hours.between(fold.test_start, fold.test_end).sum()
+        assert fold.train_rows == hours.between(fold.train_start, fold.train_end).sum()
+    assert results["average_precision"].dropna().between(0, 100).all()
+
+    # the results are written and the shared arrays removed
+    pd.testing.assert_frame_equal(pd.read_csv("folds.csv"), results)
+    assert not any((workdir / "features").iterdir())
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.extract import (
+    Extractor,
+    amount_at_least,
+    amount_equals,
+    hour_in,
+    type_in,
+)
+from data_prep.clean import clean_df
+from data_prep.compact import compact_df
+
+
+@pytest.fixture
+def cleaned(workdir, raw_path):
+    clean_df(raw_path, output_path="cleaned.csv")
+    return pd.read_csv("cleaned.csv")
+
+
+def masks(df: pd.DataFrame) -> dict:
+    return {
+        "over_amount": df["amount"] >= 200000,
+        "zero_amount": df["amount"] == 0,
+        "first_hours": df["hour"].isin([1, 2, 3]),
+        "cash_outs": df["type"] == "CASH_OUT",
+        "nothing": df["amount"] >= np.inf,
+    }
+
+
+def register(extractor: Extractor) -> Extractor:
+    return (
+        extractor.register("over_amount", amount_at_least(200000))
+        .register("zero_amount", amount_equals(0))
+        .register("first_hours", hour_in([1, 2, 3]))
+        .register("cash_outs", type_in(["CASH_OUT"]))
+        .register("nothing", amount_at_least(np.inf))
+    )
+
+
+def read_subset(path, file_format: str) -> pd.DataFrame:
+    return pd.read_csv(path) if file_format == "csv" else pd.read_parquet(path)
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet"])
+@pytest.mark.parametrize("source", ["chunks", "file"])
+def test_subsets_match_separate_filters(cleaned, file_format, source):
+    extractor = register(Extractor("subsets", file_format=file_format, workers=2))
+    if source == "chunks":
+        data = (
+            cleaned.iloc[start : start + 700] for start in range(0, len(cleaned), 700)
+        )
+        rows = extractor.run(data)
+    else:
+        rows = extractor.run("cleaned.csv", chunksize=700)
+
+    for name, mask in masks(cleaned).items():
+        expected = cleaned[mask].reset_index(drop=True)
+        subset = read_subset(extractor.predicates[name][1], file_format)
+
+        assert rows[name] == expected.shape[0]
+        assert subset.columns.tolist() == cleaned.columns.tolist()
+        if expected.empty:
+            assert subset.empty
+        else:
+            pd.testing.assert_frame_equal(subset, expected)
+    assert 0 < rows["over_amount"] < len(cleaned)
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet"])
+def test_compact_subsets_are_written_with_account_ids(cleaned, raw_path, file_format):
+    compact, account_ids = compact_df(clean_df(raw_path, output_path="again.csv"))
+
+    extractor = register(Extractor("subsets", file_format=file_format))
+    extractor.run(compact, account_ids=account_ids)
+
+    expected = cleaned[masks(cleaned)["cash_outs"]].reset_index(drop=True)
+    subset = read_subset(extractor.predicates["cash_outs"][1], file_format)
+    assert subset["initiator_id"].tolist() == expected["initiator_id"].tolist()
+    assert subset["target_id"].tolist() == expected["target_id"].tolist()
+
+
+def test_empty_subsets_still_get_a_file(cleaned):
+    for file_format in ("csv", "parquet"):
+        extractor = Extractor("subsets", file_format=file_format).register(
+            "nothing", amount_at_least(np.inf)
+        )
+        # no chunk matches (ex. the first one is empty too)
+        assert extractor.run([cleaned.iloc[:0], cleaned]) == {"nothing": 0}
+
+        subset = read_subset(extractor.predicates["nothing"][1], file_format)
+        assert subset.empty
+        assert subset.columns.tolist() == cleaned.columns.tolist()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.filter_data import transactional_data_per_hour
+from data_prep.clean import clean_df
+from data_prep.compact import compact_df
+
+
+def hour_by_hour(df: pd.DataFrame, start_hour: int, end_hour: int, bucket_size: int):
+    """The hourly statistics computed one bucket at a time"""
+
+    rows = []
+    for hour in range(start_hour, end_hour + 1, bucket_size):
+        bucket = df[
+            (df["hour"] >= hour) & (df["hour"] < min(hour + bucket_size, end_hour + 1))
+        ]
+        if bucket.empty:
+            continue
+        # ties are broken alphabetically by type
+        most_frequent_type = bucket.groupby("type")["amount"].size().idxmax()
+        most_frequent = bucket[bucket["type"] == most_frequent_type]
+        rows.append(
+            {
+                "hour": hour,
+                "volume": round(bucket["amount"].sum(), 2),
+                "number_of_transactions": bucket.shape[0],
+                "percentage_of_fradulent_transactions": round(
+                    bucket["is_fraud"].sum() / bucket.shape[0] * 100, 2
+                ),
+                "most_frequent_type": most_frequent_type,
+                "most_frequent_type_volume": round(most_frequent["amount"].sum(), 2),
+                "number_of_most_frequent_type_transactions": most_frequent.shape[0],
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("bucket_size", [1, 6, 24])
+def test_buckets_match_an_hour_by_hour_loop(workdir, raw_path, bucket_size):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    hourly = transactional_data_per_hour(df, 3, 700, bucket_size)
+
+    expected = hour_by_hour(df, 3, 700, bucket_size)
+    pd.testing.assert_frame_equal(hourly, expected, check_dtype=False, rtol=1e-12)
+    # the same columns are written for the CSV consumers
+    written = pd.read_csv("data/output/transactional_data_per_hour.csv")
+    assert written.columns.tolist() == expected.columns.tolist()
+    assert written.shape[0] == expected.shape[0]
+
+
+def test_compact_frames_have_the_same_hourly_statistics(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    pd.testing.assert_frame_equal(
+        transactional_data_per_hour(compact_df(df)[0], 1, 743, 6),
+        transactional_data_per_hour(df, 1, 743, 6),
+        check_dtype=False,
+    )
+
+
+def test_hours_outside_the_range_are_not_counted(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    hourly = transactional_data_per_hour(df, 10, 20)
+    assert hourly["hour"].between(10, 20).all()
+    assert hourly["number_of_transactions"].sum() == np.count_nonzero(
+        df["hour"].between(10, 20)
+    )
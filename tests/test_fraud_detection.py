@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from analysis.fraud_detection import (
+    load_fraud_model,
+    save_fraud_model,
+    score_transactions,
+    train_fraud_model,
+)
+from data_prep.clean import clean_df
+from data_prep.compact import TRANSACTION_TYPES
+
+
+@pytest.fixture
+def cleaned(workdir, raw_path):
+    return clean_df(raw_path, output_path="cleaned.csv")
+
+
+@pytest.mark.parametrize("account_features", [True, False])
+def test_saved_models_score_like_the_trained_one(cleaned, account_features):
+    model = train_fraud_model(
+        cleaned, n_estimators=5, n_jobs=1, account_features=account_features
+    )
+    save_fraud_model(model, "models/fraud_model.joblib")
+
+    loaded = load_fraud_model("models/fraud_model.joblib", n_jobs=2)
+    assert loaded["categories"] == TRANSACTION_TYPES
+    assert loaded["columns"] == model["columns"]
+    assert loaded["classifier"].n_jobs == 2
+
+    probabilities = score_transactions(loaded, cleaned)
+    np.testing.assert_array_equal(probabilities, score_transactions(model, cleaned))
+    assert probabilities.shape == (cleaned.shape[0],)
+    assert ((probabilities >= 0) & (probabilities <= 1)).all()
+
+
+def test_chunks_score_like_the_whole_frame(cleaned):
+    model = train_fraud_model(cleaned, n_estimators=5, n_jobs=1)
+
+    # the chunks share the account history (and miss some types, ex. an empty chunk)
+    chunks = [cleaned.iloc[:0], cleaned.iloc[:1000], cleaned.iloc[1000:]]
+    scored = score_transactions(model, iter(chunks))
+    assert not isinstance(scored, np.ndarray)
+
+    np.testing.assert_array_equal(
+        np.concatenate(list(scored)), score_transactions(model, cleaned)
+    )
+
+
+def test_frames_with_fewer_types_are_encoded_like_the_training_data(cleaned):
+    model = train_fraud_model(cleaned, n_estimators=5, n_jobs=1, account_features=False)
+
+    # one-hot columns of the types missing from the frame are still passed to the model
+    payments = cleaned[cleaned["type"] == "PAYMENT"]
+    np.testing.assert_array_equal(
+        score_transactions(model, payments),
+        score_transactions(model, cleaned)[(cleaned["type"] == "PAYMENT").to_numpy()],
+    )
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.import_budget import BUDGETS, measure_import
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_is_within_budget(module):
+    run = measure_import(module, repeats=3)
+
+    # the heavy dependencies are only imported by the stages using them
+    assert run["heavy"] == []
+    assert run["seconds"] <= BUDGETS[module]
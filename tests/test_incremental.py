@@ -0,0 +1,139 @@
+import pandas as pd
+import pytest
+
+from functools import partial
+from pathlib import Path
+import sqlite3
+
+from analysis.filter_data import create_pivot_table, transactional_data_per_hour
+from data_prep.account_index import AccountIndex
+from data_prep.clean import clean_df
+from load_data import to_mysql_table
+from load_data.to_mysql_table import sqlite_connect
+import main
+from tests.conftest import ROWS
+from pipeline import incremental
+from pipeline.incremental import run_incremental
+
+
+def append_lines(raw_path: Path, path: Path, start: int, end: int = None) -> None:
+    """Append lines [start, end) of the raw file to path"""
+
+    lines = raw_path.read_bytes().splitlines(keepends=True)
+    with open(path, "ab") as fd:
+        fd.write(b"".join(lines[start:end]))
+
+
+def test_rerun_after_crash_is_a_no_op(workdir, raw_path, monkeypatch):
+    path = workdir / "data" / "input" / "paysim_data.csv"
+
+    # a first run over the first rows
+    append_lines(raw_path, path, 0, 2000)
+    run_incremental(path, state_dir="state", index_dir="index")
+
+    # a run over the appended rows crashes before its state is committed
+    append_lines(raw_path, path, 2000, ROWS + 1)
+
+    def crash(*args):
+        raise RuntimeError("crash")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(incremental, "_write_state", crash)
+        with pytest.raises(RuntimeError):
+            run_incremental(path, state_dir="state", index_dir="index")
+
+    # the next run processes the same rows again without counting them twice
+    result = run_incremental(path, state_dir="state", index_dir="index")
+    assert result["new_rows"] > 0
+    full = clean_df(path, output_path=workdir / "full.csv")
+    pd.testing.assert_frame_equal(
+        result["transactions_by_hour"], transactional_data_per_hour(full, 1, 743)
+    )
+    pd.testing.assert_frame_equal(result["pivot_table"], create_pivot_table(full))
+
+    # and a run without new rows changes nothing
+    again = run_incremental(path, state_dir="state", index_dir="index")
+    assert again["new_rows"] == 0
+    pd.testing.assert_frame_equal(
+        again["transactions_by_hour"], result["transactions_by_hour"]
+    )
+    assert len(list(Path("state").glob("generation-*"))) == 1
+
+    # the account index holds every row once
+    index = AccountIndex("index")
+    account = full["initiator_id"].iloc[-1]
+    assert (
+        index.lookup(account, "initiator").shape[0]
+        == (full["initiator_id"] == account).sum()
+    )
+
+
+def test_rows_repeating_an_earlier_run_are_dropped(workdir, raw_path):
+    path = workdir / "data" / "input" / "paysim_data.csv"
+
+    # the repeated rows at the end of the raw file arrive in later runs
+    append_lines(raw_path, path, 0, 2000)
+    run_incremental(path, state_dir="state")
+    append_lines(raw_path, path, 2000, ROWS + 1)
+    run_incremental(path, state_dir="state")
+    append_lines(raw_path, path, ROWS + 1)
+    result = run_incremental(path, state_dir="state")
+    assert result["new_rows"] == 0
+
+    # the same rows and results as a full clean_df
+    full = clean_df(raw_path, output_path=workdir / "full.csv")
+    pd.testing.assert_frame_equal(
+        pd.read_csv("data/output/cleaned_paysim_data.csv"), pd.read_csv("full.csv")
+    )
+    pd.testing.assert_frame_equal(
+        result["transactions_by_hour"], transactional_data_per_hour(full, 1, 743)
+    )
+
+
+def test_new_rows_are_appended_to_the_database(workdir, raw_path):
+    path = workdir / "data" / "input" / "paysim_data.csv"
+    connect = partial(sqlite_connect, workdir / "t.db")
+
+    append_lines(raw_path, path, 0, 2000)
+    run_incremental(path, state_dir="state", connect=connect)
+    append_lines(raw_path, path, 2000)
+    run_incremental(path, state_dir="state", connect=connect)
+
+    full = clean_df(raw_path, output_path=workdir / "full.csv")
+    conn = sqlite3.connect(workdir / "t.db")
+    ((rows,),) = conn.execute("SELECT COUNT(*) FROM transactions").fetchall()
+    assert rows == full.shape[0]
+
+
+def test_a_rewritten_cleaned_file_is_not_appended_to(workdir, raw_path):
+    path = workdir / "data" / "input" / "paysim_data.csv"
+    cleaned_path = workdir / "data" / "output" / "cleaned_paysim_data.csv"
+    append_lines(raw_path, path, 0, 2000)
+    run_incremental(path, state_dir="state")
+
+    # another writer replaces the cleaned file with other data before the next run
+    clean_df(raw_path, output_path=cleaned_path).iloc[::-1].to_csv(
+        cleaned_path, index=False
+    )
+    rewritten = cleaned_path.read_bytes()
+    append_lines(raw_path, path, 2000)
+    with pytest.raises(ValueError, match="rewritten"):
+        run_incremental(path, state_dir="state")
+    assert cleaned_path.read_bytes() == rewritten
+
+
+def test_cli_appends_to_mysql(workdir, raw_path, monkeypatch):
+    path = workdir / "data" / "input" / "paysim_data.csv"
+    append_lines(raw_path, path, 0)
+    monkeypatch.setattr(
+        to_mysql_table,
+        "setup_paysim_database",
+        lambda: partial(sqlite_connect, workdir / "t.db"),
+    )
+
+    assert main.main(["incremental", str(path), "--mysql"]) == 0
+
+    full = clean_df(raw_path, output_path=workdir / "full.csv")
+    conn = sqlite3.connect(workdir / "t.db")
+    ((rows,),) = conn.execute("SELECT COUNT(*) FROM transactions").fetchall()
+    assert rows == full.shape[0]
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from analysis.partitioned import partitioned_dataframe_insights
+from data_prep.clean import clean_df, read_cleaned_manifest
+from data_prep.partition import write_partitions
+from pipeline.stages import partitioned_hourly
+from tests.conftest import DUPLICATE_ROWS
+
+
+def test_insights_report_the_duplicates_dropped_while_cleaning(
+    workdir, raw_path, capsys
+):
+    clean_df(raw_path, chunksize=1000, output_path="cleaned.csv")
+    manifest = read_cleaned_manifest("cleaned.csv")
+    assert manifest["duplicates"] == DUPLICATE_ROWS
+    write_partitions("cleaned.csv", "partitions", duplicates=manifest["duplicates"])
+
+    partitioned_dataframe_insights("partitions", workers=2)
+    assert f"Number of duplicates:  {DUPLICATE_ROWS}\n" in capsys.readouterr().out
+
+
+def test_hourly_covers_every_partitioned_hour(workdir, raw_path):
+    clean_df(raw_path, output_path="cleaned.csv")
+
+    # a second month of data after the first
+    first_month = pd.read_csv("cleaned.csv")
+    second_month = first_month.assign(hour=first_month["hour"] + 743)
+    pd.concat([first_month, second_month]).to_csv("two_months.csv", index=False)
+    write_partitions("two_months.csv", "partitions")
+
+    hourly = partitioned_hourly("partitions")
+    assert hourly["hour"].min() == first_month["hour"].min()
+    assert hourly["hour"].max() == second_month["hour"].max()
+    assert hourly["number_of_transactions"].sum() == 2 * first_month.shape[0]
@@ -0,0 +1,59 @@
+import time
+from pathlib import Path
+
+from pipeline.runner import Pipeline, Stage
+
+
+def timed(seconds: float) -> tuple:
+    start = time.perf_counter()
+    time.sleep(seconds)
+    return start, time.perf_counter()
+
+
+def test_traced_stages_do_not_overlap_in_threads(workdir):
+    pipeline = Pipeline(
+        [
+            Stage(name, lambda: timed(0.2), memoize=False)
+            for name in ("first", "second", "third")
+        ]
+    )
+
+    # untraced stages run concurrently
+    outputs = pipeline.run(workers=3)
+    assert max(start for start, _ in outputs.values()) < min(
+        end for _, end in outputs.values()
+    )
+
+    # traced stages run one at a time (tracemalloc is process wide)
+    outputs = pipeline.run(workers=3, trace_memory=["first"])
+    intervals = sorted(outputs.values())
+    assert all(end <= start for (_, end), (start, _) in zip(intervals, intervals[1:]))
+    assert [
+        record["stage"] for record in pipeline.records if "traced_peak_mb" in record
+    ] == ["first"]
+
+
+def test_memoized_stages_rewrite_their_files(workdir):
+    calls = []
+
+    def total(numbers: list) -> int:
+        calls.append("total")
+        write_total(sum(numbers))
+        return sum(numbers)
+
+    def write_total(total: int) -> None:
+        Path("./data/output/total.txt").write_text(str(total))
+
+    pipeline = Pipeline(
+        [
+            Stage("numbers", lambda: [1, 2, 3], key=lambda: "numbers"),
+            Stage("total", total, ["numbers"], write=write_total),
+        ]
+    )
+    pipeline.run()
+
+    # a later run loads the memoized output and writes the file again
+    Path("./data/output/total.txt").write_text("overwritten")
+    assert pipeline.run()["total"] == 6
+    assert Path("./data/output/total.txt").read_text() == "6"
+    assert calls == ["total"]
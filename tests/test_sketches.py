@@ -0,0 +1,97 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from analysis.sketches import (
+    CountMinSketch,
+    HyperLogLog,
+    QuantileSketch,
+    TransactionSketches,
+    hash_values,
+    sketch_transactions,
+)
+from data_prep.clean import clean_df
+
+
+def account_ids(rng: np.random.Generator, accounts: int, size: int) -> np.ndarray:
+    return np.char.add("C", rng.integers(0, accounts, size).astype(str)).astype(object)
+
+
+@pytest.mark.parametrize("accounts, precision", [(100, 10), (20000, 14), (50000, 10)])
+def test_distinct_counts_are_within_the_error_bound(accounts, precision):
+    keys = account_ids(np.random.default_rng(accounts), accounts, 3 * accounts)
+
+    sketch = HyperLogLog(precision)
+    sketch.add(hash_values(keys))
+
+    # within 4 standard errors
+    exact = np.unique(keys).shape[0]
+    assert abs(sketch.estimate() - exact) <= 4 * sketch.standard_error * exact
+
+
+def test_quantiles_are_within_the_relative_accuracy():
+    rng = np.random.default_rng(3)
+    amounts = np.concatenate([rng.lognormal(11.2, 1.3, 20000), np.zeros(500)])
+
+    sketch = QuantileSketch(0.01)
+    sketch.add(amounts)
+
+    for q in [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]:
+        exact = np.quantile(amounts, q, method="lower")
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+    assert sketch.quantile(0) == 0.0
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_count_min_never_undercounts_and_finds_the_heavy_hitters():
+    rng = np.random.default_rng(5)
+    # three heavy accounts in a long tail
+    keys = np.concatenate(
+        [account_ids(rng, 5000, 20000), np.repeat(["H1", "H2", "H3"], [900, 600, 300])]
+    ).astype(object)
+    rng.shuffle(keys)
+
+    sketch = CountMinSketch(epsilon=0.001, delta=0.01, capacity=20)
+    for batch in np.array_split(keys, 7):
+        sketch.add(batch)
+
+    unique, counts = np.unique(keys.astype(str), return_counts=True)
+    estimates = sketch.estimate(hash_values(unique.astype(object)))
+    assert (estimates >= counts).all()
+    assert (estimates - counts <= sketch.error_bound).mean() >= 0.99
+
+    heavy_hitters = sketch.heavy_hitters(3)
+    assert heavy_hitters["key"].tolist() == ["H1", "H2", "H3"]
+    assert (heavy_hitters["min_count"] <= [900, 600, 300]).all()
+
+
+def test_sketches_of_partitions_merge_into_the_sketches_of_the_whole(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    # one pass over the chunks of the file, and two partitions merged
+    whole = sketch_transactions("cleaned.csv", chunksize=700)
+    merged = sketch_transactions(df.iloc[:1500]).merge(
+        sketch_transactions(df.iloc[1500:])
+    )
+
+    report, merged_report = whole.report(), merged.report()
+    for name in report:
+        pd.testing.assert_frame_equal(merged_report[name], report[name])
+
+    # the transactions per hour and type are exact, the distinct accounts near the truth
+    by_cell = report["distinct_by_hour_and_type"]
+    exact = df.groupby(["hour", "type"]).agg(
+        transactions=("amount", "size"), distinct_initiators=("initiator_id", "nunique")
+    )
+    assert by_cell["transactions"].tolist() == exact["transactions"].tolist()
+    assert (
+        (by_cell["distinct_initiators"] - exact["distinct_initiators"].to_numpy()).abs()
+        <= 4 * by_cell["relative_std_error"] * exact["distinct_initiators"].to_numpy()
+        + 1
+    ).all()
+
+    # the exact quantiles lie between the reported bounds
+    quantiles = report["amount_quantiles"]
+    exact = np.quantile(df["amount"], quantiles["quantile"], method="lower")
+    assert (quantiles["lower_bound"] <= exact).all()
+    assert (exact <= quantiles["upper_bound"]).all()
@@ -0,0 +1,23 @@
+import pandas as pd
+
+from analysis.streaks import account_streaks
+from data_prep.clean import clean_df
+from data_prep.compact import compact_df
+
+
+def test_compact_frames_return_the_original_account_ids(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    compact, account_ids = compact_df(df)
+
+    pd.testing.assert_frame_equal(
+        account_streaks(compact, "both", 1, account_ids=account_ids),
+        account_streaks(df, "both", 1),
+    )
+
+
+def test_empty_frames_have_no_streaks(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    streaks = account_streaks(df.iloc[:0])
+    assert streaks.empty
+    assert list(streaks.columns) == ["account_id", "start_hour", "end_hour", "length"]
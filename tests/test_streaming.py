@@ -0,0 +1,66 @@
+import pandas as pd
+import numpy as np
+
+import queue
+
+from analysis.features import (
+    ROLE_COLUMNS,
+    WINDOWS,
+    AccountHistory,
+    add_account_features,
+)
+from analysis.fraud_detection import score_transactions, train_fraud_model
+from analysis.streaming import replay_producer, stream_scores
+from data_prep.clean import clean_df
+
+
+def test_batches_with_a_history_match_the_full_features(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    history = AccountHistory()
+    batches = [
+        add_account_features(df.iloc[start : start + 300], history=history)
+        for start in range(0, df.shape[0], 300)
+    ]
+    pd.testing.assert_frame_equal(pd.concat(batches), add_account_features(df))
+
+
+def test_history_keeps_the_most_recently_active_accounts():
+    history = AccountHistory(windows=[1], max_accounts=2)
+    amounts = np.ones(3)
+
+    history.extend(
+        "initiator", pd.Series(["A", "B", "C"]), np.array([1, 2, 3]), amounts
+    )
+    assert history.transactions["initiator"]["account"].tolist() == ["A", "B", "C"]
+
+    # A was the least recently active of the accounts past the window
+    history.extend("initiator", pd.Series(["D"]), np.array([50]), amounts[:1])
+    assert history.transactions["initiator"]["account"].tolist() == ["B", "C", "D"]
+
+
+def test_history_is_bounded_over_a_stream(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    history = AccountHistory(max_accounts=50)
+    for start in range(0, df.shape[0], 300):
+        add_account_features(df.iloc[start : start + 300], history=history)
+
+        # the transactions of the widest window and at most 50 older ones
+        latest = df["hour"].iloc[: start + 300].max()
+        for role in ROLE_COLUMNS:
+            kept = history.transactions[role]
+            assert (kept["hour"] <= latest - max(WINDOWS)).sum() <= 50
+
+
+def test_streamed_scores_match_the_full_history(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    model = train_fraud_model(df, n_estimators=5, n_jobs=1)
+
+    # score the transactions in micro-batches
+    source, scored = queue.Queue(), []
+    replay_producer(df, source)
+    stream_scores(model, source, sink=scored.append, max_batch_size=200)
+
+    streamed = pd.concat(scored)["fraud_probability"].to_numpy()
+    np.testing.assert_allclose(streamed, score_transactions(model, df))
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from data_prep.clean import clean_df
+from data_prep.validate import PartitionedSchemaErrors, validate_partitioned
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"defect_rate": 0},
+        {"defect_rate": 1},
+        {"defect_rate": 1.5},
+        {"confidence": 0},
+        {"confidence": 1},
+    ],
+)
+def test_fast_check_rejects_probabilities_outside_0_1(options):
+    with pytest.raises(ValueError):
+        validate_partitioned(pd.DataFrame(), mode="fast", **options)
+
+
+def test_fast_check_validates_a_sample(workdir, raw_path):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+    assert validate_partitioned(df, mode="fast", partitions=2) is df
+
+
+@pytest.mark.parametrize("source", ["frame", "file"])
+def test_failures_point_at_the_rows_of_the_full_data(workdir, raw_path, source):
+    df = clean_df(raw_path, output_path="cleaned.csv")
+
+    # corrupt rows in the first, a middle and the last of 4 partitions
+    corrupted = [10, 1500, 1501, df.shape[0] - 1]
+    df.loc[corrupted, "amount"] = -1.0
+    df.to_csv("corrupted.csv", index=False)
+
+    data = df if source == "frame" else "corrupted.csv"
+    with pytest.raises(PartitionedSchemaErrors) as errors:
+        validate_partitioned(data, partitions=4)
+
+    failure_cases = errors.value.failure_cases
+    assert failure_cases["column"].unique().tolist() == ["amount"]
+    assert sorted(failure_cases["index"]) == corrupted